@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Compare the previous character-estimate chunker with the token chunker
+
+Chunks every section of a book with:
+
+- chars:  the previous chunker (1 token ≈ 4 characters, 300 "tokens" per chunk)
+- tokens: utils/token_chunker.py with the embedding model's tokenizer
+
+and reports, per chunker, the time taken, the number of chunks, their real
+token counts and the truncation rate: the share of chunks longer than the
+model's window (--max-seq-length minus special tokens), whose tail is cut
+off when embedded, and the number of tokens lost that way.
+
+Exits with status 1 if the token chunker produced any truncated chunk.
+
+Usage (from backend/):
+    python benchmarks/bench_chunking.py --book path/to/book.pdf
+    python benchmarks/bench_chunking.py --chunk-size 256 --overlap 32
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from utils.text_extractor import extract_sections, extract_text
+from utils.token_chunker import TokenCounter, iter_token_chunks
+
+
+def legacy_chunks(words, chunk_size: int = 300, overlap: int = 30):
+    """The previous chunker: 4 characters per token, overlap as a share of words"""
+    char_chunk_size, char_overlap = chunk_size * 4, overlap * 4
+    current, length = [], 0
+    for word in words:
+        current.append(word)
+        length += len(word) + 1
+        if length >= char_chunk_size:
+            yield ' '.join(current)
+            keep = int(len(current) * (char_overlap / char_chunk_size))
+            current = current[-keep:] if keep > 0 else []
+            length = sum(len(w) + 1 for w in current)
+    if current:
+        yield ' '.join(current)
+
+
+def load_sections(book: str):
+    if book:
+        file_type = os.path.splitext(book)[1].lstrip('.').lower()
+        text = extract_text(book, file_type)
+    else:
+        from fakes import synthetic_book
+        print("No --book given: using a synthetic book (plain prose rarely overflows the window)")
+        text = synthetic_book(sections=40, lines_per_section=200)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [section['content'] for section in extract_sections(text)]
+
+
+def report(name: str, chunks, seconds: float, counter: TokenCounter):
+    tokens = counter.count(chunks)
+    over = [t - counter.max_tokens for t in tokens if t > counter.max_tokens]
+    mean = sum(tokens) / len(tokens) if tokens else 0
+    print(f"{name:<8}{seconds:>9.3f}{len(chunks):>9}{mean:>9.1f}{max(tokens, default=0):>8}"
+          f"{len(over):>11} ({100 * len(over) / max(1, len(chunks)):5.1f}%){sum(over):>12}")
+    return len(over)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--book", help="PDF/DOCX/PPTX to chunk (default: synthetic text)")
+    parser.add_argument("--model", default="sentence-transformers/all-mpnet-base-v2", help="tokenizer to count with")
+    parser.add_argument("--max-seq-length", type=int, default=384, help="tokens the model embeds per chunk")
+    parser.add_argument("--chunk-size", type=int, default=300)
+    parser.add_argument("--overlap", type=int, default=30)
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    counter = TokenCounter(tokenizer, args.max_seq_length - tokenizer.num_special_tokens_to_add())
+    sections = load_sections(args.book)
+
+    print("=" * 78)
+    print(f"Chunking benchmark: {len(sections)} sections, {sum(map(len, sections)) / 1e6:.2f}M chars, "
+          f"window {counter.max_tokens} tokens")
+    print("=" * 78)
+    print(f"{'chunker':<8}{'seconds':>9}{'chunks':>9}{'mean tok':>9}{'max tok':>8}"
+          f"{'truncated':>20}{'tokens lost':>12}")
+
+    start = time.perf_counter()
+    chunks = [c for content in sections for c in legacy_chunks(content.split(), args.chunk_size, args.overlap)]
+    report("chars", chunks, time.perf_counter() - start, counter)
+
+    start = time.perf_counter()
+    chunks = [c['text'] for content in sections
+              for c in iter_token_chunks(content.split(), counter, args.chunk_size, args.overlap)]
+    truncated = report("tokens", chunks, time.perf_counter() - start, counter)
+
+    if truncated:
+        print(f"✗ {truncated} token chunks exceed the window")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Compare embedding backends: throughput, query latency and recall@k vs. fp32
+
+Embeds the chunks of a book with each backend (torch fp32, int8, onnx),
+then measures:
+
+- load: seconds to load the model (ONNX: includes the one-time export)
+- chunks/s: ingestion throughput (embed_documents over all chunks)
+- query p50/p95: embed_query latency in ms
+- recall@k: overlap of each backend's top-k chunks with the fp32 top-k for
+  the same queries (queries are phrases taken from the chunks themselves)
+
+Exits with status 1 when a backend's recall@k is below --min-recall, so it
+can run as a regression check before changing EMBED_BACKEND.
+
+Usage (from backend/):
+    python benchmarks/bench_embedding_backends.py --book path/to/book.pdf
+    python benchmarks/bench_embedding_backends.py --backends torch int8 --k 10 --min-recall 0.95
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_engine import BACKENDS, EmbeddingEngine
+from utils.text_extractor import chunk_text, extract_sections, extract_text
+
+
+def load_chunks(book: str, limit: int):
+    """Chunk texts of a book (or of a synthetic one when no book is given)"""
+    if book:
+        file_type = os.path.splitext(book)[1].lstrip('.').lower()
+        text = extract_text(book, file_type)
+    else:
+        from fakes import synthetic_book
+        print("No --book given: using a synthetic book (a weak signal for retrieval quality)")
+        text = synthetic_book(sections=20, lines_per_section=60)
+
+    chunks = []
+    for section in extract_sections(text):
+        chunks.extend(c['text'] for c in chunk_text(section['content']))
+    return chunks[:limit]
+
+
+def sample_queries(chunks, n: int, seed: int = 0):
+    """Short phrases cut from random chunks"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        words = rng.choice(chunks).split()
+        start = rng.randint(0, max(0, len(words) - 12))
+        queries.append(" ".join(words[start:start + 12]))
+    return queries
+
+
+def top_k(chunk_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    index = faiss.IndexFlatIP(chunk_vectors.shape[1])
+    index.add(chunk_vectors)
+    return index.search(query_vectors, k)[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--book", help="PDF/DOCX/PPTX to take chunks from (default: synthetic text)")
+    parser.add_argument("--model", default="sentence-transformers/all-mpnet-base-v2")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--chunks", type=int, default=1000, help="max chunks to embed")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--min-recall", type=float, default=0.9, help="fail below this recall@k")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, help="torch / ONNX Runtime threads")
+    parser.add_argument("--export-dir", default="./models/onnx", help="where ONNX exports are kept")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.book, args.chunks)
+    queries = sample_queries(chunks, args.queries)
+    k = min(args.k, len(chunks))
+    backends = ['torch'] + [b for b in args.backends if b != 'torch']  # fp32 is the reference
+
+    print("=" * 78)
+    print(f"Embedding backends: {args.model} ({len(chunks)} chunks, {len(queries)} queries, k={k})")
+    print("=" * 78)
+    print(f"{'backend':<10}{'load s':>8}{'chunks/s':>10}{'query p50':>11}{'query p95':>11}{f'recall@{k}':>11}")
+
+    reference = None
+    failed = []
+    for backend in backends:
+        start = time.perf_counter()
+        engine = EmbeddingEngine(args.model, batch_size=args.batch_size, num_threads=args.threads,
+                                 backend=backend, export_dir=args.export_dir)
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        chunk_vectors = np.asarray(engine.embed_documents(chunks), dtype='float32')
+        rate = len(chunks) / (time.perf_counter() - start)
+
+        latencies, query_vectors = [], []
+        for query in queries:
+            start = time.perf_counter()
+            query_vectors.append(engine.embed_query(query))
+            latencies.append((time.perf_counter() - start) * 1000)
+        query_vectors = np.asarray(query_vectors, dtype='float32')
+
+        neighbours = top_k(chunk_vectors, query_vectors, k)
+        if reference is None:
+            reference = neighbours
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(neighbours, reference)])
+        if recall < args.min_recall:
+            failed.append(backend)
+
+        print(f"{backend:<10}{load_seconds:>8.1f}{rate:>10.1f}{np.percentile(latencies, 50):>9.1f}ms"
+              f"{np.percentile(latencies, 95):>9.1f}ms{recall:>11.3f}")
+
+    if failed:
+        print(f"\nFAIL: recall@{k} below {args.min_recall} for {', '.join(failed)}")
+        sys.exit(1)
+    print(f"\nOK: every backend keeps recall@{k} >= {args.min_recall}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark embedding throughput across batch sizes, thread counts and batching order
+
+Encodes the same set of chunks (of varied length, like the tails of real
+sections) with every combination of --batch-sizes, --threads and
+length-sorted vs. arrival-order batching, and prints chunks/sec. Use it to
+pick EMBED_BATCH_SIZE and EMBED_THREADS for a host.
+
+Usage (from backend/):
+    python benchmarks/bench_embeddings.py
+    python benchmarks/bench_embeddings.py --chunks 2000 --batch-sizes 16 32 64 --threads 1 4 8
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_engine import EmbeddingEngine
+
+
+def synthetic_chunks(n: int, seed: int = 0):
+    """Chunk texts of 20-300 words, mostly near the 300-word chunk size"""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(2000)]
+    chunks = []
+    for _ in range(n):
+        words = 300 if rng.random() < 0.6 else rng.randint(20, 299)
+        chunks.append(" ".join(rng.choice(vocabulary) for _ in range(words)))
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-mpnet-base-v2", help="sentence-transformers model")
+    parser.add_argument("--chunks", type=int, default=512, help="number of chunks to embed per run")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--threads", type=int, nargs="+", help="torch thread counts (default: 1 and CPU count)")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    cpus = os.cpu_count() or 1
+    threads_list = args.threads or sorted({1, cpus})
+    chunks = synthetic_chunks(args.chunks)
+    model = SentenceTransformer(args.model, device='cpu')
+
+    # Warm up (first forward pass allocates)
+    EmbeddingEngine(args.model, batch_size=8, model=model).embed_documents(chunks[:8])
+
+    print("=" * 70)
+    print(f"Embedding throughput: {args.model} ({len(chunks)} chunks, {cpus} CPUs)")
+    print("=" * 70)
+    print(f"{'threads':<10}{'batch':<8}{'order':<10}{'seconds':>10}{'chunks/s':>12}")
+
+    best = None
+    for threads in threads_list:
+        for batch_size in args.batch_sizes:
+            for sort_by_length in (False, True):
+                engine = EmbeddingEngine(args.model, batch_size=batch_size, num_threads=threads,
+                                         sort_by_length=sort_by_length, model=model)
+                start = time.perf_counter()
+                engine.embed_documents(chunks)
+                elapsed = time.perf_counter() - start
+                rate = len(chunks) / elapsed
+                order = "sorted" if sort_by_length else "arrival"
+                print(f"{threads:<10}{batch_size:<8}{order:<10}{elapsed:>10.2f}{rate:>12.1f}")
+                if best is None or rate > best[0]:
+                    best = (rate, threads, batch_size, order)
+
+    rate, threads, batch_size, order = best
+    print(f"\nBest: {rate:.1f} chunks/s with EMBED_THREADS={threads} EMBED_BATCH_SIZE={batch_size} ({order})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark option="all": sequential generation vs. single-pass combined generation
+
+Sequential runs generate_summary, generate_concept_map, generate_tricks and
+generate_qna (four retrievals, four prompt prefills). Combined runs
+generate_all (one retrieval, one structured completion).
+
+Usage (from backend/):
+    python benchmarks/bench_generate_all.py                 # real models + persisted index
+    python benchmarks/bench_generate_all.py --simulate      # fake models, synthetic book
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.rag_service import RAGService
+from utils.text_extractor import extract_sections, chunk_text
+
+
+def build_simulated_service(args) -> RAGService:
+    """RAGService over a synthetic book with hash embeddings and a simulated LLM"""
+    from fakes import HashEmbeddings, SimulatedLLM, synthetic_book
+
+    service = RAGService(persist_dir=tempfile.mkdtemp(), embeddings=HashEmbeddings())
+    sections = extract_sections(synthetic_book(sections=max(args.sections, 2)))
+    chunks = []
+    for section in sections:
+        chunks.extend(chunk_text(section['content'], section_id=section['id'], section_title=section['title']))
+    service.create_vectorstore(chunks, "synthetic.pdf", sections)
+    service.llm = SimulatedLLM(
+        prefill_ms_per_token=args.prefill_ms,
+        decode_ms_per_token=args.decode_ms,
+        output_tokens=args.output_tokens,
+    )
+    return service
+
+
+def run_sequential(service: RAGService, section_id: str):
+    service.generate_summary(section_id)
+    service.generate_concept_map(section_id)
+    service.generate_tricks(section_id)
+    service.generate_qna(section_id)
+
+
+def run_combined(service: RAGService, section_id: str):
+    service.generate_all(section_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=3, help="number of sections to benchmark")
+    parser.add_argument("--persist-dir", default="./storage", help="index directory (real mode)")
+    parser.add_argument("--simulate", action="store_true", help="use fake models instead of GPT4All")
+    parser.add_argument("--prefill-ms", type=float, default=2.0, help="simulated ms per prompt token")
+    parser.add_argument("--decode-ms", type=float, default=20.0, help="simulated ms per generated token")
+    parser.add_argument("--output-tokens", type=int, default=120, help="simulated tokens per artifact")
+    args = parser.parse_args()
+
+    if args.simulate:
+        service = build_simulated_service(args)
+    else:
+        service = RAGService(persist_dir=args.persist_dir)
+        if not service.load_vectorstore():
+            print("No index found. Upload a textbook first or run with --simulate.")
+            sys.exit(1)
+
+    section_ids = [s['id'] for s in service.get_status()['sections'][:args.sections]]
+
+    print("=" * 70)
+    print(f"option='all' benchmark ({'simulated' if args.simulate else 'GPT4All'}, {len(section_ids)} sections)")
+    print("=" * 70)
+    print(f"{'section':<14}{'sequential (s)':>16}{'combined (s)':>16}{'reduction':>12}")
+
+    total_seq = total_comb = 0.0
+    for section_id in section_ids:
+        start = time.perf_counter()
+        run_sequential(service, section_id)
+        seq = time.perf_counter() - start
+
+        start = time.perf_counter()
+        run_combined(service, section_id)
+        comb = time.perf_counter() - start
+
+        total_seq += seq
+        total_comb += comb
+        print(f"{section_id:<14}{seq:>16.2f}{comb:>16.2f}{(1 - comb / seq) * 100:>11.1f}%")
+
+    if section_ids:
+        print("-" * 70)
+        print(f"{'total':<14}{total_seq:>16.2f}{total_comb:>16.2f}{(1 - total_comb / total_seq) * 100:>11.1f}%")
+
+
+if __name__ == "__main__":
+    main()
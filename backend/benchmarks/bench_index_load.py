@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark opening a textbook index: pickled LangChain format vs. mmap + SQLite
+
+Builds a synthetic textbook of each size with hash embeddings, saves it both
+with FAISS.save_local (pickled docstore) and in the library format
+(index.faiss + chunks.sqlite3), then opens each in a fresh subprocess and
+reports load time, RSS growth and the time of a first query.
+
+Usage (from backend/):
+    python benchmarks/bench_index_load.py
+    python benchmarks/bench_index_load.py --chunks 10000 100000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+
+def build(directory: str, chunks: int, dim: int):
+    """Save the same synthetic index in both formats"""
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    from fakes import HashEmbeddings
+    from services.chunk_store import write_chunk_store
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(chunks, dim)).astype('float32')
+    faiss.normalize_L2(vectors)
+    text_embeddings = [
+        (f"Chunk {i} " + "word " * 290, vectors[i].tolist()) for i in range(chunks)
+    ]
+    metadatas = [{'section_id': f"section_{i // 200}", 'chunk_id': i} for i in range(chunks)]
+    vectorstore = FAISS.from_embeddings(text_embeddings, HashEmbeddings(dim), metadatas=metadatas)
+
+    vectorstore.save_local(os.path.join(directory, "faiss_index"))
+    faiss.write_index(vectorstore.index, os.path.join(directory, "index.faiss"))
+    write_chunk_store(os.path.join(directory, "chunks.sqlite3"), vectorstore)
+
+
+def open_once(directory: str, fmt: str, dim: int) -> dict:
+    """Open one format in this process and run a query"""
+    from langchain_community.vectorstores import FAISS
+    from fakes import HashEmbeddings
+    from services import index_factory
+    from services.chunk_store import ChunkStore, PositionIds
+
+    embeddings = HashEmbeddings(dim)
+    before = rss_mb()
+    start = time.perf_counter()
+    if fmt == "pickle":
+        vectorstore = FAISS.load_local(os.path.join(directory, "faiss_index"), embeddings)
+    else:
+        index = index_factory.read_index(os.path.join(directory, "index.faiss"), 'flat')
+        vectorstore = FAISS(embeddings, index, ChunkStore(os.path.join(directory, "chunks.sqlite3")),
+                            PositionIds(index.ntotal))
+    load_seconds = time.perf_counter() - start
+    loaded_mb = rss_mb() - before
+
+    start = time.perf_counter()
+    vectorstore.similarity_search_by_vector(embeddings.embed_query("query"), k=3)
+    return {'load_s': load_seconds, 'rss_mb': loaded_mb, 'query_ms': (time.perf_counter() - start) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--open", nargs=2, metavar=("DIR", "FORMAT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.open:
+        print(json.dumps(open_once(args.open[0], args.open[1], args.dim)))
+        return
+
+    print("=" * 70)
+    print("Index load: pickled LangChain format vs. mmap + SQLite chunk store")
+    print("=" * 70)
+    print(f"{'chunks':<10}{'format':<10}{'load s':>10}{'RSS MB':>10}{'1st query ms':>15}")
+    for chunks in args.chunks:
+        with tempfile.TemporaryDirectory() as directory:
+            build(directory, chunks, args.dim)
+            for fmt in ("pickle", "mmap"):
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--dim", str(args.dim), "--open", directory, fmt],
+                    cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+                ).stdout
+                r = json.loads(out.strip().splitlines()[-1])
+                print(f"{chunks:<10}{fmt:<10}{r['load_s']:>10.3f}{r['rss_mb']:>10.1f}{r['query_ms']:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
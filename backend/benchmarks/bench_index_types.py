@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark FAISS index types against the exact flat index
+
+Builds every index type from services/index_factory on the same vectors
+(the chunk vectors in the embedding store, or synthetic clustered ones) and
+reports build time, approximate memory, query latency and recall@k against
+flat, sweeping nprobe (IVF) and efSearch (HNSW). Queries are held-out
+vectors with a little noise, so they look like questions near real chunks.
+
+Usage (from backend/):
+    python benchmarks/bench_index_types.py                       # storage/embeddings.sqlite3
+    python benchmarks/bench_index_types.py --synthetic 200000    # clustered random 768-d vectors
+"""
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import index_factory
+from services.embedding_store import EmbeddingStore
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(max(10, args.synthetic // 500), args.dim)).astype('float32')
+        vectors = centers[rng.integers(0, len(centers), args.synthetic)]
+        vectors += 0.3 * rng.normal(size=vectors.shape).astype('float32')
+    else:
+        store = EmbeddingStore(args.db, model_name=args.model)
+        vectors = store.vectors(limit=args.limit)
+        store.close()
+        if len(vectors) == 0:
+            sys.exit(f"No vectors for {args.model} in {args.db} (upload a book first or use --synthetic)")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    """Search one query at a time (as /ask does); returns (ids, per-query ms)"""
+    ids, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, found = index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(found[0])
+    return np.array(ids), np.array(latencies)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="./storage/embeddings.sqlite3", help="embedding store to read vectors from")
+    parser.add_argument("--model", default="sentence-transformers/all-mpnet-base-v2", help="embedding store model key")
+    parser.add_argument("--limit", type=int, help="max vectors to read from the store")
+    parser.add_argument("--synthetic", type=int, help="use this many synthetic vectors instead")
+    parser.add_argument("--dim", type=int, default=768, help="synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--types", nargs="+", default=['flat', 'hnsw', 'ivf', 'ivfpq'],
+                        choices=[t for t in index_factory.INDEX_TYPES if t != 'auto'])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    rng = np.random.default_rng(1)
+    n_queries = min(args.queries, max(1, len(vectors) // 10))
+    held_out = rng.choice(len(vectors), n_queries, replace=False)
+    queries = vectors[held_out] + 0.05 * rng.normal(size=(n_queries, vectors.shape[1])).astype('float32')
+    faiss.normalize_L2(queries)
+    base = np.delete(vectors, held_out, axis=0)
+    k = min(args.k, len(base))
+
+    exact = index_factory.build_index(base, 'flat')
+    truth, _ = timed_search(exact, queries, k)
+
+    print("=" * 82)
+    print(f"FAISS index types: {len(base)} vectors x {base.shape[1]}d, {n_queries} queries, k={k} "
+          f"(auto would pick {index_factory.choose_index_type(len(base))})")
+    print("=" * 82)
+    print(f"{'type':<8}{'param':<14}{'build s':>9}{'memory MB':>11}{'p50 ms':>9}{'p95 ms':>9}{f'recall@{k}':>11}")
+
+    for kind in args.types:
+        start = time.perf_counter()
+        index = index_factory.build_index(base, kind)
+        build_seconds = time.perf_counter() - start
+        memory_mb = index_factory.memory_bytes(index) / 1e6
+
+        if kind in ('ivf', 'ivfpq'):
+            sweep = [(f"nprobe={p}", {'nprobe': p}) for p in args.nprobe]
+        elif kind == 'hnsw':
+            sweep = [(f"efSearch={e}", {'ef_search': e}) for e in args.ef_search]
+        else:
+            sweep = [("-", {})]
+
+        for label, params in sweep:
+            index_factory.set_search_params(index, **params)
+            found, latencies = timed_search(index, queries, k)
+            print(f"{kind:<8}{label:<14}{build_seconds:>9.2f}{memory_mb:>11.1f}"
+                  f"{np.percentile(latencies, 50):>9.3f}{np.percentile(latencies, 95):>9.3f}"
+                  f"{recall_at_k(found, truth):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
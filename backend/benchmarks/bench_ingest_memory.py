@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark ingestion peak memory: whole-document pipeline vs. streaming
+
+The legacy path joins every page into one string, runs extract_sections and
+chunk_text over it and hands the full chunk list to create_vectorstore. The
+streaming path feeds pages through DocumentStream so only a spool file and a
+batch of chunks are in flight. Each run happens in a fresh subprocess (hash
+embeddings, synthetic book) so peak RSS is measured independently.
+
+The FAISS index and docstore are still built in memory and grow linearly
+with the book in both paths; the difference is everything around them.
+
+Usage (from backend/):
+    python benchmarks/bench_ingest_memory.py
+    python benchmarks/bench_ingest_memory.py --pages 500 2000 5000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_once(mode: str, pages: int) -> dict:
+    """Ingest a synthetic book in this process and report time, chunks and peak RSS"""
+    from fakes import HashEmbeddings, synthetic_pages
+    from services.rag_service import RAGService
+
+    service = RAGService(persist_dir=tempfile.mkdtemp(), embeddings=HashEmbeddings())
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+
+    if mode == "legacy":
+        from utils.text_extractor import extract_sections, chunk_text
+
+        text = "".join(synthetic_pages(pages))
+        sections = extract_sections(text)
+        chunks = []
+        for section in sections:
+            chunks.extend(chunk_text(section['content'], section_id=section['id'], section_title=section['title']))
+        indexed = service.create_vectorstore(chunks, "synthetic.pdf", sections)
+    else:
+        from utils.document_stream import DocumentStream
+
+        with DocumentStream(synthetic_pages(pages)) as stream:
+            stream.scan()
+            stream.plan_sections()
+            indexed = service.create_vectorstore(
+                stream.iter_chunks(), "synthetic.pdf", stream.sections,
+                expected_chunks=stream.estimated_chunks()
+            )
+
+    return {
+        'mode': mode,
+        'pages': pages,
+        'seconds': round(time.perf_counter() - start, 2),
+        'chunks': indexed['total_chunks'],
+        'baseline_mb': round(baseline_mb, 1),
+        'peak_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 1000, 2000], help="book sizes to try")
+    parser.add_argument("--run", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Child process: one measurement, printed as JSON on the last line
+        print(json.dumps(run_once(args.run, args.pages[0])))
+        return
+
+    print("=" * 70)
+    print("Ingestion peak memory: legacy vs. streaming")
+    print("=" * 70)
+    print(f"{'pages':<8}{'mode':<12}{'chunks':>8}{'seconds':>10}{'peak MB':>10}{'over base':>11}")
+
+    for pages in args.pages:
+        for mode in ("legacy", "streaming"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", mode, "--pages", str(pages)],
+                cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"{pages:<8}{mode:<12}{result['chunks']:>8}{result['seconds']:>10.2f}"
+                  f"{result['peak_mb']:>10.1f}{result['peak_mb'] - result['baseline_mb']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Benchmark PDF text extraction: serial vs. page shards across a process pool
+
+Extracts the same PDF with 1, 2, 4, ... worker processes (up to the CPU
+count), checks every run produces exactly the serial output and prints the
+speedup.
+
+Usage (from backend/):
+    python benchmarks/bench_pdf_extract.py path/to/book.pdf
+    python benchmarks/bench_pdf_extract.py path/to/book.pdf --workers 1 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.text_extractor import extract_from_pdf, _pdf_page_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", help="PDF file to extract")
+    parser.add_argument("--workers", type=int, nargs="+", help="worker counts to try (default: 1, 2, 4, ... CPU count)")
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    workers_list = args.workers or sorted({1, cpus, *[2 ** i for i in range(1, 8) if 2 ** i < cpus]})
+
+    print("=" * 70)
+    print(f"PDF extraction benchmark: {os.path.basename(args.pdf)} "
+          f"({_pdf_page_count(args.pdf)} pages, {cpus} CPUs)")
+    print("=" * 70)
+    print(f"{'workers':<10}{'seconds':>12}{'speedup':>12}{'identical':>12}")
+
+    baseline_text = baseline_time = None
+    for workers in workers_list:
+        start = time.perf_counter()
+        text = extract_from_pdf(args.pdf, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        if baseline_text is None:
+            baseline_text, baseline_time = text, elapsed
+        print(f"{workers:<10}{elapsed:>12.2f}{baseline_time / elapsed:>11.2f}x{str(text == baseline_text):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark section detection and check it against the golden corpus
+
+First every document of the corpus (section_corpus.py) is digested and
+compared with golden/sections.json, recorded from the original per-line
+dict / regex-loop implementation; any difference exits with status 1.
+Then the corpus is timed through:
+
+- classify:  line_features + classify_heading for every line
+- extract:   extract_sections (whole-document path)
+- scan:      DocumentStream.scan (streaming ingestion path)
+
+Usage (from backend/):
+    python benchmarks/bench_sections.py
+    python benchmarks/bench_sections.py --repeat 5
+    python benchmarks/bench_sections.py --write-golden   # only when detection is meant to change
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from section_corpus import document_digest, first_mismatch, golden_documents, load_golden, write_golden
+from utils.document_stream import DocumentStream
+from utils.heading_classifier import classify_heading, line_features
+from utils.text_extractor import extract_sections
+
+GOLDEN_PATH = os.path.join(BENCHMARKS_DIR, "golden", "sections.json")
+
+
+def quiet_extract_sections(text: str):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return extract_sections(text)
+
+
+def classify_all(documents):
+    for text in documents:
+        for line in text.split('\n'):
+            features = line_features(line.strip())
+            if features is not None:
+                classify_heading(features)
+
+
+def extract_all(documents):
+    for text in documents:
+        quiet_extract_sections(text)
+
+
+def scan_all(documents):
+    with contextlib.redirect_stdout(io.StringIO()):
+        for text in documents:
+            with DocumentStream([text]) as stream:
+                stream.scan()
+
+
+def best_of(fn, documents, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(documents)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is reported)")
+    parser.add_argument("--write-golden", action="store_true", help="record the current output as the golden digests")
+    args = parser.parse_args()
+
+    documents = list(golden_documents())
+    lines = sum(text.count('\n') + 1 for text in documents)
+    chars = sum(len(text) for text in documents)
+
+    digests = [document_digest(text, quiet_extract_sections) for text in documents]
+    if args.write_golden:
+        write_golden(GOLDEN_PATH, digests)
+        print(f"Wrote {len(digests)} digests to {GOLDEN_PATH}")
+        return
+
+    mismatch = first_mismatch(digests, load_golden(GOLDEN_PATH))
+    if mismatch is not None:
+        print(f"✗ Output differs from the golden corpus (first at document {mismatch})")
+        sys.exit(1)
+
+    print("=" * 70)
+    print(f"Section detection benchmark: {len(documents)} documents, {lines} lines, {chars / 1e6:.1f}M chars")
+    print(f"✓ Output identical to the golden corpus ({len(digests)} documents)")
+    print("=" * 70)
+    print(f"{'stage':<12}{'seconds':>12}{'lines/s':>16}")
+    for name, fn in (("classify", classify_all), ("extract", extract_all), ("scan", scan_all)):
+        elapsed = best_of(fn, documents, args.repeat)
+        print(f"{name:<12}{elapsed:>12.3f}{lines / elapsed:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
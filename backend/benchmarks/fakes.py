@@ -0,0 +1,154 @@
+"""
+Deterministic stand-ins for the embedding model and GPT4All
+
+Used by the benchmarks' --simulate mode so they can run without downloading
+models. The simulated LLM charges a configurable cost per prompt token
+(prefill) and per generated token (decode), which is what dominates GPT4All
+latency on CPU. SimulatedBatchModel does the same for the generation
+scheduler, where one decode step advances a whole batch.
+"""
+import hashlib
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.llms.base import LLM
+
+
+def approx_tokens(text: str) -> int:
+    """Approximate token count (1 token ≈ 4 characters)"""
+    return max(1, len(text) // 4)
+
+
+class HashEmbeddings(Embeddings):
+    """Unit vectors derived from a hash of the text"""
+
+    def __init__(self, dim: int = 768):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        seed = int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).normal(size=self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class SimulatedLLM(LLM):
+    """Sleeps like a CPU model would and returns canned, well-formed output"""
+
+    prefill_ms_per_token: float = 2.0
+    decode_ms_per_token: float = 20.0
+    output_tokens: int = 120
+    calls: int = 0
+    prompt_tokens: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[Any] = None, **kwargs: Any) -> str:
+        self.calls += 1
+        self.prompt_tokens += approx_tokens(prompt)
+        time.sleep(approx_tokens(prompt) * self.prefill_ms_per_token / 1000)
+
+        body = simulated_output(prompt, self.output_tokens)
+
+        text = ""
+        for token in body.split(' '):
+            time.sleep(self.decode_ms_per_token / 1000)
+            if run_manager:
+                run_manager.on_llm_new_token(token + ' ')
+            text += token + ' '
+        return text
+
+
+def simulated_output(prompt: str, output_tokens: int) -> str:
+    """Canned completion shaped like what the prompt asks for"""
+    prompt = prompt.rstrip()
+    if prompt.endswith("### SUMMARY"):
+        words = output_tokens * 4  # combined output carries all four parts
+        return (
+            _words(words // 4) + "\n\n### CONCEPT MAP\n" + _words(words // 4) +
+            "\n\n### TRICKS\n" + _words(words // 4) + "\n\n### Q&A\n" + _qna(5)
+        )
+    if prompt.endswith("Q&A:"):
+        return _qna(5)
+    if prompt.endswith("Answer:"):
+        return _words(max(1, output_tokens // 4))  # answers to questions are short
+    return _words(output_tokens)
+
+
+class SimulatedBatchModel:
+    """
+    Batch model (see services/generation_scheduler.py) that sleeps like a
+    batched CPU/GPU model: prefill costs per prompt token of each admitted
+    request, and one decode step costs decode_ms_per_step plus
+    decode_ms_per_sequence for each sequence in the batch
+    """
+
+    def __init__(self, prefill_ms_per_token: float = 2.0, decode_ms_per_step: float = 18.0,
+                 decode_ms_per_sequence: float = 2.0, output_tokens: int = 120):
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.decode_ms_per_step = decode_ms_per_step
+        self.decode_ms_per_sequence = decode_ms_per_sequence
+        self.output_tokens = output_tokens
+        self.calls = 0
+        self.prompt_tokens = 0
+
+    def start(self, request):
+        self.calls += 1
+        self.prompt_tokens += approx_tokens(request.prompt)
+        time.sleep(approx_tokens(request.prompt) * self.prefill_ms_per_token / 1000)
+        request.handle = iter(simulated_output(request.prompt, self.output_tokens).split(' '))
+
+    def step(self, requests) -> List:
+        time.sleep((self.decode_ms_per_step + self.decode_ms_per_sequence * len(requests)) / 1000)
+        results = []
+        for request in requests:
+            token = next(request.handle, None)
+            results.append(None if token is None else [token + ' '])
+        return results
+
+    def finish(self, request):
+        request.handle = None
+
+
+def _words(n: int) -> str:
+    return ' '.join(f"word{i}" for i in range(n))
+
+
+def _qna(n: int) -> str:
+    return '\n'.join(f"Q{i}: Question {i}?\nA{i}: Answer {i}." for i in range(1, n + 1))
+
+
+def synthetic_book(sections: int = 5, lines_per_section: int = 40) -> str:
+    """Text with page markers and chapter headings, shaped like extract_from_pdf output"""
+    pages = []
+    for s in range(1, sections + 1):
+        body = "\n".join(
+            f"Line {i} of chapter {s} explains concept {i % 7} with enough words to count as content."
+            for i in range(lines_per_section)
+        )
+        pages.append(f"[PAGE_{s}]\nCHAPTER {s} TOPIC NUMBER {s}\n{body}")
+    return "\n\n".join(pages)
+
+
+def synthetic_pages(pages: int = 100, lines_per_page: int = 40, pages_per_chapter: int = 20):
+    """Pages of a long book (one string per page), shaped like iter_document_pages output"""
+    for p in range(1, pages + 1):
+        lines = [f"[PAGE_{p}]"]
+        if p % pages_per_chapter == 1:
+            chapter = p // pages_per_chapter + 1
+            lines.append(f"CHAPTER {chapter} TOPIC NUMBER {chapter}")
+        lines.extend(
+            f"Line {i} of page {p} explains concept {(p * i) % 97} with enough words to count as content."
+            for i in range(lines_per_page)
+        )
+        yield "\n".join(lines) + "\n\n"
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Load test of the generation scheduler with a simulated batch model
+
+--clients threads (the inference workers of concurrent users) each send
+--requests completions through a GenerationScheduler: a share --ask-share
+of them are questions (short answers, label 'answer'), the rest are
+option="all" section prompts (long structured output, label 'all').
+--background threads keep submitting warm-up prompts at BACKGROUND priority
+for the whole run.
+
+The model is fakes.SimulatedBatchModel: prefill costs --prefill-ms per prompt
+token and a decode step costs --step-ms plus --sequence-ms per sequence in
+the batch. A batch size of 1 is the previous behaviour (one completion at a
+time, --step-ms + --sequence-ms per token).
+
+For every batch size in --batch-sizes it reports the aggregate tokens/sec,
+the mean batch size and, per kind of request, the time to first token and
+the latency (p50/p95) and how many missed their --deadline.
+
+Usage (from backend/):
+    python benchmarks/load_generation.py
+    python benchmarks/load_generation.py --clients 10 --batch-sizes 1,4,10 --background 2
+    python benchmarks/load_generation.py --step-ms 40 --sequence-ms 5 --deadline 30
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fakes import SimulatedBatchModel, _words
+from services.generation_scheduler import BACKGROUND, INTERACTIVE, DeadlineExceeded, GenerationScheduler
+from services.inference_executor import _summarize
+
+ASK_PROMPT = "Context:\n{context}\n\nQuestion: What does concept {i} mean?\n\nAnswer:"
+ALL_PROMPT = "Section: Chapter {i}\n\nContext:\n{context}\n\n### SUMMARY"
+
+
+class Recorder:
+    """Outcomes per kind of request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.first_token = {}
+        self.latency = {}
+        self.missed = {}
+
+    def record(self, kind: str, first_token, latency, missed: bool):
+        with self._lock:
+            if first_token is not None:
+                self.first_token.setdefault(kind, []).append(round(first_token, 3))
+            if latency is not None:
+                self.latency.setdefault(kind, []).append(round(latency, 3))
+            self.missed[kind] = self.missed.get(kind, 0) + int(missed)
+
+
+def complete(scheduler: GenerationScheduler, recorder: Recorder, kind: str, prompt: str,
+             priority: int, label: str, timeout):
+    submitted = time.perf_counter()
+    first_token = None
+    request = scheduler.submit(prompt, priority=priority, label=label, timeout=timeout)
+    try:
+        for _ in scheduler.stream(request):
+            if first_token is None:
+                first_token = time.perf_counter() - submitted
+    except DeadlineExceeded:
+        recorder.record(kind, first_token, None, True)
+        return
+    recorder.record(kind, first_token, time.perf_counter() - submitted, False)
+
+
+def run(args, batch_size: int):
+    model = SimulatedBatchModel(prefill_ms_per_token=args.prefill_ms, decode_ms_per_step=args.step_ms,
+                                decode_ms_per_sequence=args.sequence_ms, output_tokens=args.output_tokens)
+    scheduler = GenerationScheduler(model, max_batch_size=batch_size, max_tokens=args.max_tokens,
+                                    interactive_timeout=args.deadline or None)
+    recorder = Recorder()
+    context = _words(args.context_tokens)
+    stopping = threading.Event()
+
+    def client(seed: int):
+        rng = random.Random(seed)
+        for i in range(args.requests):
+            if rng.random() < args.ask_share:
+                complete(scheduler, recorder, 'answer', ASK_PROMPT.format(context=context, i=i),
+                         INTERACTIVE, 'answer', None)
+            else:
+                complete(scheduler, recorder, 'all', ALL_PROMPT.format(context=context, i=i),
+                         INTERACTIVE, 'all', None)
+            time.sleep(rng.uniform(0, args.think_ms / 1000))
+
+    def warmer():
+        i = 0
+        while not stopping.is_set():
+            try:
+                complete(scheduler, recorder, 'warm-up', ALL_PROMPT.format(context=context, i=i),
+                         BACKGROUND, 'all', None)
+            except RuntimeError:
+                return  # the scheduler was shut down at the end of the run
+            i += 1
+
+    clients = [threading.Thread(target=client, args=(seed,)) for seed in range(args.clients)]
+    warmers = [threading.Thread(target=warmer) for _ in range(args.background)]
+    start = time.perf_counter()
+    for thread in warmers + clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stats = scheduler.stats()
+    stopping.set()
+    scheduler.shutdown()
+    for thread in warmers:
+        thread.join()
+
+    print(f"\nbatch size {batch_size}: {elapsed:.2f}s, {stats['tokens_generated']} tokens, "
+          f"{stats['tokens_generated'] / elapsed:.1f} tokens/s, mean batch {stats['mean_batch_size']}")
+    print(f"  {'kind':<9}{'done':>6}{'missed':>8}{'ttft p50':>10}{'ttft p95':>10}{'lat p50':>10}{'lat p95':>10}")
+    for kind in ('answer', 'all', 'warm-up'):
+        if kind not in recorder.missed:
+            continue
+        ttft = _summarize(recorder.first_token.get(kind, []))
+        latency = _summarize(recorder.latency.get(kind, []))
+        print(f"  {kind:<9}{latency['count']:>6}{recorder.missed[kind]:>8}{ttft['p50']:>10.2f}"
+              f"{ttft['p95']:>10.2f}{latency['p50']:>10.2f}{latency['p95']:>10.2f}")
+    return stats['tokens_generated'] / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10, help="concurrent users")
+    parser.add_argument("--requests", type=int, default=3, help="completions per user")
+    parser.add_argument("--ask-share", type=float, default=0.5, help="share of requests that are questions")
+    parser.add_argument("--background", type=int, default=0, help="warm-up threads running alongside")
+    parser.add_argument("--batch-sizes", default="1,4,10", help="comma-separated batch sizes to compare")
+    parser.add_argument("--prefill-ms", type=float, default=0.5, help="simulated ms per prompt token")
+    parser.add_argument("--step-ms", type=float, default=18.0, help="simulated ms per decode step")
+    parser.add_argument("--sequence-ms", type=float, default=2.0, help="extra ms per sequence in a step")
+    parser.add_argument("--output-tokens", type=int, default=60, help="simulated tokens per artifact")
+    parser.add_argument("--max-tokens", type=int, default=512, help="cap on tokens per completion")
+    parser.add_argument("--context-tokens", type=int, default=300, help="words of context per prompt")
+    parser.add_argument("--think-ms", type=float, default=200.0, help="max pause between a user's requests")
+    parser.add_argument("--deadline", type=float, default=0, help="interactive deadline in seconds (0: none)")
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print(f"Generation load test: {args.clients} users x {args.requests} requests, "
+          f"{int(100 * args.ask_share)}% questions, {args.background} warm-up threads")
+    print(f"decode step {args.step_ms}ms + {args.sequence_ms}ms/sequence, prefill {args.prefill_ms}ms/token")
+    print("=" * 72)
+
+    throughput = {size: run(args, size) for size in (int(s) for s in args.batch_sizes.split(','))}
+    baseline = throughput.get(1)
+    if baseline:
+        print()
+        for size, tokens_per_second in throughput.items():
+            print(f"batch size {size:>3}: {tokens_per_second / baseline:5.2f}x tokens/s of one-at-a-time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Deterministic golden corpus for section detection
+
+Generates documents shaped like extract_from_pdf output that exercise every
+branch of the heading classifier: academic headings, numbered and dotted
+headings, ALL CAPS / Title Case / short capitalized lines, each noise filter
+(e-mail, URL, DOI, ISSN, reference numbers, symbol-heavy lines), non-ASCII
+text, page markers and documents without any headings (paragraph fallback).
+
+golden/sections.json holds a digest per document of extract_sections()
+output and of every line's clean_line()/score_heading() result, recorded
+from the reference implementation; bench_sections.py checks the current
+code against it.
+"""
+import hashlib
+import json
+import random
+from typing import Dict, Iterator, List, Optional
+
+from utils.text_extractor import clean_line, score_heading
+
+SEED = 20240601
+DOCUMENTS = 400
+
+WORDS = ("cell energy light plant water osmosis enzyme protein membrane force mass "
+         "wave heat motion atom charge field acid base the of and is a to in").split()
+UNICODE_WORDS = "über étude naïve façade Zellteilung ÉNERGIE Ωmega café 光合作用 résumé".split()
+ACADEMIC = ["Abstract", "ABSTRACT", "Introduction", "introduction", "Related Work", "Literature Review",
+            "Background", "Methodology", "Method", "Methods", "Experiments", "Experimental Setup",
+            "Results", "Findings", "Discussion", "Analysis", "Conclusion", "Conclusions",
+            "References", "Bibliography", "Acknowledgements", "Acknowledgments", "Appendix",
+            "Appendices", "Introduction:", "Results and Discussion"]
+NUMBERED = ["Chapter", "CHAPTER", "chapter", "Section", "Part", "UNIT", "Module", "Lesson", "Article"]
+NOISE = ["jane.doe@univ.edu", "contact: a@b.org", "http://example.com/page", "https://x.y/z",
+         "www.textbook.org", "doi:10.1000/182", "1234-5678", "2019-2020 edition", "12 34-(56)",
+         "(555) 123-4567", "*** ### ***", "--- ~~~ +++ ===", "ab", "", "   ", "x", "$$ \\alpha_1 + \\beta $$",
+         "[PAGE_x]", "Fig. 3", "• • •"]
+
+
+def _words(rng: random.Random, n: int, pool=WORDS) -> List[str]:
+    return [rng.choice(pool) for _ in range(n)]
+
+
+def _line(rng: random.Random) -> str:
+    k = rng.random()
+    if k < 0.04:
+        return rng.choice(ACADEMIC)
+    if k < 0.08:
+        sep = rng.choice([" ", "  ", ": ", " - "])
+        return f"{rng.choice(NUMBERED)} {rng.randint(1, 30)}{sep}" + " ".join(w.title() for w in _words(rng, rng.randint(0, 5)))
+    if k < 0.11:
+        number = rng.choice([f"{rng.randint(1, 12)}.", f"{rng.randint(1, 12)}.{rng.randint(1, 9)}",
+                             f"{rng.randint(1, 12)}.{rng.randint(1, 9)}."])
+        title = " ".join(w.title() if rng.random() < 0.8 else w for w in _words(rng, rng.randint(1, 4)))
+        return f"{number}{rng.choice([' ', '  ', ''])}{title}"
+    if k < 0.14:
+        words = _words(rng, rng.randint(1, 8))
+        if rng.random() < 0.2:
+            words.append(str(rng.randint(1, 99)))
+        return " ".join(w.upper() for w in words)
+    if k < 0.17:
+        return " ".join(w.title() for w in _words(rng, rng.randint(1, 10))) + rng.choice(["", "", ".", ":", "?"])
+    if k < 0.20:
+        return (rng.choice(WORDS).title() + " " + " ".join(_words(rng, rng.randint(1, 9)))
+                + rng.choice(["", "", ".", ","]))
+    if k < 0.25:
+        return rng.choice(NOISE)
+    if k < 0.28:
+        words = _words(rng, rng.randint(1, 12), WORDS + UNICODE_WORDS)
+        return " ".join(w.title() if rng.random() < 0.5 else w for w in words)
+    pad = rng.choice(["", "", " ", "\t", "  "])
+    body = " ".join(_words(rng, rng.randint(1, 30)))
+    if rng.random() < 0.3:
+        body += f" {rng.randint(0, 9999)}"
+    if rng.random() < 0.5:
+        body = body[0].upper() + body[1:]
+    return pad + body + rng.choice(["", ".", ".", ",", ";"]) + pad
+
+
+def _fallback_line(rng: random.Random) -> str:
+    """Body text only, so no heading validates and the paragraph fallback runs"""
+    n = rng.randint(3, 25)
+    text = " ".join(_words(rng, n))
+    return (text[0].upper() + text[1:] if rng.random() < 0.4 else text) + rng.choice([".", ",", ""])
+
+
+def golden_documents(seed: int = SEED, count: int = DOCUMENTS) -> Iterator[str]:
+    """The corpus, one document at a time"""
+    rng = random.Random(seed)
+    for d in range(count):
+        line = _fallback_line if d % 5 == 4 else _line
+        pages = []
+        for p in range(1, rng.randint(2, 12)):
+            lines = [line(rng) for _ in range(rng.randint(0, 80))]
+            pages.append(f"[PAGE_{p}]\n" + "\n".join(lines))
+        yield "\n\n".join(pages)
+
+
+def document_digest(text: str, extract_sections) -> str:
+    """Digest of a document's sections and of every line's classification"""
+    lines = []
+    for line in text.split('\n'):
+        line_obj = clean_line(line.strip())
+        lines.append([line_obj, score_heading(line_obj) if line_obj else None])
+    payload = json.dumps({'sections': extract_sections(text), 'lines': lines},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_golden(path: str) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_golden(path: str, digests: List[str], seed: int = SEED):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'seed': seed, 'documents': len(digests), 'digests': digests}, f, indent=1)
+        f.write('\n')
+
+
+def first_mismatch(digests: List[str], golden: Dict) -> Optional[int]:
+    for i, (digest, expected) in enumerate(zip(digests, golden['digests'])):
+        if digest != expected:
+            return i
+    return None if len(digests) == len(golden['digests']) else min(len(digests), len(golden['digests']))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Stub OpenAI-compatible completion server
+
+Serves /v1/completions (plain and streamed over SSE) and /v1/models with the
+canned output and per-token sleeps of fakes.SimulatedLLM, so the server LLM
+backend (LLM_BACKEND=server) can be exercised and load-tested without a
+model. Requests are handled one at a time by default, like a single
+llama.cpp slot; --slots allows more in parallel.
+
+Usage (from backend/):
+    python benchmarks/stub_llm_server.py --port 8080
+    LLM_BACKEND=server LLM_SERVER_URL=http://127.0.0.1:8080 uvicorn main:app --workers 4
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from fakes import SimulatedLLM, approx_tokens
+
+
+class CompletionRequest(BaseModel):
+    prompt: str
+    model: str = "stub"
+    max_tokens: int = 512
+    temperature: float = 0.7
+    stream: bool = False
+
+
+class _TokenSink:
+    """run_manager stand-in collecting SimulatedLLM's tokens"""
+
+    def __init__(self, tokens: "queue.Queue"):
+        self.tokens = tokens
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self.tokens.put(token)
+
+
+def create_app(prefill_ms: float = 2.0, decode_ms: float = 20.0, output_tokens: int = 120,
+               slots: int = 1) -> FastAPI:
+    app = FastAPI(title="Stub LLM server")
+    llm = SimulatedLLM(prefill_ms_per_token=prefill_ms, decode_ms_per_token=decode_ms,
+                       output_tokens=output_tokens)
+    slot = threading.Semaphore(slots)
+
+    def generate(prompt: str, tokens: "queue.Queue"):
+        with slot:
+            llm._call(prompt, run_manager=_TokenSink(tokens))
+        tokens.put(None)
+
+    def completion(request: CompletionRequest, text: str, finish_reason) -> dict:
+        return {
+            'id': f"cmpl-{time.time_ns()}",
+            'object': 'text_completion',
+            'created': int(time.time()),
+            'model': request.model,
+            'choices': [{'index': 0, 'text': text, 'finish_reason': finish_reason}],
+        }
+
+    @app.get("/v1/models")
+    def models():
+        return {'object': 'list', 'data': [{'id': 'stub', 'object': 'model'}]}
+
+    @app.post("/v1/completions")
+    def completions(request: CompletionRequest):
+        tokens: "queue.Queue" = queue.Queue()
+        threading.Thread(target=generate, args=(request.prompt, tokens), daemon=True).start()
+
+        if not request.stream:
+            text = ""
+            for token in iter(tokens.get, None):
+                text += token
+            result = completion(request, text, 'stop')
+            result['usage'] = {'prompt_tokens': approx_tokens(request.prompt),
+                               'completion_tokens': approx_tokens(text)}
+            return result
+
+        def events():
+            for token in iter(tokens.get, None):
+                yield f"data: {json.dumps(completion(request, token, None))}\n\n"
+            yield f"data: {json.dumps(completion(request, '', 'stop'))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--prefill-ms", type=float, default=2.0, help="simulated cost per prompt token")
+    parser.add_argument("--decode-ms", type=float, default=20.0, help="simulated cost per generated token")
+    parser.add_argument("--output-tokens", type=int, default=120)
+    parser.add_argument("--slots", type=int, default=1, help="completions generated in parallel")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(args.prefill_ms, args.decode_ms, args.output_tokens, args.slots),
+                host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,35 @@
 """
 FastAPI Backend for EduSummary
 """
+import asyncio
 import os
 import shutil
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 
 from models.schemas import (
-    UploadResponse, StatusResponse, GenerateRequest, 
-    GenerateResponse, AskRequest, AskResponse, QnAItem, SectionInfo
+    StatusResponse, GenerateRequest, 
+    GenerateResponse, AskRequest, AskResponse, SectionInfo,
+    UploadJobResponse, JobStatusResponse, InferenceTimings, DocumentInfo, AskBatchRequest,
+    SectionTextResponse
 )
-from services.rag_service import RAGService
-from utils.text_extractor import extract_text, chunk_text, extract_sections
+from services.rag_service import RAGService, parse_qna
+from services.document_library import DocumentNotFoundError
+from services.ingestion_jobs import IngestionJobManager
+from services.generation_scheduler import (
+    BACKGROUND, DeadlineExceeded, GenerationScheduler, ScheduledBackend, ServerBatchModel, generation_context
+)
+from services.inference_executor import InferenceExecutor, QueueFullError
+from services.startup import StartupManager
+from services.semantic_cache import SemanticCache
+from services.warmup import WarmupScheduler
+from services.llm_backend import LLMBackendError, create_llm_backend
+from services.streaming import EventChannel, TokenStreamHandler, format_sse
 
 # Initialize FastAPI app
 app = FastAPI(title="EduSummary API", version="1.0.0")
@@ -26,8 +43,85 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Where prompts run: in-process GPT4All, or a model server shared by every API worker
+LLM_MODEL = os.getenv("LLM_MODEL", "orca-mini-3b-gguf2-q4_0.gguf")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gpt4all").lower()
+LLM_SERVER_URL = os.getenv("LLM_SERVER_URL")
+llm_backend = create_llm_backend(
+    LLM_BACKEND, LLM_MODEL, server_url=LLM_SERVER_URL,
+    **({
+        'max_tokens': int(os.getenv("LLM_ANSWER_TOKENS", "512")),
+        'pool_size': int(os.getenv("LLM_POOL_SIZE", "8")),
+        'connect_timeout': float(os.getenv("LLM_CONNECT_TIMEOUT", "5")),
+        'read_timeout': float(os.getenv("LLM_READ_TIMEOUT", "120")),
+        'api_key': os.getenv("LLM_API_KEY") or None,
+    } if LLM_BACKEND == 'server' else {})
+)
+
+# Continuous batching: up to LLM_BATCH_SIZE concurrent completions decode
+# together (server backend only - a GPT4All model runs one completion at a time)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "1"))
+if LLM_BATCH_SIZE > 1 and LLM_BACKEND != 'server':
+    print(f"LLM_BATCH_SIZE={LLM_BATCH_SIZE} ignored: batching needs LLM_BACKEND=server")
+    LLM_BATCH_SIZE = 1
+if LLM_BATCH_SIZE > 1:
+    llm_backend = ScheduledBackend(llm_backend, GenerationScheduler(
+        ServerBatchModel(llm_backend),
+        max_batch_size=LLM_BATCH_SIZE,
+        max_tokens=int(os.getenv("LLM_ANSWER_TOKENS", "512")),
+        interactive_timeout=float(os.getenv("LLM_DEADLINE_SECONDS", "300")) or None,
+        background_slots=int(os.getenv("LLM_BACKGROUND_SLOTS", "1"))
+    ))
+
 # Initialize RAG service
-rag_service = RAGService()
+rag_service = RAGService(
+    llm_model_name=LLM_MODEL,
+    llm_backend=llm_backend,
+    result_cache_bytes=int(os.getenv("RESULT_CACHE_MB", "256")) * 1024 * 1024,
+    semantic_cache=SemanticCache(
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+        ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600))),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+    ),
+    library_memory_bytes=int(os.getenv("LIBRARY_MEMORY_MB", "1024")) * 1024 * 1024,
+    embed_batch_size=int(os.getenv("EMBED_BATCH_SIZE", "32")),
+    embed_threads=int(os.getenv("EMBED_THREADS", "0")) or None,
+    embed_backend=os.getenv("EMBED_BACKEND", "torch").lower(),
+    index_type=os.getenv("FAISS_INDEX_TYPE", "auto").lower(),
+    index_nprobe=int(os.getenv("FAISS_NPROBE", "16")),
+    index_ef_search=int(os.getenv("FAISS_EF_SEARCH", "64")),
+    index_mmap=os.getenv("INDEX_MMAP", "1") != "0",
+    retrieval_mode=os.getenv("RETRIEVAL_MODE", "hybrid").lower(),
+    retrieval_candidates=int(os.getenv("RETRIEVAL_CANDIDATES", "20")),
+    llm_context_window=int(os.getenv("LLM_CONTEXT_WINDOW", "2048")),
+    llm_answer_tokens=int(os.getenv("LLM_ANSWER_TOKENS", "512")),
+    context_tokens=int(os.getenv("CONTEXT_TOKENS", "600")) or None,
+    llm_token_margin=float(os.getenv("LLM_TOKEN_MARGIN", "1.25")),
+    # Loaded at startup or on first use per STARTUP_MODE, not when this module is imported
+    lazy_embeddings=True
+)
+
+# Background ingestion jobs (keeps /upload from blocking the event loop)
+job_manager = IngestionJobManager(
+    rag_service,
+    max_workers=int(os.getenv("INGEST_WORKERS", "1")),
+    extract_workers=int(os.getenv("PDF_EXTRACT_WORKERS", "0")) or None
+)
+
+# Bounded pool of model workers for /generate and /ask (429 when the queue is full);
+# with batching, one worker per batch slot keeps the batch full
+inference_executor = InferenceExecutor(
+    max_workers=int(os.getenv("INFERENCE_WORKERS", str(LLM_BATCH_SIZE))),
+    max_queue=int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))
+)
+
+# When the embeddings, the default index and the LLM load: 'lazy' (first use),
+# 'eager' (before serving) or 'background' (right after startup); see /readyz
+startup_manager = StartupManager(
+    rag_service,
+    inference_executor,
+    mode=os.getenv("STARTUP_MODE", "background").lower()
+)
 
 # Storage directory
 UPLOAD_DIR = "./storage/uploads"
@@ -37,7 +131,7 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 @app.on_event("startup")
 async def startup_event():
     """
-    Load existing vectorstore on startup if available
+    Open the textbook library on startup (indexes load on first use)
     Models are automatically cached and reused from:
     - Embeddings: ~/.cache/huggingface/
     - GPT4All: ~/.cache/gpt4all/
@@ -46,117 +140,127 @@ async def startup_event():
     print("EduSummary Backend Starting...")
     print("=" * 60)
     
-    # Load vectorstore if exists
+    # Read the library catalog if it exists
     rag_service.load_vectorstore()
     
+    # Load and warm the models and the default index (per STARTUP_MODE)
+    await startup_manager.start()
+    
+    # Resume warming books queued before a restart
+    warmup_scheduler.start()
+    
     print("\nModel Cache Locations:")
     print(f"  - HuggingFace models: ~/.cache/huggingface/")
-    print(f"  - GPT4All models: ~/.cache/gpt4all/")
+    if llm_backend.name == 'gpt4all':
+        print(f"  - GPT4All models: ~/.cache/gpt4all/")
+    else:
+        print(f"  - LLM: {LLM_MODEL} served by {LLM_SERVER_URL}")
+    if LLM_BATCH_SIZE > 1:
+        print(f"  - Continuous batching of up to {LLM_BATCH_SIZE} completions")
     print("\nModels will be downloaded once and cached for future use.")
     print("=" * 60)
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers"""
+    await startup_manager.stop()
+    await warmup_scheduler.stop()
+    job_manager.shutdown()
+    inference_executor.shutdown()
+    llm_backend.close()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
     return {"message": "EduSummary API is running!", "version": "1.0.0"}
 
 
-@app.post("/upload", response_model=UploadResponse)
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and its event loop answers"""
+    return {"status": "ok", "uptime_seconds": round(time.time() - startup_manager.started, 1)}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: 200 once the startup warm-up (STARTUP_MODE) has finished and no
+    component failed, else 503; reports whether each component is hot
+    """
+    readiness = await run_in_threadpool(startup_manager.readiness)
+    return JSONResponse(status_code=200 if readiness['ready'] else 503, content=readiness)
+
+
+@app.post("/upload", response_model=UploadJobResponse, status_code=202)
 async def upload_textbook(file: UploadFile = File(...)):
     """
-    Upload and process textbook (PDF/PPT/DOCX)
+    Upload a textbook (PDF/PPT/DOCX) and queue it for background processing.
+    Poll /jobs/{job_id} for progress; the job result matches UploadResponse.
     """
+    # Validate file type
+    filename = file.filename.lower()
+    if filename.endswith('.pdf'):
+        file_type = 'pdf'
+    elif filename.endswith('.pptx') or filename.endswith('.ppt'):
+        file_type = 'pptx'
+    elif filename.endswith('.docx') or filename.endswith('.doc'):
+        file_type = 'docx'
+    else:
+        raise HTTPException(
+            status_code=400, 
+            detail="Unsupported file type. Please upload PDF, PPT, or DOCX."
+        )
+    
     try:
-        # Validate file type
-        filename = file.filename.lower()
-        if filename.endswith('.pdf'):
-            file_type = 'pdf'
-        elif filename.endswith('.pptx') or filename.endswith('.ppt'):
-            file_type = 'pptx'
-        elif filename.endswith('.docx') or filename.endswith('.doc'):
-            file_type = 'docx'
-        else:
-            raise HTTPException(
-                status_code=400, 
-                detail="Unsupported file type. Please upload PDF, PPT, or DOCX."
-            )
-        
-        # Save uploaded file
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Extract text (with page markers for better section detection)
-        print(f"Extracting text from {file.filename}...")
-        text = extract_text(file_path, file_type)
-        
-        if not text or len(text) < 100:
-            raise HTTPException(
-                status_code=400,
-                detail="Could not extract sufficient text from the file."
-            )
-        
-        # Extract sections from the document (BEFORE chunking)
-        print("Analyzing document structure and extracting sections...")
-        sections = extract_sections(text)
-        
-        if not sections or len(sections) == 0:
-            raise HTTPException(
-                status_code=400,
-                detail="Could not extract any sections from the document."
-            )
+        # Save uploaded file without blocking the event loop, under a name of its
+        # own so an upload with the same filename can't overwrite one still being ingested
+        file_path = os.path.join(UPLOAD_DIR, uuid.uuid4().hex + os.path.splitext(filename)[1])
+        await run_in_threadpool(_save_upload, file, file_path)
         
-        print(f"✓ Found {len(sections)} sections in document")
+        job = job_manager.submit(file_path, file.filename, file_type)
+        print(f"Queued ingestion job {job.id} for {file.filename}")
         
-        # Chunk text (now we chunk the full text with section metadata)
-        print("Creating chunks from document...")
-        all_chunks = []
-        
-        # Create chunks for each section separately
-        for section in sections:
-            section_chunks = chunk_text(
-                section['content'], 
-                chunk_size=300, 
-                overlap=30,
-                section_id=section['id'],
-                section_title=section['title']
-            )
-            all_chunks.extend(section_chunks)
-        
-        print(f"✓ Created {len(all_chunks)} chunks from {len(sections)} sections")
-        
-        # Create vectorstore
-        print("Creating vectorstore...")
-        rag_service.create_vectorstore(all_chunks, file.filename, sections)
-        
-        # Convert sections to response format
-        section_infos = [
-            SectionInfo(id=s["id"], title=s["title"], preview=s["preview"])
-            for s in sections
-        ]
-        
-        return UploadResponse(
-            status="success",
-            message="Textbook processed successfully. System ready.",
-            textbook_name=file.filename,
-            total_chunks=len(all_chunks),
-            sections=section_infos
+        return UploadJobResponse(
+            job_id=job.id,
+            status=job.status,
+            message="Textbook queued for processing. Poll /jobs/{job_id} for progress.",
+            textbook_name=file.filename
         )
     
-    except HTTPException:
-        raise
     except Exception as e:
         print(f"Error in upload: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
+
+
+def _save_upload(file: UploadFile, file_path: str):
+    """Copy the uploaded file to disk"""
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """
+    Get progress of an ingestion job
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JobStatusResponse(**job.to_dict())
 
 
 @app.get("/status", response_model=StatusResponse)
-async def get_status():
+async def get_status(doc_id: Optional[str] = None):
     """
-    Get system status
+    Get system status for a textbook (default: the most recently uploaded one)
     """
-    status = rag_service.get_status()
+    if doc_id and rag_service.resolve_doc_id(doc_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown textbook: {doc_id}")
+    
+    status = rag_service.get_status(doc_id)
     
     # Convert sections to response format
     section_infos = None
@@ -168,53 +272,299 @@ async def get_status():
     
     return StatusResponse(
         ready=status['ready'],
+        doc_id=status.get('doc_id'),
         textbook_name=status.get('textbook_name'),
         total_chunks=status.get('total_chunks'),
         sections=section_infos,
+        documents=[_document_info(d) for d in status['documents']],
         message="System ready" if status['ready'] else "No textbook uploaded"
     )
 
 
-@app.post("/generate", response_model=GenerateResponse)
-async def generate_outputs(request: GenerateRequest):
+@app.get("/documents", response_model=List[DocumentInfo])
+async def list_documents():
     """
-    Generate section outputs (summary, concept map, tricks, Q&A)
+    List every textbook in the library, newest first
+    """
+    return [_document_info(d) for d in rag_service.library.list_documents()]
+
+
+@app.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    """
+    Remove a textbook, its index and its cached results
+    """
+    try:
+        await run_in_threadpool(rag_service.remove_document, doc_id)
+    except DocumentNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown textbook: {doc_id}")
+    
+    return {"status": "deleted", "doc_id": doc_id}
+
+
+@app.get("/documents/{doc_id}/sections/{section_id}", response_model=SectionTextResponse)
+async def get_section(doc_id: str, section_id: str):
+    """
+    Full text of one section of a textbook, read from disk on demand
+    """
+    if rag_service.library.info(doc_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown textbook: {doc_id}")
+    section = rag_service.get_section_info(section_id, doc_id)
+    if section is None:
+        raise HTTPException(status_code=404, detail=f"Unknown section: {section_id}")
+    
+    try:
+        text = await run_in_threadpool(rag_service.get_section_text, section_id, doc_id)
+    except DocumentNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown textbook: {doc_id}")
+    
+    return SectionTextResponse(doc_id=doc_id, section_id=section_id, title=section['title'], text=text or "")
+
+
+@app.post("/documents/{doc_id}/warmup", status_code=202)
+async def warm_document(doc_id: str):
     """
-    if not rag_service.is_ready():
+    Queue a textbook for background generation of every section's artifacts
+    """
+    if rag_service.library.info(doc_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown textbook: {doc_id}")
+    warmup_scheduler.enqueue(doc_id)
+    return {"status": "queued", "doc_id": doc_id}
+
+
+def _document_info(doc: dict) -> DocumentInfo:
+    """Catalog entry to DocumentInfo"""
+    return DocumentInfo(
+        doc_id=doc['doc_id'],
+        textbook_name=doc['textbook_name'],
+        total_chunks=doc['total_chunks'],
+        section_count=len(doc['sections']),
+        resident=doc.get('resident', False),
+        index_type=doc.get('index_type', 'flat')
+    )
+
+
+def _resolve_document(doc_id: Optional[str]) -> str:
+    """Doc id a request applies to, or 404 (unknown id) / 400 (empty library)"""
+    resolved = rag_service.resolve_doc_id(doc_id)
+    if resolved is None:
+        if doc_id:
+            raise HTTPException(status_code=404, detail=f"Unknown textbook: {doc_id}")
         raise HTTPException(
             status_code=400,
             detail="System not ready. Please upload a textbook first."
         )
+    return resolved
+
+
+# Artifacts produced for each /generate option, and their response fields
+OPTION_ARTIFACTS = {
+    "summary": ["summary"],
+    "conceptmap": ["conceptmap"],
+    "tricks": ["tricks"],
+    "all": ["summary", "conceptmap", "tricks", "qna"],
+}
+ARTIFACT_FIELDS = {
+    "summary": "summary",
+    "conceptmap": "concept_map",
+    "tricks": "tricks",
+    "qna": "qna",
+}
+
+# How option="all" is produced: "combined" (one retrieval, one structured
+# completion) or "sequential" (four independent generations)
+GENERATE_ALL_MODE = os.getenv("GENERATE_ALL_MODE", "combined").lower()
+
+
+def _generate_sync(doc_id: str, section_id: str, artifacts: List[str]) -> dict:
+    """Generate the given artifacts for a section and cache them (called on a model worker)"""
+    if GENERATE_ALL_MODE == "combined" and len(artifacts) == len(OPTION_ARTIFACTS["all"]):
+        print(f"Generating all outputs for section {section_id} in one pass...")
+        results = rag_service.generate_all(section_id, doc_id=doc_id)
+    else:
+        generators = {
+            "summary": rag_service.generate_summary,
+            "conceptmap": rag_service.generate_concept_map,
+            "tricks": rag_service.generate_tricks,
+            "qna": rag_service.generate_qna,
+        }
+        results = {}
+        for artifact in artifacts:
+            print(f"Generating {artifact} for section {section_id}...")
+            results[artifact] = generators[artifact](section_id, doc_id)
     
+    rag_service.cache_artifacts(section_id, results, doc_id)
+    return results
+
+
+def _warmup_generate_sync(doc_id: str, section_id: str, artifacts: List[str]) -> dict:
+    """_generate_sync at background priority (a batching backend serves interactive completions first)"""
+    with generation_context(priority=BACKGROUND):
+        return _generate_sync(doc_id, section_id, artifacts)
+
+
+# Background warm-up of every section after ingestion (WARMUP_ON_UPLOAD=1),
+# run on the inference workers only while no interactive request is waiting
+warmup_scheduler = WarmupScheduler(
+    os.path.join(rag_service.persist_dir, "warmup.json"),
+    rag_service,
+    inference_executor,
+    _warmup_generate_sync,
+    artifacts=OPTION_ARTIFACTS["all"]
+)
+if os.getenv("WARMUP_ON_UPLOAD", "0") == "1":
+    job_manager.on_complete = warmup_scheduler.enqueue
+
+
+def _generate_stream_sync(doc_id: str, section_id: str, artifacts: List[str], channel: EventChannel) -> dict:
+    """Generate section artifacts, emitting sources and tokens as they are produced"""
     try:
-        option = request.option.lower()
-        section_id = request.section_id
-        
-        # Get section title
-        section = rag_service.get_section_info(section_id)
-        section_title = section['title'] if section else section_id
-        
-        response_data = {"section_id": section_id, "section_title": section_title}
+        if GENERATE_ALL_MODE == "combined" and len(artifacts) == len(OPTION_ARTIFACTS["all"]):
+            # One structured completion: tokens are tagged 'all', then each parsed artifact is sent
+            print(f"Streaming all outputs for section {section_id} in one pass...")
+            prepared = rag_service.prepare_section_prompt("all", section_id, doc_id)
+            channel.emit('sources', {'artifact': "all", 'sources': prepared['sources']})
+            results = rag_service.generate_all(
+                section_id, callbacks=[TokenStreamHandler(channel, "all")], prepared=prepared
+            )
+            for artifact, value in results.items():
+                channel.emit('artifact', {'artifact': artifact, 'value': value, 'cached': False})
+        else:
+            results = {}
+            for artifact in artifacts:
+                print(f"Streaming {artifact} for section {section_id}...")
+                prepared = rag_service.prepare_section_prompt(artifact, section_id, doc_id)
+                channel.emit('sources', {'artifact': artifact, 'sources': prepared['sources']})
+                
+                text = rag_service.run_prompt(prepared, callbacks=[TokenStreamHandler(channel, artifact)])
+                results[artifact] = parse_qna(text) if artifact == "qna" else text
+                channel.emit('artifact', {'artifact': artifact, 'value': results[artifact], 'cached': False})
         
-        if option == "summary" or option == "all":
-            print(f"Generating summary for section {section_id}...")
-            response_data["summary"] = rag_service.generate_summary(section_id)
+        rag_service.cache_artifacts(section_id, results, doc_id)
+        return results
+    finally:
+        channel.close()
+
+
+def _generate_response_data(doc_id: str, section_id: str, results: dict, cached: dict) -> dict:
+    """Assemble GenerateResponse fields from generated and cached artifacts"""
+    section = rag_service.get_section_info(section_id, doc_id)
+    section_title = section['title'] if section else section_id
+    
+    response_data = {"doc_id": doc_id, "section_id": section_id, "section_title": section_title}
+    for artifact, value in {**cached, **(results or {})}.items():
+        response_data[ARTIFACT_FIELDS[artifact]] = value
+    response_data["cached"] = [ARTIFACT_FIELDS[a] for a in cached]
+    return response_data
+
+
+def _ask_stream_sync(doc_id: str, question: str, vector: List[float], channel: EventChannel) -> dict:
+    """Answer a question, emitting the retrieved sources first and then tokens"""
+    try:
+        prepared = rag_service.prepare_question_prompt(question, vector, doc_id)
+        channel.emit('sources', {'sources': prepared['sources']})
         
-        if option == "conceptmap" or option == "all":
-            print(f"Generating concept map for section {section_id}...")
-            response_data["concept_map"] = rag_service.generate_concept_map(section_id)
+        answer = rag_service.run_prompt(prepared, callbacks=[TokenStreamHandler(channel)])
+        result = {"doc_id": doc_id, "question": question, "answer": answer, "sources": prepared['sources']}
+        rag_service.remember_answer(question, vector, result, doc_id)
+        return result
+    finally:
+        channel.close()
+
+
+async def _sse_response(channel: EventChannel, task: Optional[asyncio.Task] = None,
+                        finalize: Optional[Callable[[dict, dict], dict]] = None) -> StreamingResponse:
+    """
+    Stream events from channel as SSE, ending with a 'done' (or 'error') event
+    task: the inference task feeding the channel (None when nothing needs generating)
+    finalize: builds the 'done' payload from (result, timings)
+    """
+    if task is not None:
+        # Surface the exception of a task nobody awaits (client went away)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    
+    async def event_stream():
+        try:
+            if task is not None:
+                yield format_sse('queued', {'queue_position': inference_executor.queued})
+            async for event, data in channel.events():
+                yield format_sse(event, data)
+            result, timings = await task if task is not None else (None, None)
+            if finalize:
+                yield format_sse('done', finalize(result, timings))
+            else:
+                yield format_sse('done', {**result, 'timings': timings})
+        except Exception as e:
+            print(f"Error in stream: {str(e)}")
+            yield format_sse('error', {'detail': str(e)})
+        finally:
+            # Stop decoding if the client disconnected mid-stream
+            if task is not None and not task.done():
+                channel.cancelled = True
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _llm_unavailable_exception(e: LLMBackendError) -> HTTPException:
+    """Map a failed or unreachable LLM server to 503"""
+    print(f"LLM backend error: {str(e)}")
+    return HTTPException(status_code=503, detail=str(e))
+
+
+def _deadline_exception(e: DeadlineExceeded) -> HTTPException:
+    """Map a generation that missed its deadline (LLM_DEADLINE_SECONDS) to 504"""
+    print(f"Generation deadline exceeded: {str(e)}")
+    return HTTPException(status_code=504, detail=str(e))
+
+
+def _queue_full_exception(e: QueueFullError) -> HTTPException:
+    """Map a rejected admission to 429 with a Retry-After hint"""
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+@app.post("/generate", response_model=GenerateResponse)
+async def generate_outputs(request: GenerateRequest):
+    """
+    Generate section outputs (summary, concept map, tricks, Q&A)
+    """
+    doc_id = _resolve_document(request.doc_id)
+    
+    try:
+        option = request.option.lower()
+        section_id = request.section_id
+        artifacts = OPTION_ARTIFACTS.get(option, [])
         
-        if option == "tricks" or option == "all":
-            print(f"Generating tricks for section {section_id}...")
-            response_data["tricks"] = rag_service.generate_tricks(section_id)
+        # Serve what we can from the result cache without touching the model
+        cached = await run_in_threadpool(rag_service.get_cached_artifacts, section_id, artifacts, doc_id)
+        missing = [a for a in artifacts if a not in cached]
         
-        if option == "all":
-            print(f"Generating Q&A for section {section_id}...")
-            qna_list = rag_service.generate_qna(section_id)
-            response_data["qna"] = [QnAItem(**item) for item in qna_list]
+        results, timings = None, None
+        if missing:
+            results, timings = await inference_executor.run(_generate_sync, doc_id, section_id, missing)
+            print(f"Generated {missing} for {section_id} "
+                  f"(queue {timings['queue_wait']}s, compute {timings['compute']}s)")
+        else:
+            print(f"Served '{option}' for {section_id} from cache")
         
-        return GenerateResponse(**response_data)
+        return GenerateResponse(
+            **_generate_response_data(doc_id, section_id, results, cached),
+            timings=InferenceTimings(**timings) if timings else None
+        )
     
+    except QueueFullError as e:
+        raise _queue_full_exception(e)
+    except LLMBackendError as e:
+        raise _llm_unavailable_exception(e)
+    except DeadlineExceeded as e:
+        raise _deadline_exception(e)
     except Exception as e:
         print(f"Error in generate: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating output: {str(e)}")
@@ -225,27 +575,243 @@ async def ask_question(request: AskRequest):
     """
     Ask a free-form question about the textbook
     """
-    if not rag_service.is_ready():
-        raise HTTPException(
-            status_code=400,
-            detail="System not ready. Please upload a textbook first."
-        )
+    doc_id = _resolve_document(request.doc_id)
     
     try:
         print(f"Answering question: {request.question}")
-        result = rag_service.ask_question(request.question)
+        vector, hit = await run_in_threadpool(rag_service.lookup_answer, request.question, doc_id)
+        if hit:
+            print(f"Semantic cache hit ({hit['similarity']}): '{hit['question']}'")
+            return AskResponse(
+                doc_id=doc_id,
+                question=request.question,
+                answer=hit['value']['answer'],
+                sources=hit['value'].get('sources'),
+                cached=True,
+                similarity=hit['similarity']
+            )
+        
+        result, timings = await inference_executor.run(rag_service.ask_question, request.question, vector, doc_id)
+        rag_service.remember_answer(request.question, vector, result, doc_id)
         
         return AskResponse(
+            doc_id=doc_id,
             question=request.question,
             answer=result['answer'],
-            sources=result.get('sources')
+            sources=result.get('sources'),
+            timings=InferenceTimings(**timings)
         )
     
+    except QueueFullError as e:
+        raise _queue_full_exception(e)
+    except LLMBackendError as e:
+        raise _llm_unavailable_exception(e)
+    except DeadlineExceeded as e:
+        raise _deadline_exception(e)
     except Exception as e:
         print(f"Error in ask: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error answering question: {str(e)}")
 
 
+@app.post("/generate/stream")
+async def generate_outputs_stream(request: GenerateRequest):
+    """
+    Stream section outputs as Server-Sent Events.
+    Events: queued, sources, token, artifact, done (GenerateResponse fields), error
+    """
+    doc_id = _resolve_document(request.doc_id)
+    
+    option = request.option.lower()
+    if option not in OPTION_ARTIFACTS:
+        raise HTTPException(status_code=400, detail=f"Unknown option: {request.option}")
+    
+    section_id = request.section_id
+    artifacts = OPTION_ARTIFACTS[option]
+    cached = await run_in_threadpool(rag_service.get_cached_artifacts, section_id, artifacts, doc_id)
+    missing = [a for a in artifacts if a not in cached]
+    
+    channel = EventChannel(asyncio.get_running_loop())
+    task = None
+    if missing:
+        try:
+            task = inference_executor.submit(_generate_stream_sync, doc_id, section_id, missing, channel)
+        except QueueFullError as e:
+            raise _queue_full_exception(e)
+    
+    # Cached artifacts go out first, ahead of anything still being generated
+    for artifact, value in cached.items():
+        channel.emit('artifact', {'artifact': artifact, 'value': value, 'cached': True})
+    if task is None:
+        channel.close()
+    
+    def finalize(results, timings):
+        return {**_generate_response_data(doc_id, section_id, results, cached), 'timings': timings}
+    
+    return await _sse_response(channel, task, finalize)
+
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: AskRequest):
+    """
+    Stream the answer to a question as Server-Sent Events.
+    Events: queued, sources, token, done (AskResponse fields), error
+    """
+    doc_id = _resolve_document(request.doc_id)
+    
+    print(f"Streaming answer to question: {request.question}")
+    vector, hit = await run_in_threadpool(rag_service.lookup_answer, request.question, doc_id)
+    channel = EventChannel(asyncio.get_running_loop())
+    
+    if hit:
+        # Replay the cached answer as a single token
+        print(f"Semantic cache hit ({hit['similarity']}): '{hit['question']}'")
+        answer = hit['value']
+        channel.emit('sources', {'sources': answer.get('sources')})
+        channel.emit('token', {'text': answer['answer']})
+        channel.close()
+        
+        def finalize_hit(result, timings):
+            return {"doc_id": doc_id, "question": request.question, "answer": answer['answer'], "sources": answer.get('sources'),
+                    "cached": True, "similarity": hit['similarity'], "timings": None}
+        
+        return await _sse_response(channel, finalize=finalize_hit)
+    
+    try:
+        task = inference_executor.submit(_ask_stream_sync, doc_id, request.question, vector, channel)
+    except QueueFullError as e:
+        raise _queue_full_exception(e)
+    
+    return await _sse_response(channel, task)
+
+
+# /ask/batch: questions per request, and generations one batch runs at once
+ASK_BATCH_MAX = int(os.getenv("ASK_BATCH_MAX", "50"))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "0")) or inference_executor.max_workers
+
+
+async def _run_when_admitted(fn: Callable, *args):
+    """inference_executor.run, waiting for a free queue slot instead of failing with 429"""
+    while True:
+        try:
+            return await inference_executor.run(fn, *args)
+        except QueueFullError as e:
+            await asyncio.sleep(min(e.retry_after, 5))
+
+
+@app.post("/ask/batch")
+async def ask_questions_batch(request: AskBatchRequest):
+    """
+    Answer many questions about a textbook, streamed as Server-Sent Events.
+    All questions are embedded in one batch and retrieved with one
+    multi-query search; context chunks shared between questions are read
+    once. Cached answers are sent first, then each generated answer as soon
+    as it finishes, with at most ASK_BATCH_CONCURRENCY generations at once.
+    Events: answer (AskResponse fields plus index), error (index, detail), done
+    """
+    doc_id = _resolve_document(request.doc_id)
+    
+    questions = [q.strip() for q in request.questions]
+    if not questions or not all(questions):
+        raise HTTPException(status_code=400, detail="Questions must be a non-empty list of non-empty strings")
+    if len(questions) > ASK_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {ASK_BATCH_MAX} questions per batch")
+    
+    started = time.perf_counter()
+    try:
+        print(f"Answering batch of {len(questions)} questions")
+        vectors, hits = await run_in_threadpool(rag_service.lookup_answers, questions, doc_id)
+        
+        # Repeated questions are answered once
+        indexes: Dict[str, List[int]] = {}
+        for i, (question, hit) in enumerate(zip(questions, hits)):
+            if hit is None:
+                indexes.setdefault(question, []).append(i)
+        unique = list(indexes)
+        prepared = await run_in_threadpool(
+            rag_service.prepare_question_prompts, unique, [vectors[indexes[q][0]] for q in unique], doc_id
+        ) if unique else []
+    except Exception as e:
+        print(f"Error in ask batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error answering questions: {str(e)}")
+    
+    semaphore = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+    
+    async def answer(question: str, prompt: dict):
+        async with semaphore:
+            try:
+                result, timings = await _run_when_admitted(rag_service.answer_prepared, prompt)
+                return question, result, timings, None
+            except Exception as e:
+                return question, None, None, e
+    
+    async def event_stream():
+        counts = {'cached': 0, 'generated': 0, 'failed': 0}
+        tasks = []
+        try:
+            for i, hit in enumerate(hits):
+                if hit is not None:
+                    counts['cached'] += 1
+                    yield format_sse('answer', {
+                        "index": i, "doc_id": doc_id, "question": questions[i],
+                        "answer": hit['value']['answer'], "sources": hit['value'].get('sources'),
+                        "cached": True, "similarity": hit['similarity'], "timings": None
+                    })
+            
+            tasks = [asyncio.ensure_future(answer(q, p)) for q, p in zip(unique, prepared)]
+            for next_done in asyncio.as_completed(tasks):
+                question, result, timings, error = await next_done
+                if error is not None:
+                    print(f"Error answering '{question}': {str(error)}")
+                    for i in indexes[question]:
+                        counts['failed'] += 1
+                        yield format_sse('error', {"index": i, "question": question, "detail": str(error)})
+                    continue
+                
+                rag_service.remember_answer(question, vectors[indexes[question][0]], result, doc_id)
+                for i in indexes[question]:
+                    counts['generated'] += 1
+                    yield format_sse('answer', {
+                        "index": i, "doc_id": doc_id, "question": question,
+                        "answer": result['answer'], "sources": result.get('sources'),
+                        "cached": False, "similarity": None, "timings": timings
+                    })
+            
+            yield format_sse('done', {
+                "doc_id": doc_id, "questions": len(questions), **counts,
+                "seconds": round(time.perf_counter() - started, 3)
+            })
+        finally:
+            # Client went away: drop the generations that have not started
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Queue/latency metrics for the inference workers, cache counters, index
+    residency and embedding throughput
+    """
+    embeddings_stats = getattr(rag_service.embeddings, "stats", None)
+    return {
+        "inference": inference_executor.stats(),
+        "library": rag_service.library.stats(),
+        "result_cache": rag_service.result_cache.stats(),
+        "semantic_cache": rag_service.semantic_cache.stats(),
+        "embedding_store": rag_service.embedding_store.stats(),
+        "embeddings": embeddings_stats() if embeddings_stats else None,
+        "warmup": warmup_scheduler.stats(),
+        "llm": llm_backend.stats(),
+        "startup": startup_manager.components(),
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
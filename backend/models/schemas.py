@@ -11,22 +11,44 @@ class SectionInfo(BaseModel):
 class UploadResponse(BaseModel):
     status: str
     message: str
+    doc_id: Optional[str] = None  # library id of the textbook
     textbook_name: str
     total_chunks: int
+    chunks_embedded: Optional[int] = None  # chunks run through the embeddings model
+    chunks_reused: Optional[int] = None  # chunks whose stored vectors were reused
     sections: List[SectionInfo]
 
 
+class DocumentInfo(BaseModel):
+    doc_id: str
+    textbook_name: str
+    total_chunks: int
+    section_count: int
+    resident: bool  # index currently loaded in memory
+    index_type: str = "flat"  # flat, hnsw, ivf or ivfpq
+
+
+class SectionTextResponse(BaseModel):
+    doc_id: str
+    section_id: str
+    title: str
+    text: str  # full section body
+
+
 class StatusResponse(BaseModel):
     ready: bool
+    doc_id: Optional[str] = None
     textbook_name: Optional[str]
     total_chunks: Optional[int]
     sections: Optional[List[SectionInfo]]
+    documents: Optional[List[DocumentInfo]] = None  # every textbook in the library
     message: str
 
 
 class GenerateRequest(BaseModel):
     section_id: str  # Changed from chapter to section_id
     option: str  # summary, conceptmap, tricks, all
+    doc_id: Optional[str] = None  # textbook to use (default: most recent upload)
 
 
 class QnAItem(BaseModel):
@@ -34,20 +56,57 @@ class QnAItem(BaseModel):
     answer: str
 
 
+class InferenceTimings(BaseModel):
+    queue_wait: float  # seconds spent waiting for a model worker
+    compute: float  # seconds spent generating
+
+
 class GenerateResponse(BaseModel):
+    doc_id: Optional[str] = None
     section_id: str  # Changed from chapter
     section_title: str
     summary: Optional[str] = None
     concept_map: Optional[str] = None
     tricks: Optional[str] = None
     qna: Optional[List[QnAItem]] = None
+    cached: Optional[List[str]] = None  # fields served from the result cache
+    timings: Optional[InferenceTimings] = None
 
 
 class AskRequest(BaseModel):
     question: str
+    doc_id: Optional[str] = None  # textbook to use (default: most recent upload)
 
 
 class AskResponse(BaseModel):
+    doc_id: Optional[str] = None
     question: str
     answer: str
     sources: Optional[List[str]] = None
+    cached: bool = False  # answered from the semantic cache
+    similarity: Optional[float] = None  # cosine similarity to the cached question
+    timings: Optional[InferenceTimings] = None
+
+
+class AskBatchRequest(BaseModel):
+    questions: List[str]
+    doc_id: Optional[str] = None  # textbook to use (default: most recent upload)
+
+
+class UploadJobResponse(BaseModel):
+    job_id: str
+    status: str
+    message: str
+    textbook_name: str
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    filename: str
+    status: str  # queued, running, completed, failed
+    stage: Optional[str] = None  # extract, sections, embed, persist
+    percent: float
+    stage_timings: Dict[str, float]
+    elapsed: float
+    error: Optional[str] = None
+    result: Optional[UploadResponse] = None
@@ -0,0 +1,109 @@
+"""
+On-disk docstore for a textbook's chunks
+
+LangChain's FAISS.save_local pickles the whole docstore, so loading a book
+unpickles every chunk's text and metadata into each worker process.
+ChunkStore keeps chunks in a read-only SQLite file keyed by their position
+in the FAISS index and fetches them on demand: only the chunks a query
+returns are ever read, and all uvicorn workers share the file through the
+OS page cache.
+
+Together with a memory-mapped index (index_factory.read_index) this makes
+opening a textbook nearly constant-time regardless of its size.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Dict, List, Union
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import Docstore
+
+
+def write_chunk_store(path: str, vectorstore):
+    """Write a vectorstore's chunks to a new SQLite file, ordered by index position"""
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute(
+            "CREATE TABLE chunks ("
+            " position INTEGER PRIMARY KEY,"
+            " text TEXT NOT NULL,"
+            " metadata TEXT NOT NULL,"
+            " section_id TEXT)"
+        )
+
+        def rows():
+            for position in range(vectorstore.index.ntotal):
+                doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+                yield (position, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False),
+                       doc.metadata.get('section_id'))
+
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows())
+        conn.execute("CREATE INDEX chunks_section ON chunks (section_id, position)")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+class PositionIds(Mapping):
+    """index_to_docstore_id for a ChunkStore: position i has docstore id str(i)"""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return str(position)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+
+class ChunkStore(Docstore):
+    """Read-only LangChain docstore backed by a chunks SQLite file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, metadata FROM chunks WHERE position = ?", (int(search),)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()
+        return count
+
+    def section_positions(self) -> Dict[str, np.ndarray]:
+        """section_id -> sorted index positions of its chunks"""
+        grouped: Dict[str, List[int]] = {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT section_id, position FROM chunks WHERE section_id IS NOT NULL "
+                "ORDER BY section_id, position"
+            ).fetchall()
+        for section_id, position in rows:
+            grouped.setdefault(section_id, []).append(position)
+        return {s: np.array(p, dtype='int64') for s, p in grouped.items()}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,161 @@
+"""
+Context assembly for LLM prompts
+
+Prompts used to take the first 800 characters of each of the top 3 chunks.
+Neighbouring chunks overlap (the chunker repeats up to 30 tokens of whole
+sentences), so the same sentences were often prefilled twice, and the cut
+fell mid-sentence. ContextPacker instead:
+
+- drops duplicate chunks
+- merges chunks that are adjacent in the same section (consecutive
+  chunk_id) into one span, removing the words they share
+- fills a token budget with whole spans in relevance order, skipping a
+  span that does not fit so smaller, lower-ranked ones can still use the
+  room; what is left then takes the leading sentences of the best-ranked
+  skipped span
+
+The budget is what is left of the LLM's context window after the prompt
+template, its other inputs and the tokens reserved for the answer, capped
+at max_context_tokens. Tokens are counted with the service's token counter
+(the embedding model's tokenizer): neither GPT4All nor an OpenAI-compatible
+server exposes the LLM's tokenizer, which may need more tokens for the same
+text. The count is therefore only an estimate of the LLM's tokens, and the
+window left after the answer is divided by token_margin (default 1.25) to
+keep a safety margin for the difference.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+from langchain.prompts import PromptTemplate
+
+from utils.token_chunker import counted_sentences
+
+
+class Span:
+    """Text of one or more adjacent chunks, ranked by its most relevant chunk"""
+
+    __slots__ = ('words', 'docs', 'rank')
+
+    def __init__(self, words: List[str], doc: Document, rank: int):
+        self.words = words
+        self.docs = [doc]
+        self.rank = rank
+
+    @property
+    def text(self) -> str:
+        return ' '.join(self.words)
+
+    def extend(self, words: List[str], doc: Document, rank: int):
+        """Append the next chunk, skipping the words it repeats from this span's end"""
+        self.words.extend(words[_overlap(self.words, words):])
+        self.docs.append(doc)
+        self.rank = min(self.rank, rank)
+
+
+class ContextPacker:
+    def __init__(self, counter, context_window: int = 2048, answer_tokens: int = 512,
+                 max_context_tokens: Optional[int] = 600, token_margin: float = 1.25):
+        """
+        counter: token counter (see utils/token_chunker.py)
+        context_window: LLM context length in tokens
+        answer_tokens: tokens kept free for the generated answer
+        max_context_tokens: cap on the retrieved context, in counter tokens (None: fill the window)
+        token_margin: most LLM tokens expected per counter token (1.0 if counter is the LLM's tokenizer)
+        """
+        self.counter = counter
+        self.context_window = context_window
+        self.answer_tokens = answer_tokens
+        self.max_context_tokens = max_context_tokens
+        self.token_margin = token_margin
+
+    def budget(self, prompt: PromptTemplate, inputs: Dict) -> int:
+        """Counter tokens available for the context of a prompt (see token_margin)"""
+        (prompt_tokens,) = self.counter.count([prompt.format(**dict(inputs, context=''))])
+        # Prompt and context, counted with the counter, must fit the window left
+        # after the answer once scaled to the LLM's tokens
+        budget = int((self.context_window - self.answer_tokens) / self.token_margin) - prompt_tokens
+        if self.max_context_tokens is not None:
+            budget = min(budget, self.max_context_tokens)
+        return max(0, budget)
+
+    def pack(self, docs: List[Document], budget: int) -> Tuple[str, List[Document]]:
+        """
+        Context text from ranked chunks (best first) within budget tokens
+        Returns (context, chunks that contributed to it).
+        """
+        spans = merge_spans(docs)
+        parts, used, skipped = [], [], []  # parts: (rank, text)
+        remaining = budget
+        for span, tokens in zip(spans, self.counter.count([span.text for span in spans])):
+            if tokens <= remaining:
+                parts.append((span.rank, span.text))
+                used.extend(span.docs)
+                remaining -= tokens
+            else:
+                skipped.append(span)
+
+        if skipped and remaining > 0:
+            # No later span fits whole: as many leading sentences of the best
+            # skipped one as still fit (only a sentence longer than the whole
+            # budget is cut between words)
+            span = skipped[0]
+            head = []
+            for sentence, sentence_tokens in counted_sentences(span.words, self.counter, budget):
+                if sentence_tokens > remaining:
+                    break
+                head.append(sentence)
+                remaining -= sentence_tokens
+            if head:
+                parts.append((span.rank, ' '.join(head)))
+                used.extend(span.docs[:1])
+        parts.sort(key=lambda part: part[0])
+
+        # In retrieval order, each once
+        used_ids = {id(doc) for doc in used}
+        ordered = []
+        for doc in docs:
+            if id(doc) in used_ids:
+                used_ids.remove(id(doc))
+                ordered.append(doc)
+        return "\n\n".join(text for _, text in parts), ordered
+
+
+def merge_spans(docs: List[Document]) -> List[Span]:
+    """Deduplicated spans of adjacent chunks, most relevant first"""
+    seen = set()
+    ranked = []
+    for rank, doc in enumerate(docs):
+        if doc.page_content in seen:
+            continue
+        seen.add(doc.page_content)
+        ranked.append((rank, doc))
+
+    def position(item):
+        meta = item[1].metadata
+        return str(meta.get('section_id')), meta.get('chunk_id')
+
+    spans, previous = [], None
+    # Chunks without a chunk_id cannot be placed, so each is its own span
+    placed = sorted((item for item in ranked if isinstance(item[1].metadata.get('chunk_id'), int)), key=position)
+    for rank, doc in placed:
+        section, chunk_id = position((rank, doc))
+        if previous is not None and previous[0] == section and previous[1] == chunk_id - 1:
+            spans[-1].extend(doc.page_content.split(), doc, rank)
+        else:
+            spans.append(Span(doc.page_content.split(), doc, rank))
+        previous = (section, chunk_id)
+    spans.extend(Span(doc.page_content.split(), doc, rank)
+                 for rank, doc in ranked if not isinstance(doc.metadata.get('chunk_id'), int))
+    return sorted(spans, key=lambda span: span.rank)
+
+
+def _overlap(head: List[str], tail: List[str]) -> int:
+    """Length of the longest suffix of head that is also a prefix of tail"""
+    if not head or not tail:
+        return 0
+    limit = min(len(head), len(tail))
+    first = tail[0]
+    for start in range(len(head) - limit, len(head)):
+        if head[start] == first and head[start:] == tail[:len(head) - start]:
+            return len(head) - start
+    return 0
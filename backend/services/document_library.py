@@ -0,0 +1,509 @@
+"""
+Library of indexed textbooks
+
+Every uploaded textbook gets a doc id (derived from its content hash) and its
+own directory under storage/library/<doc_id>/ with a FAISS index and
+metadata. A small JSON catalog lists all documents so /status and section
+lookups never need to load an index. Indexes are loaded lazily on first use
+and kept in an LRU bounded by a memory budget, so many books can be served
+without loading all of them at startup. A cold document is loaded outside
+the library lock (behind a lock of its own), so requests on other documents
+are not held up by it. Callers use an index inside checkout(); an evicted or
+replaced index is closed once the last of them is done with it.
+
+Each document directory holds:
+- index.faiss: the vector index, opened memory-mapped
+- chunks.sqlite3: chunk text and metadata by index position (ChunkStore),
+  read on demand
+- lexical.sqlite3: BM25 inverted index over the same positions (LexicalIndex)
+- sections.txt: section bodies, read one at a time by offset
+- manifest.json: versioned metadata (see services/manifest.py)
+
+Directories written by older versions (a pickled LangChain faiss_index/ and
+metadata.pkl) are converted on first load, reading the pickles with a
+restricted unpickler.
+"""
+import contextlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import faiss
+from langchain_community.vectorstores import FAISS
+
+from services import index_factory, manifest as manifest_io
+from services.chunk_store import ChunkStore, PositionIds, write_chunk_store
+from services.lexical_index import LexicalIndex, vectorstore_documents, write_lexical_index
+from services.section_index import SectionIndex
+
+
+class DocumentNotFoundError(Exception):
+    """Raised when a doc id is not in the library"""
+    pass
+
+
+class TextbookIndex:
+    """A loaded textbook: vectorstore, section partitions and metadata"""
+
+    def __init__(self, doc_id: str, textbook_name: str, doc_hash: str,
+                 sections: List[Dict], vectorstore, search_params: Optional[Dict] = None,
+                 sections_path: Optional[str] = None, lexical: Optional[LexicalIndex] = None):
+        """
+        sections: manifest entries (no bodies)
+        search_params: nprobe / ef_search for approximate indexes
+        sections_path: sections.txt holding the section bodies
+        lexical: BM25 index over the chunks (None: dense retrieval only)
+        """
+        self.doc_id = doc_id
+        self.textbook_name = textbook_name
+        self.doc_hash = doc_hash
+        self.sections = sections
+        self.sections_path = sections_path
+        self.vectorstore = vectorstore
+        self.lexical = lexical
+        index_factory.set_search_params(vectorstore.index, **(search_params or {}))
+        self.section_index = SectionIndex(vectorstore)
+        self._base_bytes = self._estimate_memory()
+        self.users = 0  # checkouts in progress
+        self.retired = False  # evicted or replaced: close when users drops to 0
+
+    @property
+    def memory_bytes(self) -> int:
+        """Resident size, including the section partitions built so far"""
+        return self._base_bytes + self.section_index.partition_bytes
+
+    @property
+    def total_chunks(self) -> int:
+        return self.vectorstore.index.ntotal
+
+    @property
+    def index_type(self) -> str:
+        return index_factory.index_type_of(self.vectorstore.index)
+
+    def section_text(self, section_id: str) -> Optional[str]:
+        """Full text of one section, read from disk (None if unknown)"""
+        for section in self.sections:
+            if section['id'] == section_id:
+                if self.sections_path is None or 'offset' not in section:
+                    return section.get('content')
+                return manifest_io.read_section_body(self.sections_path, section)
+        return None
+
+    def close(self):
+        """Close the chunk store and lexical index connections"""
+        close = getattr(self.vectorstore.docstore, 'close', None)
+        if close is not None:
+            close()
+        if self.lexical is not None:
+            self.lexical.close()
+
+    def _estimate_memory(self) -> int:
+        """Approximate size of the index plus any chunk text held in memory"""
+        vector_bytes = index_factory.memory_bytes(self.vectorstore.index)
+        # A ChunkStore keeps chunk text on disk
+        docs = getattr(self.vectorstore.docstore, '_dict', {})
+        text_bytes = sum(len(doc.page_content) for doc in docs.values())
+        return vector_bytes + text_bytes
+
+
+class DocumentLibrary:
+    CATALOG_FILE = "catalog.json"
+    INDEX_FILE = "index.faiss"
+    CHUNKS_FILE = "chunks.sqlite3"
+    LEXICAL_FILE = "lexical.sqlite3"
+    LEGACY_INDEX_DIR = "faiss_index"  # pickled LangChain save_local output
+    LEGACY_METADATA_FILE = "metadata.pkl"
+
+    def __init__(self, root_dir: str, embeddings, memory_budget_bytes: int = 1024 * 1024 * 1024,
+                 nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                 mmap: bool = True):
+        """
+        root_dir: directory holding one sub-directory per document
+        embeddings: LangChain embeddings used to load indexes
+        memory_budget_bytes: resident indexes beyond this are evicted (least recently used first)
+        nprobe / ef_search: query-time search breadth of IVF / HNSW indexes
+        mmap: memory-map indexes instead of reading them into memory
+        """
+        self.root_dir = root_dir
+        self.embeddings = embeddings
+        self.memory_budget_bytes = memory_budget_bytes
+        self.search_params = {'nprobe': nprobe, 'ef_search': ef_search}
+        self.mmap = mmap
+        self.catalog: Dict[str, Dict] = {}
+        self.default_doc_id = None  # most recently ingested document
+        self._resident = OrderedDict()  # doc_id -> TextbookIndex
+        self._lock = threading.RLock()
+        self._doc_locks: Dict[str, threading.Lock] = {}  # serialize loading / replacing one document
+        self.loads = 0
+        self.evictions = 0
+
+        os.makedirs(root_dir, exist_ok=True)
+        self._read_catalog()
+
+    # ---------- catalog ----------
+
+    def _catalog_path(self) -> str:
+        return os.path.join(self.root_dir, self.CATALOG_FILE)
+
+    def _read_catalog(self):
+        path = self._catalog_path()
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.catalog = {doc['doc_id']: doc for doc in data.get('documents', [])}
+        self.default_doc_id = data.get('default_doc_id')
+
+    def _write_catalog(self):
+        """Persist the catalog atomically (caller holds the lock)"""
+        path = self._catalog_path()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'default_doc_id': self.default_doc_id,
+                'documents': list(self.catalog.values()),
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def doc_dir(self, doc_id: str) -> str:
+        return os.path.join(self.root_dir, doc_id)
+
+    def list_documents(self) -> List[Dict]:
+        """Catalog entries, newest first"""
+        with self._lock:
+            docs = [dict(doc, resident=doc['doc_id'] in self._resident) for doc in self.catalog.values()]
+        return sorted(docs, key=lambda d: d.get('created_at', 0), reverse=True)
+
+    def info(self, doc_id: str) -> Optional[Dict]:
+        """Catalog entry for a document (no index load)"""
+        with self._lock:
+            return self.catalog.get(doc_id)
+
+    def resolve(self, doc_id: Optional[str] = None) -> Optional[str]:
+        """Map an optional doc id to a known one (default: most recent upload)"""
+        with self._lock:
+            if doc_id is None:
+                return self.default_doc_id if self.default_doc_id in self.catalog else None
+            return doc_id if doc_id in self.catalog else None
+
+    # ---------- add / remove ----------
+
+    def add(self, doc_id: str, textbook_name: str, doc_hash: str,
+            sections: List[Dict], vectorstore, section_bodies_path: Optional[str] = None,
+            lexical_path: Optional[str] = None) -> TextbookIndex:
+        """
+        Persist a newly built index and make it the default document
+        sections: either with 'content', or already located in section_bodies_path
+                  (offset / length / checksum, as DocumentStream writes them)
+        lexical_path: BM25 index built alongside the vectorstore (built here if omitted)
+        """
+        doc_dir = self.doc_dir(doc_id)
+        # Build in a staging directory, then swap, so readers never see a partial index
+        staging_dir = doc_dir + ".staging"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+
+        faiss.write_index(vectorstore.index, os.path.join(staging_dir, self.INDEX_FILE))
+        write_chunk_store(os.path.join(staging_dir, self.CHUNKS_FILE), vectorstore)
+        if lexical_path:
+            shutil.move(lexical_path, os.path.join(staging_dir, self.LEXICAL_FILE))
+        else:
+            write_lexical_index(os.path.join(staging_dir, self.LEXICAL_FILE), vectorstore_documents(vectorstore))
+        sections_path = os.path.join(staging_dir, manifest_io.SECTIONS_FILE)
+        if section_bodies_path:
+            shutil.move(section_bodies_path, sections_path)
+        else:
+            sections = manifest_io.write_section_bodies(sections_path, sections)
+        manifest = self._write_manifest(staging_dir, {
+            'doc_id': doc_id,
+            'textbook_name': textbook_name,
+            'doc_hash': doc_hash,
+            'total_chunks': vectorstore.index.ntotal,
+            'index_type': index_factory.index_type_of(vectorstore.index),
+            'created_at': time.time(),
+            'sections': manifest_io.manifest_sections(sections),
+        })
+
+        with self._doc_lock(doc_id), self._lock:
+            shutil.rmtree(doc_dir, ignore_errors=True)
+            os.replace(staging_dir, doc_dir)
+            # Serve from the files just written, not the in-memory build
+            textbook = self._open(doc_id, manifest)
+            self.catalog[doc_id] = self._catalog_entry(manifest)
+            self.default_doc_id = doc_id
+            self._write_catalog()
+            previous = self._resident.pop(doc_id, None)
+            if previous is not None:
+                self._retire(previous)
+            self._make_resident(textbook)
+
+        return textbook
+
+    def remove(self, doc_id: str):
+        """Delete a document and its index from disk"""
+        with self._doc_lock(doc_id):
+            with self._lock:
+                if doc_id not in self.catalog:
+                    raise DocumentNotFoundError(doc_id)
+                del self.catalog[doc_id]
+                textbook = self._resident.pop(doc_id, None)
+                if textbook is not None:
+                    self._retire(textbook)
+                if self.default_doc_id == doc_id:
+                    newest = max(self.catalog.values(), key=lambda d: d.get('created_at', 0), default=None)
+                    self.default_doc_id = newest['doc_id'] if newest else None
+                self._write_catalog()
+                self._doc_locks.pop(doc_id, None)
+            shutil.rmtree(self.doc_dir(doc_id), ignore_errors=True)
+
+    # ---------- resident indexes ----------
+
+    def _doc_lock(self, doc_id: str) -> threading.Lock:
+        with self._lock:
+            return self._doc_locks.setdefault(doc_id, threading.Lock())
+
+    @contextlib.contextmanager
+    def checkout(self, doc_id: str):
+        """Loaded index for a document (loaded from disk if needed), kept open for the block"""
+        textbook = self._acquire(doc_id)
+        try:
+            yield textbook
+        finally:
+            self._release(textbook)
+
+    def _acquire(self, doc_id: str) -> TextbookIndex:
+        textbook = self._checkout_resident(doc_id)
+        if textbook is not None:
+            return textbook
+
+        # Load outside the library lock; concurrent requests for this document
+        # wait on its own lock for the one load
+        with self._doc_lock(doc_id):
+            textbook = self._checkout_resident(doc_id)
+            if textbook is not None:
+                return textbook
+            textbook = self._load(doc_id)
+            with self._lock:
+                if doc_id not in self.catalog:
+                    # Removed while loading
+                    textbook.close()
+                    raise DocumentNotFoundError(doc_id)
+                self.loads += 1
+                self._make_resident(textbook)
+                textbook.users += 1
+                return textbook
+
+    def _checkout_resident(self, doc_id: str) -> Optional[TextbookIndex]:
+        """The resident index of a document with its user count taken, or None if not resident"""
+        with self._lock:
+            if doc_id not in self.catalog:
+                raise DocumentNotFoundError(doc_id)
+            textbook = self._resident.get(doc_id)
+            if textbook is None:
+                return None
+            self._resident.move_to_end(doc_id)
+            textbook.users += 1
+            return textbook
+
+    def _release(self, textbook: TextbookIndex):
+        with self._lock:
+            textbook.users -= 1
+            if textbook.retired:
+                if textbook.users == 0:
+                    textbook.close()
+            else:
+                # Section partitions built during the checkout count against the budget
+                self._evict_over_budget()
+
+    def _load(self, doc_id: str) -> TextbookIndex:
+        """Read one document's manifest and open its index from disk"""
+        start = time.perf_counter()
+        doc_dir = self.doc_dir(doc_id)
+        if os.path.isdir(os.path.join(doc_dir, self.LEGACY_INDEX_DIR)):
+            self._convert_legacy_index(doc_dir)
+        if not os.path.exists(os.path.join(doc_dir, manifest_io.MANIFEST_FILE)):
+            self._convert_legacy_metadata(doc_id)
+
+        manifest = manifest_io.read_manifest(doc_dir)
+        if self.LEXICAL_FILE not in manifest.get('files', {}):
+            manifest = self._add_lexical_index(doc_id, manifest)
+        manifest_io.check_file_sizes(doc_dir, manifest)
+        textbook = self._open(doc_id, manifest)
+        print(f"Loaded index {doc_id}: {textbook.textbook_name} ({textbook.total_chunks} chunks, {textbook.index_type}, "
+              f"{textbook.memory_bytes / 1e6:.1f} MB) in {time.perf_counter() - start:.2f}s")
+        return textbook
+
+    def _open(self, doc_id: str, manifest: Dict) -> TextbookIndex:
+        """Map a document's index and open its chunk store"""
+        doc_dir = self.doc_dir(doc_id)
+        index = index_factory.read_index(os.path.join(doc_dir, self.INDEX_FILE),
+                                         manifest.get('index_type'), mmap=self.mmap)
+        vectorstore = FAISS(
+            self.embeddings, index,
+            ChunkStore(os.path.join(doc_dir, self.CHUNKS_FILE)),
+            PositionIds(index.ntotal)
+        )
+        lexical_path = os.path.join(doc_dir, self.LEXICAL_FILE)
+        return TextbookIndex(
+            doc_id, manifest['textbook_name'], manifest['doc_hash'], manifest['sections'], vectorstore,
+            search_params=self.search_params,
+            sections_path=os.path.join(doc_dir, manifest_io.SECTIONS_FILE),
+            lexical=LexicalIndex(lexical_path) if os.path.exists(lexical_path) else None
+        )
+
+    def _write_manifest(self, doc_dir: str, manifest: Dict) -> Dict:
+        """Record data file sizes and checksums, then write manifest.json"""
+        manifest['files'] = {
+            name: manifest_io.file_digest(os.path.join(doc_dir, name))
+            for name in (self.INDEX_FILE, self.CHUNKS_FILE, self.LEXICAL_FILE, manifest_io.SECTIONS_FILE)
+            if os.path.exists(os.path.join(doc_dir, name))
+        }
+        manifest_io.write_manifest(doc_dir, manifest)
+        return manifest
+
+    @staticmethod
+    def _catalog_entry(manifest: Dict) -> Dict:
+        return {
+            'doc_id': manifest['doc_id'],
+            'textbook_name': manifest['textbook_name'],
+            'doc_hash': manifest['doc_hash'],
+            'total_chunks': manifest['total_chunks'],
+            'index_type': manifest['index_type'],
+            'sections': [
+                {'id': s['id'], 'title': s['title'], 'preview': s['preview']}
+                for s in manifest['sections']
+            ],
+            'created_at': manifest['created_at'],
+        }
+
+    # ---------- conversion of older layouts ----------
+
+    def _convert_legacy_index(self, doc_dir: str):
+        """Rewrite a pickled LangChain index as index.faiss + chunks.sqlite3"""
+        legacy_dir = os.path.join(doc_dir, self.LEGACY_INDEX_DIR)
+        index = faiss.read_index(os.path.join(legacy_dir, "index.faiss"))
+        docstore, index_to_docstore_id = manifest_io.restricted_load(
+            os.path.join(legacy_dir, "index.pkl"), manifest_io.LANGCHAIN_PICKLE_CLASSES
+        )
+        vectorstore = FAISS(self.embeddings, index, docstore, index_to_docstore_id)
+        faiss.write_index(index, os.path.join(doc_dir, self.INDEX_FILE))
+        write_chunk_store(os.path.join(doc_dir, self.CHUNKS_FILE), vectorstore)
+        shutil.rmtree(legacy_dir)
+        print(f"Converted {doc_dir} to the memory-mapped index format")
+
+    def _convert_legacy_metadata(self, doc_id: str):
+        """Replace metadata.pkl with manifest.json + sections.txt"""
+        doc_dir = self.doc_dir(doc_id)
+        legacy_path = os.path.join(doc_dir, self.LEGACY_METADATA_FILE)
+        metadata = manifest_io.restricted_load(legacy_path)
+        sections = manifest_io.write_section_bodies(
+            os.path.join(doc_dir, manifest_io.SECTIONS_FILE), metadata.get('sections', [])
+        )
+        index = index_factory.read_index(os.path.join(doc_dir, self.INDEX_FILE), mmap=self.mmap)
+        entry = self.info(doc_id) or {}
+        self._write_manifest(doc_dir, {
+            'doc_id': doc_id,
+            'textbook_name': metadata.get('textbook_name'),
+            'doc_hash': metadata.get('doc_hash') or entry.get('doc_hash'),
+            'total_chunks': metadata.get('total_chunks', index.ntotal),
+            'index_type': index_factory.index_type_of(index),
+            'created_at': entry.get('created_at', time.time()),
+            'sections': manifest_io.manifest_sections(sections),
+        })
+        os.remove(legacy_path)
+        print(f"Converted {legacy_path} to {manifest_io.MANIFEST_FILE}")
+
+    def _add_lexical_index(self, doc_id: str, manifest: Dict) -> Dict:
+        """Build the BM25 index for a document stored before it existed"""
+        doc_dir = self.doc_dir(doc_id)
+        chunks = ChunkStore(os.path.join(doc_dir, self.CHUNKS_FILE))
+        try:
+            size = len(chunks)
+            write_lexical_index(os.path.join(doc_dir, self.LEXICAL_FILE),
+                                (chunks.search(str(position)) for position in range(size)))
+        finally:
+            chunks.close()
+        print(f"Built lexical index for {doc_id} ({size} chunks)")
+        return self._write_manifest(doc_dir, manifest)
+
+    def _make_resident(self, textbook: TextbookIndex):
+        """Insert into the LRU and evict others beyond the memory budget (caller holds the lock)"""
+        self._resident[textbook.doc_id] = textbook
+        self._resident.move_to_end(textbook.doc_id)
+        self._evict_over_budget()
+
+    def _evict_over_budget(self):
+        """Evict least recently used indexes while over the memory budget (caller holds the lock)"""
+        while len(self._resident) > 1 and self.resident_bytes() > self.memory_budget_bytes:
+            evicted_id, evicted = self._resident.popitem(last=False)
+            self.evictions += 1
+            print(f"Evicted index {evicted_id} ({evicted.memory_bytes / 1e6:.1f} MB) from memory")
+            self._retire(evicted)
+
+    @staticmethod
+    def _retire(textbook: TextbookIndex):
+        """Close a textbook taken out of the library once no checkout uses it (caller holds the lock)"""
+        textbook.retired = True
+        if textbook.users == 0:
+            textbook.close()
+
+    def resident_bytes(self) -> int:
+        return sum(t.memory_bytes for t in self._resident.values())
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Change nprobe / ef_search for resident and future indexes"""
+        with self._lock:
+            if nprobe:
+                self.search_params['nprobe'] = nprobe
+            if ef_search:
+                self.search_params['ef_search'] = ef_search
+            for textbook in self._resident.values():
+                index_factory.set_search_params(textbook.vectorstore.index, **self.search_params)
+
+    def stats(self) -> Dict:
+        """Library size and residency counters"""
+        with self._lock:
+            return {
+                'documents': len(self.catalog),
+                'resident': list(self._resident.keys()),
+                'indexes': {
+                    doc_id: index_factory.describe(t.vectorstore.index)
+                    for doc_id, t in self._resident.items()
+                },
+                'search_params': dict(self.search_params),
+                'resident_bytes': self.resident_bytes(),
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+    # ---------- legacy layout ----------
+
+    def migrate_legacy(self, persist_dir: str, doc_id: str, textbook_name: str, doc_hash: str,
+                       total_chunks: int, sections: List[Dict]):
+        """Adopt a pre-library single index (storage/faiss_index + metadata.pkl) as a document"""
+        doc_dir = self.doc_dir(doc_id)
+        os.makedirs(doc_dir, exist_ok=True)
+        shutil.move(os.path.join(persist_dir, "faiss_index"), os.path.join(doc_dir, "faiss_index"))
+        shutil.move(os.path.join(persist_dir, self.LEGACY_METADATA_FILE),
+                    os.path.join(doc_dir, self.LEGACY_METADATA_FILE))
+
+        with self._lock:
+            self.catalog[doc_id] = {
+                'doc_id': doc_id,
+                'textbook_name': textbook_name,
+                'doc_hash': doc_hash,
+                'total_chunks': total_chunks,
+                'sections': [
+                    {'id': s['id'], 'title': s['title'], 'preview': s['preview']}
+                    for s in sections
+                ],
+                'created_at': time.time(),
+            }
+            if self.default_doc_id is None:
+                self.default_doc_id = doc_id
+            self._write_catalog()
@@ -0,0 +1,257 @@
+"""
+Batched, multi-threaded sentence-transformers embeddings
+
+HuggingFaceEmbeddings encodes with the library defaults: a batch size of 32
+in arrival order and whatever thread count torch picks. EmbeddingEngine
+exposes those knobs so ingestion throughput can be tuned per host:
+
+- batch_size: texts per forward pass
+- num_threads: torch intra-op threads (None leaves the torch default)
+- sort_by_length: texts are encoded longest first so each batch holds
+  similar lengths and little compute is spent on padding; vectors are
+  returned in the original order
+
+It also keeps throughput counters (chunks/sec) for logs and /metrics.
+
+The model itself runs on one of three backends (EMBED_BACKEND):
+
+- torch: full-precision PyTorch (the reference)
+- int8: PyTorch with dynamic int8 quantization of the Linear layers
+- onnx: the transformer exported once to ONNX and run with ONNX Runtime
+  (needs onnxruntime), with mean pooling done in numpy
+
+The ONNX export computes the same fp32 vectors as torch (up to rounding);
+int8 vectors differ slightly, so they are kept apart in the embedding store.
+Check the recall cost of a backend with
+benchmarks/bench_embedding_backends.py before switching.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+
+BACKENDS = ('torch', 'int8', 'onnx')
+
+
+class OnnxEncoder:
+    """SentenceTransformer.encode() look-alike running an ONNX export of the transformer"""
+
+    def __init__(self, model_name: str, export_dir: str, cache_folder: Optional[str] = None,
+                 num_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(model_name, device='cpu', cache_folder=cache_folder)
+        self.tokenizer = model.tokenizer
+        self.max_seq_length = model.max_seq_length
+
+        path = os.path.join(export_dir, "model.onnx")
+        if not os.path.exists(path):
+            print(f"Exporting {model_name} to ONNX ({path})...")
+            _export_onnx(model, path)
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True,
+               convert_to_numpy: bool = True, show_progress_bar: bool = False) -> np.ndarray:
+        pooled = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors='np'
+            )
+            inputs = {name: encoded[name].astype('int64') for name in self.input_names}
+            hidden = self.session.run(None, inputs)[0]
+
+            # Mean pooling over real tokens (as the sentence-transformers Pooling module)
+            mask = encoded['attention_mask'][..., None].astype('float32')
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+            pooled.append(vectors.astype('float32'))
+        return np.vstack(pooled)
+
+
+def _export_onnx(model, path: str):
+    """Export the transformer of a SentenceTransformer (pooling stays in numpy)"""
+    import torch
+
+    transformer = model[0].auto_model
+    sample = model.tokenizer(["export sample"], return_tensors='pt')
+    names = [n for n in ('input_ids', 'attention_mask', 'token_type_ids') if n in sample]
+    axes = {n: {0: 'batch', 1: 'sequence'} for n in names + ['last_hidden_state']}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer, tuple(sample[n] for n in names), tmp_path,
+            input_names=names, output_names=['last_hidden_state'],
+            dynamic_axes=axes, opset_version=14
+        )
+    os.replace(tmp_path, path)
+
+
+def load_encoder(model_name: str, backend: str = 'torch', device: str = 'cpu',
+                 cache_folder: Optional[str] = None, export_dir: Optional[str] = None,
+                 num_threads: Optional[int] = None):
+    """Model object with a SentenceTransformer-style encode() for the given backend"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+
+    if backend == 'onnx':
+        export_dir = export_dir or os.path.join("./models", "onnx")
+        return OnnxEncoder(model_name, os.path.join(export_dir, model_name.replace("/", "__")),
+                           cache_folder=cache_folder, num_threads=num_threads)
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device=device, cache_folder=cache_folder)
+    if backend == 'int8':
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+class EmbeddingEngine(Embeddings):
+    def __init__(self,
+                 model_name: str = "sentence-transformers/all-mpnet-base-v2",
+                 batch_size: int = 32,
+                 num_threads: Optional[int] = None,
+                 sort_by_length: bool = True,
+                 normalize: bool = True,
+                 device: str = 'cpu',
+                 cache_folder: Optional[str] = None,
+                 backend: str = 'torch',
+                 export_dir: Optional[str] = None,
+                 model=None,
+                 lazy: bool = False):
+        """
+        model_name: sentence-transformers model (also keys the embedding store)
+        batch_size: texts per forward pass
+        num_threads: torch intra-op threads (None: torch default)
+        sort_by_length: batch texts of similar length together
+        backend: 'torch', 'int8' or 'onnx' (see module docstring)
+        export_dir: where ONNX exports are kept (default ./models/onnx)
+        model: optional preloaded SentenceTransformer (skips loading model_name)
+        lazy: load the model on first use (or load()) instead of now
+        """
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.num_threads = num_threads
+        self.sort_by_length = sort_by_length
+        self.normalize = normalize
+        self.backend = backend
+        self.device = device
+        self.cache_folder = cache_folder
+        self.export_dir = export_dir
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._model = model
+
+        if model is None and not lazy:
+            self.load()
+
+        # Throughput counters
+        self.chunks = 0
+        self.batches = 0
+        self.seconds = 0.0
+        self.last_rate = 0.0  # chunks/sec of the most recent embed_documents call
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self):
+        """The encoder, loaded on first access"""
+        if self._model is None:
+            self.load()
+        return self._model
+
+    def load(self):
+        """Load the encoder if it is not loaded yet (thread-safe)"""
+        with self._load_lock:
+            if self._model is not None:
+                return
+            start = time.perf_counter()
+            if self.num_threads:
+                import torch
+                torch.set_num_threads(self.num_threads)
+            self._model = load_encoder(self.model_name, self.backend, device=self.device,
+                                       cache_folder=self.cache_folder, export_dir=self.export_dir,
+                                       num_threads=self.num_threads)
+            print(f"Embeddings model {self.model_name} ({self.backend}) loaded in "
+                  f"{time.perf_counter() - start:.1f}s")
+
+    @property
+    def cache_key(self) -> str:
+        """Embedding store key: int8 vectors are not mixed with fp32 ones"""
+        return f"{self.model_name}@int8" if self.backend == 'int8' else self.model_name
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=len(texts),
+            normalize_embeddings=self.normalize,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+
+    def embed_documents(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        Embed texts in (length-sorted) batches, returned in input order
+        batch_size: texts per forward pass for this call (default: the engine's batch_size)
+        """
+        if not texts:
+            return []
+        batch_size = max(1, batch_size or self.batch_size)
+        texts = [t.replace("\n", " ") for t in texts]
+        order = list(range(len(texts)))
+        if self.sort_by_length:
+            order.sort(key=lambda i: len(texts[i]), reverse=True)
+
+        start = time.perf_counter()
+        vectors = [None] * len(texts)
+        batches = 0
+        for b in range(0, len(order), batch_size):
+            idx = order[b:b + batch_size]
+            encoded = self._encode([texts[i] for i in idx])
+            for i, vector in zip(idx, encoded):
+                vectors[i] = vector.tolist()
+            batches += 1
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.chunks += len(texts)
+            self.batches += batches
+            self.seconds += elapsed
+            self.last_rate = len(texts) / elapsed if elapsed > 0 else 0.0
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text.replace("\n", " ")])[0].tolist()
+
+    def stats(self) -> Dict:
+        """Throughput counters and settings"""
+        with self._lock:
+            return {
+                'model': self.model_name,
+                'backend': self.backend,
+                'loaded': self.loaded,
+                'batch_size': self.batch_size,
+                'num_threads': self.num_threads,
+                'sort_by_length': self.sort_by_length,
+                'chunks': self.chunks,
+                'batches': self.batches,
+                'seconds': round(self.seconds, 3),
+                'chunks_per_sec': round(self.chunks / self.seconds, 1) if self.seconds else 0.0,
+                'last_chunks_per_sec': round(self.last_rate, 1),
+            }
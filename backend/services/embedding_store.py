@@ -0,0 +1,116 @@
+"""
+Persistent store of chunk embeddings keyed by chunk content
+
+Embedding every chunk with all-mpnet-base-v2 on CPU dominates ingestion
+time. Vectors are stored in SQLite keyed by a hash of the normalized chunk
+text (and the embeddings model), so re-uploading a corrected edition of a
+book, or a book sharing chapters with another, only embeds the chunks whose
+text actually changed.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_chunk_text(text: str) -> str:
+    """Whitespace-insensitive form of a chunk (re-extraction often shifts spacing)"""
+    return " ".join(text.split())
+
+
+def chunk_hash(text: str) -> str:
+    """Content key of a chunk"""
+    return hashlib.sha256(normalize_chunk_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    def __init__(self, db_path: str, model_name: str):
+        """
+        db_path: SQLite file holding the vectors
+        model_name: embeddings model; vectors of other models are never returned
+        """
+        self.db_path = db_path
+        self.model_name = model_name
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Stored vectors for the given chunk hashes (missing ones are left out)"""
+        hashes = list(dict.fromkeys(hashes))
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model_name, *batch]
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype='float32').tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, self.model_name, h) for h in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, List[float]]]):
+        """Store (chunk hash, vector) pairs"""
+        now = time.time()
+        rows = []
+        for h, vector in items:
+            v = np.asarray(vector, dtype='float32')
+            rows.append((self.model_name, h, v.shape[0], v.tobytes(), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def vectors(self, limit: Optional[int] = None) -> np.ndarray:
+        """Stored vectors of the current model as a float32 matrix (for benchmarks)"""
+        query = "SELECT vector FROM embeddings WHERE model = ?"
+        params = [self.model_name]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        if not rows:
+            return np.zeros((0, 0), dtype='float32')
+        return np.vstack([np.frombuffer(blob, dtype='float32') for (blob,) in rows])
+
+    def stats(self) -> Dict:
+        """Number of stored vectors for the current model"""
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)
+            ).fetchone()
+        return {'entries': count, 'model': self.model_name}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
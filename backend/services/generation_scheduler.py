@@ -0,0 +1,494 @@
+"""
+Continuous batching of concurrent LLM generations
+
+Each inference worker used to run its completion on its own, so ten
+students pressing "Generate" at once meant ten completions one after the
+other. Token-by-token decoding is memory-bound: one decode step for eight
+sequences costs little more than for one. GenerationScheduler therefore
+runs every in-flight completion in one shared batch on a single loop thread:
+
+- workers submit prompts and block on (or stream) their tokens
+- each loop iteration admits waiting requests into free batch slots
+  (prefill), then advances the whole batch by one decode step. A request
+  joins the running batch as soon as a slot frees up and leaves it when it
+  finishes, so a short answer never waits for a long summary to complete.
+- interactive requests are admitted before background (warm-up) ones;
+  background requests hold at most background_slots slots and are only
+  admitted while no interactive request is waiting
+- among requests of the same priority, the one expected to finish soonest
+  goes first (expected length is learned per label, e.g. 'answer' vs
+  'all'), and waiting earns credit (aging_tokens_per_second) so long
+  summaries are not starved by a stream of questions
+- every request may carry a deadline; a request still waiting or running
+  when it passes fails with DeadlineExceeded and frees its slot
+
+The model is anything with the batch interface below. ServerBatchModel
+drives an OpenAI-compatible server that batches internally (llama-server
+with --parallel N --cont-batching); benchmarks/fakes.SimulatedBatchModel
+simulates one for benchmarks/load_generation.py.
+
+    model.start(request)         prefill a newly admitted request
+    model.step(requests)         advance the batch: per request, a list of new
+                                 tokens (may be empty), None when it finished,
+                                 or an exception that failed it
+    model.finish(request)        release a request's resources
+
+Workers choose the priority, deadline and label of their completions with
+the generation_context() context manager; ScheduledLLM hands the scheduler
+to LangChain chains.
+"""
+import contextlib
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain.llms.base import LLM
+
+from services.inference_executor import _summarize
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_END = object()
+_context = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a generation passes its deadline before finishing"""
+
+    def __init__(self, waited: float):
+        super().__init__(f"Generation did not finish within its deadline ({waited:.1f}s)")
+        self.waited = waited
+
+
+class GenerationRequest:
+    """One completion in the scheduler: its settings, progress and token queue"""
+
+    __slots__ = ('prompt', 'stop', 'max_tokens', 'priority', 'label', 'expected', 'submitted',
+                 'deadline', 'started', 'generated', 'tokens', 'cancelled', 'error', 'handle')
+
+    def __init__(self, prompt: str, stop: Optional[List[str]], max_tokens: int, priority: int,
+                 label: Optional[str], expected: float, deadline: Optional[float]):
+        self.prompt = prompt
+        self.stop = stop
+        self.max_tokens = max_tokens
+        self.priority = priority
+        self.label = label
+        self.expected = expected
+        self.submitted = time.monotonic()
+        self.deadline = deadline
+        self.started: Optional[float] = None
+        self.generated = 0
+        self.tokens: "queue.Queue" = queue.Queue()
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self.handle: Any = None  # the model's per-request state
+
+
+@contextlib.contextmanager
+def generation_context(**options):
+    """
+    Settings for the completions submitted by the current thread
+    options: priority (INTERACTIVE / BACKGROUND), timeout (seconds, None for
+             the scheduler's default) and label (learns expected lengths)
+    """
+    previous = getattr(_context, 'options', {})
+    _context.options = dict(previous, **options)
+    try:
+        yield
+    finally:
+        _context.options = previous
+
+
+def current_generation_options() -> Dict:
+    return dict(getattr(_context, 'options', {}))
+
+
+class GenerationScheduler:
+    def __init__(self, model, max_batch_size: int = 8, max_tokens: int = 512,
+                 interactive_timeout: Optional[float] = None, background_slots: int = 1,
+                 aging_tokens_per_second: float = 20.0, batch_window_ms: float = 5.0,
+                 history_size: int = 200):
+        """
+        model: batch model (see module docstring)
+        max_batch_size: completions decoded together
+        max_tokens: default cap on generated tokens per completion
+        interactive_timeout: default deadline in seconds for interactive requests (None: none)
+        background_slots: batch slots background requests may hold
+        aging_tokens_per_second: how fast waiting requests overtake shorter ones
+        batch_window_ms: when the batch is empty, how long to wait for more
+                         prompts so they are prefilled together
+        history_size: number of recent requests kept for latency percentiles
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_tokens = max_tokens
+        self.interactive_timeout = interactive_timeout
+        self.background_slots = background_slots
+        self.aging_tokens_per_second = aging_tokens_per_second
+        self.batch_window = batch_window_ms / 1000
+
+        self._cond = threading.Condition()
+        self._pending: List[GenerationRequest] = []
+        self._active: List[GenerationRequest] = []  # only touched by the loop thread
+        self._expected: Dict[str, float] = {}  # moving average of generated tokens per label
+        self._closed = False
+
+        # Counters and recent timings
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self.cancelled = 0
+        self.tokens_generated = 0
+        self.steps = 0
+        self.batched = 0  # sum of the batch sizes of those steps
+        self.busy_seconds = 0.0
+        self._queue_waits = deque(maxlen=history_size)
+        self._latencies = deque(maxlen=history_size)
+
+        self._thread = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+        self._thread.start()
+
+    # ---------- submitting ----------
+
+    def submit(self, prompt: str, stop: Optional[List[str]] = None, max_tokens: Optional[int] = None,
+               priority: int = INTERACTIVE, timeout: Optional[float] = None,
+               label: Optional[str] = None) -> GenerationRequest:
+        """Queue a completion (callable from any thread); read its tokens with stream()"""
+        max_tokens = max_tokens or self.max_tokens
+        if timeout is None and priority == INTERACTIVE:
+            timeout = self.interactive_timeout
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Generation scheduler is shut down")
+            request = GenerationRequest(
+                prompt, stop, max_tokens, priority, label,
+                expected=self._expected.get(label, max_tokens),
+                deadline=time.monotonic() + timeout if timeout else None,
+            )
+            self._pending.append(request)
+            self._cond.notify()
+        return request
+
+    def stream(self, request: GenerationRequest) -> Iterator[str]:
+        """Tokens of a request as they are decoded; raises its error at the end"""
+        for token in iter(request.tokens.get, _END):
+            yield token
+        if request.error is not None:
+            raise request.error
+
+    def generate(self, prompt: str, **options) -> str:
+        """Submit a completion and wait for its text"""
+        request = self.submit(prompt, **options)
+        return ''.join(self.stream(request))
+
+    def cancel(self, request: GenerationRequest):
+        """Stop a request; its slot is freed at the next step"""
+        with self._cond:
+            request.cancelled = True
+            if request in self._pending:
+                self._pending.remove(request)
+                self._finish(request, None)
+                self.cancelled += 1
+
+    # ---------- batching loop ----------
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._active and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    break
+                if not self._active and self.batch_window:
+                    # Let a burst of prompts arrive so they are prefilled together
+                    until = time.monotonic() + self.batch_window
+                    while len(self._pending) < self.max_batch_size and not self._closed:
+                        remaining = until - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                now = time.monotonic()
+                self._expire_pending(now)
+                admitted = self._admit(now)
+
+            started = time.perf_counter()
+            for request in admitted:
+                request.started = time.monotonic()
+                try:
+                    self.model.start(request)
+                except Exception as e:
+                    self._release(request, e)
+                    continue
+                self._active.append(request)
+
+            self._drop_stopped(time.monotonic())
+            if self._active:
+                self._step()
+            self.busy_seconds += time.perf_counter() - started
+
+        for request in self._active:
+            self._release(request, RuntimeError("Generation scheduler is shut down"))
+        self._active = []
+
+    def _expire_pending(self, now: float):
+        """Fail waiting requests whose deadline passed (caller holds the lock)"""
+        for request in [r for r in self._pending if r.deadline is not None and now >= r.deadline]:
+            self._pending.remove(request)
+            self.expired += 1
+            self._finish(request, DeadlineExceeded(now - request.submitted))
+
+    def _admit(self, now: float) -> List[GenerationRequest]:
+        """Pick waiting requests for the free batch slots (caller holds the lock)"""
+        free = self.max_batch_size - len(self._active)
+        if free <= 0 or not self._pending:
+            return []
+        background = sum(1 for r in self._active if r.priority == BACKGROUND)
+        interactive_waiting = any(r.priority == INTERACTIVE for r in self._pending)
+
+        def key(request):
+            credit = self.aging_tokens_per_second * (now - request.submitted)
+            return request.priority, request.expected - credit
+
+        admitted = []
+        for request in sorted(self._pending, key=key):
+            if len(admitted) == free:
+                break
+            if request.priority == BACKGROUND:
+                if interactive_waiting or background >= self.background_slots:
+                    continue
+                background += 1
+            admitted.append(request)
+        for request in admitted:
+            self._pending.remove(request)
+        return admitted
+
+    def _drop_stopped(self, now: float):
+        """Remove cancelled and expired requests from the batch"""
+        for request in list(self._active):
+            if request.cancelled:
+                self._active.remove(request)
+                self.cancelled += 1
+                self._release(request, None)
+            elif request.deadline is not None and now >= request.deadline:
+                self._active.remove(request)
+                self.expired += 1
+                self._release(request, DeadlineExceeded(now - request.submitted))
+
+    def _step(self):
+        """One decode step for the whole batch"""
+        batch = list(self._active)
+        try:
+            results = self.model.step(batch)
+        except Exception as e:
+            self._active = []
+            for request in batch:
+                self._release(request, e)
+            return
+
+        decoded = 0
+        for request, result in zip(batch, results):
+            if isinstance(result, BaseException):
+                self._active.remove(request)
+                self._release(request, result)
+                continue
+            if result:
+                result = result[:request.max_tokens - request.generated]
+                for token in result:
+                    request.tokens.put(token)
+                request.generated += len(result)
+                decoded += len(result)
+            if result is None or request.generated >= request.max_tokens:
+                self._active.remove(request)
+                self._release(request, None)
+        if decoded:
+            self.steps += 1
+            self.batched += len(batch)
+            self.tokens_generated += decoded
+
+    def _release(self, request: GenerationRequest, error: Optional[BaseException]):
+        """Free a started request's model state and complete it"""
+        try:
+            self.model.finish(request)
+        except Exception as e:
+            print(f"Error releasing generation: {str(e)}")
+        with self._cond:
+            self._finish(request, error)
+
+    def _finish(self, request: GenerationRequest, error: Optional[BaseException]):
+        """Record the outcome and wake the reader (caller holds the lock)"""
+        request.error = error
+        now = time.monotonic()
+        if error is None and not request.cancelled:
+            self.completed += 1
+            self._queue_waits.append(round((request.started or now) - request.submitted, 3))
+            self._latencies.append(round(now - request.submitted, 3))
+            if request.label is not None:
+                previous = self._expected.get(request.label, request.generated)
+                self._expected[request.label] = 0.8 * previous + 0.2 * request.generated
+        elif error is not None and not isinstance(error, DeadlineExceeded):
+            self.failed += 1
+        request.tokens.put(_END)
+
+    # ---------- reporting ----------
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'active': len(self._active),
+                'waiting': len(self._pending),
+                'completed': self.completed,
+                'failed': self.failed,
+                'expired': self.expired,
+                'cancelled': self.cancelled,
+                'tokens_generated': self.tokens_generated,
+                'steps': self.steps,
+                'mean_batch_size': round(self.batched / self.steps, 2) if self.steps else 0.0,
+                'tokens_per_second': round(self.tokens_generated / self.busy_seconds, 1)
+                if self.busy_seconds else 0.0,
+                'expected_tokens': {label: round(v, 1) for label, v in self._expected.items()},
+                'queue_wait': _summarize(self._queue_waits),
+                'latency': _summarize(self._latencies),
+            }
+
+    def shutdown(self):
+        """Stop the loop; waiting and running requests fail"""
+        with self._cond:
+            self._closed = True
+            for request in self._pending:
+                self._finish(request, RuntimeError("Generation scheduler is shut down"))
+            self._pending = []
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+
+class ScheduledLLM(LLM):
+    """LangChain LLM whose completions go through a GenerationScheduler"""
+
+    scheduler: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "scheduled"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[Any] = None, **kwargs: Any) -> str:
+        stream = bool(kwargs.get('streaming')) and run_manager is not None
+        options = current_generation_options()
+        if kwargs.get('max_tokens'):
+            options['max_tokens'] = kwargs['max_tokens']
+        request = self.scheduler.submit(prompt, stop=stop, **options)
+        text = ""
+        try:
+            for token in self.scheduler.stream(request):
+                if stream:
+                    run_manager.on_llm_new_token(token)
+                text += token
+        except BaseException:
+            # e.g. the client disconnected: free the batch slot
+            self.scheduler.cancel(request)
+            raise
+        if stop:
+            for sequence in stop:
+                text = text.split(sequence)[0]
+        return text
+
+
+class _ServerStream:
+    """Tokens of one server completion, read by its own thread"""
+
+    __slots__ = ('pieces', 'tokens', 'finished', 'closed', 'error')
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.tokens: List[str] = []
+        self.finished = False
+        self.closed = False
+        self.error: Optional[BaseException] = None
+
+
+class ServerBatchModel:
+    """
+    Batch model over a ServerBackend
+
+    The server does the batching: each admitted request is streamed on its
+    own pooled connection by a reader thread, and a step collects whatever
+    tokens have arrived for each. Set the server's parallel slots (and the
+    backend's pool_size) to at least max_batch_size.
+    """
+
+    def __init__(self, backend, step_timeout: float = 0.05):
+        self.backend = backend
+        self.step_timeout = step_timeout
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def start(self, request: GenerationRequest):
+        stream = _ServerStream(self.backend.complete(request.prompt, stop=request.stop, stream=True,
+                                                     max_tokens=request.max_tokens))
+        request.handle = stream
+        threading.Thread(target=self._read, args=(stream,), daemon=True).start()
+
+    def _read(self, stream: _ServerStream):
+        try:
+            for piece in stream.pieces:
+                if stream.closed:
+                    break
+                with self._lock:
+                    stream.tokens.append(piece)
+                self._ready.set()
+        except Exception as e:
+            stream.error = e
+        finally:
+            # Closing the response stops the server decoding
+            stream.pieces.close()
+            stream.finished = True
+            self._ready.set()
+
+    def step(self, requests: List[GenerationRequest]) -> List:
+        self._ready.wait(self.step_timeout)
+        self._ready.clear()
+        results = []
+        for request in requests:
+            stream = request.handle
+            with self._lock:
+                tokens, stream.tokens = stream.tokens, []
+                finished = stream.finished
+            if tokens:
+                results.append(tokens)
+            elif finished:
+                results.append(stream.error)
+            else:
+                results.append([])
+        return results
+
+    def finish(self, request: GenerationRequest):
+        # The reader thread closes the response at its next token
+        if request.handle is not None:
+            request.handle.closed = True
+
+
+class ScheduledBackend:
+    """LLM backend that batches another backend's completions through a GenerationScheduler"""
+
+    def __init__(self, backend, scheduler: GenerationScheduler):
+        self.backend = backend
+        self.scheduler = scheduler
+        self.name = f"{backend.name}+batching"
+        self._llm = ScheduledLLM(scheduler=scheduler)
+
+    def create_llm(self) -> LLM:
+        return self._llm
+
+    def health(self) -> bool:
+        return self.backend.health()
+
+    def stats(self) -> Dict:
+        return dict(self.backend.stats(), scheduler=self.scheduler.stats())
+
+    def close(self):
+        self.scheduler.shutdown()
+        self.backend.close()
@@ -0,0 +1,130 @@
+"""
+Hybrid lexical + dense retrieval for a textbook
+
+Modes:
+- dense:     FAISS only (the previous behaviour)
+- hybrid:    BM25 and FAISS each return their top candidates; the two
+             rankings are fused with reciprocal-rank fusion (RRF), so a chunk
+             ranked well by either shows up without over-fetching from one
+- prefilter: BM25 picks the candidates and only those are scored densely
+             (their vectors are reconstructed from the index), then fused
+             with RRF. Skips the full dense search; falls back to hybrid when
+             the query has too few lexical matches
+
+Section-filtered queries apply the same modes within the section. Batches
+of queries share one multi-query FAISS search (search_positions_batch).
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+
+from services.index_factory import reconstruct
+
+RETRIEVAL_MODES = ('dense', 'hybrid', 'prefilter')
+RRF_K = 60  # rank damping constant from the RRF paper
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuse ranked position lists: score(p) = sum over lists of 1 / (k + rank of p)"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking, start=1):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (k + rank)
+    # Ties keep first-seen order, so the dense list wins them
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class HybridRetriever:
+    def __init__(self, textbook, mode: str = 'hybrid', candidates: int = 20):
+        """
+        textbook: loaded TextbookIndex (its lexical index may be None: dense only)
+        mode: one of RETRIEVAL_MODES
+        candidates: results taken from each ranking before fusion
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}' (expected one of {', '.join(RETRIEVAL_MODES)})")
+        self.textbook = textbook
+        self.vectorstore = textbook.vectorstore
+        self.lexical = textbook.lexical
+        self.mode = mode if textbook.lexical is not None else 'dense'
+        self.candidates = candidates
+
+    def search(self, query: str, query_vector: List[float], k: int,
+               section_id: Optional[str] = None) -> List[Document]:
+        """Top-k chunks for a query (optionally within one section)"""
+        return [self.document(position) for position in self.search_positions(query, query_vector, k, section_id)]
+
+    def search_positions(self, query: str, query_vector: List[float], k: int,
+                         section_id: Optional[str] = None) -> List[int]:
+        """Index positions of the top-k chunks, best first"""
+        if not section_id:
+            return self.search_positions_batch([query], [query_vector], k)[0]
+
+        allowed = self.textbook.section_index.positions.get(section_id)
+        if allowed is None:
+            return []
+        fetch = max(k, self.candidates)
+        if self.mode == 'dense':
+            return self.textbook.section_index.search_positions(section_id, query_vector, k)
+
+        lexical = [position for position, _ in self.lexical.search(query, fetch, allowed=allowed)]
+        if self.mode == 'prefilter' and len(lexical) >= k:
+            dense = self._rank_candidates(query_vector, lexical)
+        else:
+            dense = self.textbook.section_index.search_positions(section_id, query_vector, fetch)
+        return _fuse(dense, lexical, k)
+
+    def search_positions_batch(self, queries: Sequence[str], query_vectors: Sequence[List[float]],
+                               k: int) -> List[List[int]]:
+        """
+        search_positions for many queries over the whole book
+        All dense searches run as one multi-query FAISS search.
+        """
+        fetch = k if self.mode == 'dense' else max(k, self.candidates)
+        lexical = [[] for _ in queries]
+        if self.mode != 'dense':
+            lexical = [[position for position, _ in self.lexical.search(q, fetch)] for q in queries]
+
+        results: List[Optional[List[int]]] = [None] * len(queries)
+        needs_dense = []
+        for i, candidates in enumerate(lexical):
+            if self.mode == 'prefilter' and len(candidates) >= k:
+                results[i] = _fuse(self._rank_candidates(query_vectors[i], candidates), candidates, k)
+            else:
+                needs_dense.append(i)
+
+        if needs_dense:
+            index = self.vectorstore.index
+            _, ids = index.search(self._query([query_vectors[i] for i in needs_dense]), min(fetch, index.ntotal))
+            for i, row in zip(needs_dense, ids):
+                dense = [int(p) for p in row if p >= 0]
+                results[i] = dense[:k] if self.mode == 'dense' else _fuse(dense, lexical[i], k)
+        return results
+
+    def _query(self, query_vectors) -> np.ndarray:
+        """Query vectors as a float32 matrix, normalized like the index"""
+        query = np.asarray(query_vectors, dtype='float32').reshape(-1, self.vectorstore.index.d)
+        if self.vectorstore._normalize_L2:
+            faiss.normalize_L2(query)
+        return query
+
+    def _rank_candidates(self, query_vector: List[float], positions: List[int]) -> List[int]:
+        """Order candidate positions by exact vector distance to the query"""
+        index = self.vectorstore.index
+        vectors = reconstruct(index, positions)
+        query = self._query(query_vector)
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            order = np.argsort(-(vectors @ query[0]), kind='stable')
+        else:
+            order = np.argsort(((vectors - query) ** 2).sum(axis=1), kind='stable')
+        return [positions[i] for i in order]
+
+    def document(self, position: int) -> Document:
+        """Chunk at an index position"""
+        return self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[position])
+
+
+def _fuse(dense: List[int], lexical: List[int], k: int) -> List[int]:
+    return [position for position, _ in reciprocal_rank_fusion([dense, lexical])[:k]]
@@ -0,0 +1,209 @@
+"""
+FAISS index types for textbook vectorstores
+
+LangChain always builds an exact flat index, whose search cost and memory
+grow linearly with the number of chunks. Larger books can use an
+approximate index instead:
+
+- flat:  exact search (IndexFlat); best for small books
+- hnsw:  graph search (IndexHNSWFlat); fast and accurate, about 1.3x the
+         memory of flat, tuned at query time with efSearch
+- ivf:   inverted lists over k-means cells (IVF<nlist>,Flat); tuned at
+         query time with nprobe
+- ivfpq: IVF with product-quantized vectors (IVF<nlist>,PQ<m>); roughly
+         30x less memory than flat at some recall cost
+- auto:  picked by corpus size (see choose_index_type)
+
+IVF and PQ are trained on a random sample of the book's own vectors. A book
+with too few chunks to train the requested type (see training_minimum) gets
+a flat index instead, which is exact and just as fast at that size.
+Approximate indexes lose a little recall; benchmarks/bench_index_types.py
+measures recall@k and latency against flat on stored vectors.
+
+Saved indexes are opened memory-mapped (read_index), so loading is cheap
+and worker processes share the pages through the OS cache.
+"""
+import math
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+
+INDEX_TYPES = ('auto', 'flat', 'hnsw', 'ivf', 'ivfpq')
+
+# Corpus sizes (chunks) at which 'auto' switches to the next index type
+AUTO_HNSW_MIN = 20_000
+AUTO_IVF_MIN = 200_000
+AUTO_IVFPQ_MIN = 1_000_000
+
+HNSW_M = 32  # graph neighbours per vector
+TRAIN_POINTS_PER_CELL = 64  # k-means training sample per IVF cell
+MIN_POINTS_PER_CELL = 39  # fewest training points per k-means centroid FAISS accepts without warning
+
+
+def choose_index_type(n: int) -> str:
+    """Index type 'auto' uses for n vectors"""
+    if n < AUTO_HNSW_MIN:
+        return 'flat'
+    if n < AUTO_IVF_MIN:
+        return 'hnsw'
+    if n < AUTO_IVFPQ_MIN:
+        return 'ivf'
+    return 'ivfpq'
+
+
+def default_nlist(n: int) -> int:
+    """IVF cells: ~4*sqrt(n), with at least MIN_POINTS_PER_CELL training points per cell"""
+    return max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CELL))
+
+
+def default_pq_nbits(n: int) -> int:
+    """Bits per PQ code: 8 needs 256 centroids per sub-quantizer, so use fewer on small sets"""
+    if n >= 256 * MIN_POINTS_PER_CELL:
+        return 8
+    return max(4, int(math.log2(max(16, n // MIN_POINTS_PER_CELL))))
+
+
+def training_minimum(index_type: str, nlist: int, nbits: int) -> int:
+    """Vectors needed to train an index type (0 for types that need no training)"""
+    if index_type == 'ivf':
+        return nlist * MIN_POINTS_PER_CELL
+    if index_type == 'ivfpq':
+        return max(nlist * MIN_POINTS_PER_CELL, 2 ** nbits)
+    return 0
+
+
+def default_pq_m(d: int) -> int:
+    """PQ sub-quantizers: the largest divisor of d not above d/8 (96 bytes per 768-d vector)"""
+    for m in range(max(1, d // 8), 0, -1):
+        if d % m == 0:
+            return m
+    return 1
+
+
+def build_index(vectors: np.ndarray, index_type: str, metric: int = faiss.METRIC_L2,
+                nlist: Optional[int] = None, pq_m: Optional[int] = None,
+                seed: int = 1234) -> faiss.Index:
+    """
+    New index of the given type holding vectors (in order, so positions match)
+    IVF/PQ quantizers are trained on a random sample of the vectors; with too
+    few vectors to train them the index is flat (check with index_type_of).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    n, d = vectors.shape
+    if index_type == 'auto':
+        index_type = choose_index_type(n)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}' (expected one of {', '.join(INDEX_TYPES)})")
+    if index_type in ('ivf', 'ivfpq'):
+        nlist = nlist or default_nlist(n)
+        nbits = default_pq_nbits(n)
+        if n < training_minimum(index_type, nlist, nbits):
+            index_type = 'flat'
+
+    if index_type == 'flat':
+        index = faiss.IndexFlat(d, metric)
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(d, HNSW_M, metric)
+    else:
+        if index_type == 'ivf':
+            description = f"IVF{nlist},Flat"
+        else:
+            description = f"IVF{nlist},PQ{pq_m or default_pq_m(d)}x{nbits}"
+        index = faiss.index_factory(d, description, metric)
+
+        train_size = min(n, max(nlist * TRAIN_POINTS_PER_CELL, 10_000))
+        sample = vectors[np.random.default_rng(seed).choice(n, train_size, replace=False)]
+        index.train(sample)
+
+    index.add(vectors)
+    _ensure_direct_map(index)
+    return index
+
+
+def flat_vectors(index: faiss.Index) -> np.ndarray:
+    """All vectors of an index, in position order"""
+    _ensure_direct_map(index)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def reconstruct(index: faiss.Index, positions) -> np.ndarray:
+    """Vectors at the given positions (approximate for PQ indexes)"""
+    _ensure_direct_map(index)
+    return np.vstack([index.reconstruct(int(p)) for p in positions]).astype('float32')
+
+
+def _ensure_direct_map(index: faiss.Index):
+    """IVF indexes can only reconstruct by position once they have a direct map"""
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return
+    if ivf.direct_map.no():
+        ivf.make_direct_map()
+
+
+def read_index(path: str, index_type: Optional[str] = None, mmap: bool = True) -> faiss.Index:
+    """
+    Open a saved index, memory-mapped when the FAISS build supports it
+    IVF inverted lists map with IO_FLAG_MMAP; flat and HNSW vectors need
+    IO_FLAG_MMAP_IFC (FAISS >= 1.8), otherwise they are read into memory.
+    """
+    if mmap:
+        if index_type in ('ivf', 'ivfpq'):
+            flag = faiss.IO_FLAG_MMAP
+        else:
+            flag = getattr(faiss, 'IO_FLAG_MMAP_IFC', None)
+        if flag is not None:
+            try:
+                return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                pass  # index type does not support this mapping; read it normally
+    return faiss.read_index(path)
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """Which of INDEX_TYPES an index is"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivfpq'
+    if isinstance(index, faiss.IndexIVF):
+        return 'ivf'
+    return 'flat'
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Apply query-time knobs (ignored by index types they do not apply to)"""
+    kind = index_type_of(index)
+    if kind in ('ivf', 'ivfpq') and nprobe:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    elif kind == 'hnsw' and ef_search:
+        faiss.downcast_index(index).hnsw.efSearch = ef_search
+
+
+def memory_bytes(index: faiss.Index) -> int:
+    """Approximate resident size of an index"""
+    kind = index_type_of(index)
+    n, d = index.ntotal, index.d
+    if kind == 'hnsw':
+        return n * d * 4 + n * HNSW_M * 2 * 4
+    if kind in ('ivf', 'ivfpq'):
+        ivf = faiss.extract_index_ivf(index)
+        return n * (ivf.code_size + 8) + ivf.nlist * d * 4  # codes + ids + centroids
+    return n * d * 4
+
+
+def describe(index: faiss.Index) -> Dict:
+    """Type, size and search parameters of an index (for stats)"""
+    kind = index_type_of(index)
+    info = {'type': kind, 'vectors': index.ntotal}
+    if kind in ('ivf', 'ivfpq'):
+        ivf = faiss.extract_index_ivf(index)
+        info.update(nlist=ivf.nlist, nprobe=ivf.nprobe)
+    elif kind == 'hnsw':
+        info['ef_search'] = faiss.downcast_index(index).hnsw.efSearch
+    return info
@@ -0,0 +1,173 @@
+"""
+Bounded inference executor for LLM generation
+
+GPT4All completions are CPU-bound and take tens of seconds, so they must not
+run on the FastAPI event loop. Requests are admitted into a bounded queue in
+front of a fixed pool of model workers; when the queue is full the caller gets
+QueueFullError (mapped to 429 + Retry-After by the API). Every request records
+how long it waited in the queue vs. how long the model spent computing.
+
+A worker thread cannot be interrupted, so a request whose caller goes away
+(a cancelled task, e.g. a disconnected stream) keeps its slot until the
+model call actually ends; only a request still waiting for a worker frees
+its slot at once.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+
+class QueueFullError(Exception):
+    """Raised when the admission queue has no free slots"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full. Retry after {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    def __init__(self, max_workers: int = 1, max_queue: int = 8, history_size: int = 200):
+        """
+        max_workers: number of concurrent model workers (each holds its own model)
+        max_queue: requests allowed to wait for a worker before rejecting
+        history_size: number of recent requests kept for latency percentiles
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+
+        # Admission state, only touched from the event loop
+        self.in_flight = 0
+
+        # Counters and recent timings, updated from worker threads too
+        self._lock = threading.Lock()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._queue_waits = deque(maxlen=history_size)
+        self._compute_times = deque(maxlen=history_size)
+
+    @property
+    def queued(self) -> int:
+        """Requests admitted but still waiting for a worker"""
+        return max(0, self.in_flight - self.running)
+
+    def estimate_retry_after(self) -> int:
+        """Rough seconds until a queue slot frees up"""
+        with self._lock:
+            avg = sum(self._compute_times) / len(self._compute_times) if self._compute_times else 30.0
+        waves = math.ceil((self.queued + 1) / self.max_workers)
+        return max(1, int(math.ceil(avg * waves)))
+
+    def submit(self, fn: Callable, *args, **kwargs) -> "asyncio.Task":
+        """
+        Admit fn(*args, **kwargs) and schedule it on a model worker.
+        Admission happens immediately (raises QueueFullError when no slot is
+        free); the returned task resolves to (result, timings) where timings
+        has queue_wait and compute seconds. Must be called on the event loop.
+        """
+        if self.in_flight >= self.max_workers + self.max_queue:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError(self.estimate_retry_after())
+
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        timings = {}
+        self.in_flight += 1
+        try:
+            future = self.executor.submit(self._work, fn, args, kwargs, submitted, timings)
+        except RuntimeError:
+            self.in_flight -= 1  # shut down
+            raise
+        # Released when the work ends (or is cancelled before it starts), not when the caller stops waiting
+        future.add_done_callback(lambda _: self._release(loop))
+        task = asyncio.ensure_future(self._execute(future, timings))
+        # A cancelled caller drops work that has not started yet (a no-op once it runs)
+        task.add_done_callback(lambda t: future.cancel() if t.cancelled() else None)
+        return task
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Tuple[Any, Dict[str, float]]:
+        """Admit, run and await fn on a model worker (see submit)"""
+        return await self.submit(fn, *args, **kwargs)
+
+    def _work(self, fn: Callable, args, kwargs, submitted: float, timings: Dict[str, float]):
+        """Run an admitted request on a worker thread"""
+        started = time.perf_counter()
+        timings['queue_wait'] = round(started - submitted, 3)
+        with self._lock:
+            self.running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings['compute'] = round(time.perf_counter() - started, 3)
+            with self._lock:
+                self.running -= 1
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        """Free a request's admission slot, on the event loop (called from the worker)"""
+        def release():
+            self.in_flight -= 1
+
+        try:
+            loop.call_soon_threadsafe(release)
+        except RuntimeError:
+            pass  # the loop is closed: nothing left to admit
+
+    async def _execute(self, future, timings: Dict[str, float]) -> Tuple[Any, Dict[str, float]]:
+        """Await an admitted request and record its timings"""
+        try:
+            result = await asyncio.wrap_future(future)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+
+        with self._lock:
+            self.completed += 1
+            self._queue_waits.append(timings['queue_wait'])
+            self._compute_times.append(timings['compute'])
+
+        return result, timings
+
+    def stats(self) -> Dict:
+        """Aggregate queue and latency metrics"""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'queue_capacity': self.max_queue,
+                'running': self.running,
+                'queued': self.queued,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'queue_wait': _summarize(self._queue_waits),
+                'compute': _summarize(self._compute_times),
+            }
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _summarize(values) -> Dict[str, float]:
+    """Mean and percentiles of recent timings"""
+    if not values:
+        return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(values)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 3),
+        'p50': pct(0.50),
+        'p95': pct(0.95),
+        'max': ordered[-1],
+    }
@@ -0,0 +1,241 @@
+"""
+Background ingestion jobs for textbook uploads
+
+The upload pipeline (extract -> sections -> embed -> persist) runs in a
+worker pool so the FastAPI event loop stays responsive while a large book is
+being processed. Pages stream through section detection, chunking and
+embedding (see DocumentStream), so memory stays flat for large books. Each
+job records its current stage, overall progress and per-stage timings so
+clients can poll /jobs/{id}.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from services.result_cache import hash_file
+from utils.document_stream import DocumentStream
+from utils.text_extractor import iter_document_pages
+
+
+# Ordered pipeline stages with their share of the overall progress bar
+STAGES = [
+    ('extract', 0.30),
+    ('sections', 0.05),
+    ('embed', 0.60),  # chunks are cut as they are embedded
+    ('persist', 0.05),
+]
+
+
+class IngestionError(Exception):
+    """Raised when a document cannot be ingested (bad or empty input)"""
+    pass
+
+
+class IngestionJob:
+    def __init__(self, file_path: str, filename: str, file_type: str):
+        self.id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.filename = filename
+        self.file_type = file_type
+        self.status = 'queued'  # queued, running, completed, failed
+        self.stage = None
+        self.stage_progress = 0.0
+        self.stage_timings = {}  # stage -> seconds
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._stage_started = None
+        self._lock = threading.Lock()
+
+    def start_stage(self, stage: str):
+        """Close the current stage (if any) and start the next one"""
+        with self._lock:
+            now = time.time()
+            if self.stage is not None and self._stage_started is not None:
+                self.stage_timings[self.stage] = round(now - self._stage_started, 3)
+            self.stage = stage
+            self.stage_progress = 0.0
+            self._stage_started = now
+
+    def update_stage_progress(self, fraction: float):
+        """Record progress (0.0 - 1.0) inside the current stage"""
+        with self._lock:
+            self.stage_progress = max(0.0, min(1.0, fraction))
+
+    def finish(self, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        """Mark the job as completed or failed"""
+        with self._lock:
+            now = time.time()
+            if self.stage is not None and self._stage_started is not None:
+                self.stage_timings[self.stage] = round(now - self._stage_started, 3)
+            if status == 'completed':
+                self.stage_progress = 1.0
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = now
+
+    @property
+    def percent(self) -> float:
+        """Overall progress across all stages"""
+        if self.status == 'completed':
+            return 100.0
+        done = 0.0
+        for name, weight in STAGES:
+            if name == self.stage:
+                done += weight * self.stage_progress
+                break
+            if name in self.stage_timings:
+                done += weight
+        return round(done * 100, 1)
+
+    def to_dict(self) -> Dict:
+        """Snapshot of the job for the API"""
+        with self._lock:
+            elapsed_end = self.finished_at or time.time()
+            return {
+                'job_id': self.id,
+                'filename': self.filename,
+                'status': self.status,
+                'stage': self.stage,
+                'percent': self.percent,
+                'stage_timings': dict(self.stage_timings),
+                'elapsed': round(elapsed_end - (self.started_at or self.created_at), 3),
+                'error': self.error,
+                'result': self.result,
+            }
+
+
+class IngestionJobManager:
+    """Runs upload pipelines in a worker pool and tracks their progress"""
+
+    def __init__(self, rag_service, max_workers: int = 1, max_finished_jobs: int = 100,
+                 extract_workers: Optional[int] = None,
+                 on_complete: Optional[Callable[[str], None]] = None):
+        """
+        max_workers: uploads processed concurrently
+        extract_workers: processes per upload for PDF page extraction (default: CPU count)
+        on_complete: called with the doc id of each successfully ingested book
+        """
+        self.rag_service = rag_service
+        self.max_finished_jobs = max_finished_jobs
+        self.extract_workers = extract_workers
+        self.on_complete = on_complete
+        # A single worker by default: extraction and embedding already use every core
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.jobs: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_path: str, filename: str, file_type: str) -> IngestionJob:
+        """Queue a saved upload for background processing"""
+        job = IngestionJob(file_path, filename, file_type)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """Look up a job by id"""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def shutdown(self):
+        """Stop accepting work and drop queued jobs (a running job is not waited for)"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_finished_jobs"""
+        finished = [j for j in self.jobs.values() if j.status in ('completed', 'failed')]
+        if len(finished) <= self.max_finished_jobs:
+            return
+        finished.sort(key=lambda j: j.finished_at or j.created_at)
+        for job in finished[:len(finished) - self.max_finished_jobs]:
+            del self.jobs[job.id]
+
+    def _run(self, job: IngestionJob):
+        """Execute the full ingestion pipeline for one job, then delete the upload"""
+        job.status = 'running'
+        job.started_at = time.time()
+
+        try:
+            spool_dir = os.path.join(self.rag_service.persist_dir, "tmp")
+            os.makedirs(spool_dir, exist_ok=True)
+            pages = iter_document_pages(
+                job.file_path, job.file_type,
+                workers=self.extract_workers, progress_callback=job.update_stage_progress
+            )
+
+            with DocumentStream(pages, chunk_size=300, overlap=30, spool_dir=spool_dir,
+                                token_counter=self.rag_service.token_counter) as stream:
+                # Extract text page by page (with page markers for better section detection)
+                job.start_stage('extract')
+                print(f"[job {job.id[:8]}] Extracting text from {job.filename}...")
+                stream.scan()
+                doc_hash = hash_file(job.file_path)
+
+                if stream.raw_chars < 100:
+                    raise IngestionError("Could not extract sufficient text from the file.")
+
+                # Decide section boundaries (BEFORE chunking)
+                job.start_stage('sections')
+                print(f"[job {job.id[:8]}] Analyzing document structure and extracting sections...")
+                if not stream.plan_sections():
+                    raise IngestionError("Could not extract any sections from the document.")
+
+                # Chunk each section and embed as chunks stream out; the service
+                # reports the stage switch to 'persist'
+                job.start_stage('embed')
+
+                def on_progress(stage: str, fraction: float):
+                    if stage != job.stage:
+                        job.start_stage(stage)
+                    job.update_stage_progress(fraction)
+
+                indexed = self.rag_service.create_vectorstore(
+                    stream.iter_chunks(), job.filename, stream.sections,
+                    progress_callback=on_progress, doc_hash=doc_hash,
+                    expected_chunks=stream.estimated_chunks(),
+                    section_bodies_path=stream.bodies_path
+                )
+                sections = stream.sections
+
+            print(f"[job {job.id[:8]}] ✓ Indexed {indexed['total_chunks']} chunks from {len(sections)} sections")
+            job.finish('completed', result={
+                'status': 'success',
+                'message': 'Textbook processed successfully. System ready.',
+                'doc_id': indexed['doc_id'],
+                'textbook_name': job.filename,
+                'total_chunks': indexed['total_chunks'],
+                'chunks_embedded': indexed['chunks_embedded'],
+                'chunks_reused': indexed['chunks_reused'],
+                'sections': [
+                    {'id': s['id'], 'title': s['title'], 'preview': s['preview']}
+                    for s in sections
+                ],
+            })
+            print(f"[job {job.id[:8]}] ✓ Ingestion finished in {job.to_dict()['elapsed']}s")
+
+        except IngestionError as e:
+            job.finish('failed', error=str(e))
+            print(f"[job {job.id[:8]}] Ingestion failed: {e}")
+        except Exception as e:
+            job.finish('failed', error=f"Error processing file: {str(e)}")
+            print(f"[job {job.id[:8]}] Error in ingestion: {str(e)}")
+        finally:
+            try:
+                os.remove(job.file_path)
+            except OSError:
+                pass
+
+        # Outside the job's try: the book is indexed whatever the hook does
+        if job.status == 'completed' and self.on_complete:
+            try:
+                self.on_complete(job.result['doc_id'])
+            except Exception as e:
+                print(f"[job {job.id[:8]}] on_complete hook failed: {str(e)}")
@@ -0,0 +1,192 @@
+"""
+BM25 inverted index over a textbook's chunks
+
+Dense retrieval with all-mpnet-base-v2 often misses exact textbook terms
+(formula names, acronyms, symbols). This index scores chunks lexically with
+Okapi BM25 so the hybrid retriever can fuse both rankings.
+
+The index lives in a SQLite file next to the FAISS index, keyed by the same
+chunk positions:
+
+- postings(term, position, tf): clustered by term, so a query reads only the
+  posting lists of its own terms
+- terms(term, df): document frequency per term
+- docs(position, length, section_id): token count per chunk
+
+Chunks are added batch by batch as they are indexed (LexicalIndex.add), so
+the index grows with the vectorstore and is never held in memory whole.
+"""
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._+-][a-z0-9]+)*")
+
+# Kept short: exact terms matter more than recall of function words
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in is it its of on or that the
+their there these this those to was were what when where which who why will
+with how does do did can into than then them they we you your our not no
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens; keeps dotted/hyphenated terms (e.g. 'tcp-ip', 'h2o', 'f1.5') whole"""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class LexicalIndex:
+    def __init__(self, path: str, read_only: bool = True):
+        """
+        path: SQLite file (created unless read_only)
+        read_only: open an existing index for search only
+        """
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._lengths: Optional[np.ndarray] = None
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " term TEXT NOT NULL, position INTEGER NOT NULL, tf INTEGER NOT NULL,"
+                " PRIMARY KEY (term, position)) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;"
+                "CREATE TABLE IF NOT EXISTS docs ("
+                " position INTEGER PRIMARY KEY, length INTEGER NOT NULL, section_id TEXT);"
+            )
+        (self.size,) = self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()
+        (total_length,) = self._conn.execute("SELECT COALESCE(SUM(length), 0) FROM docs").fetchone()
+        self.total_length = total_length
+
+    # ---------- building ----------
+
+    def add(self, texts: Sequence[str], section_ids: Optional[Sequence[Optional[str]]] = None) -> range:
+        """
+        Append chunks at the next positions (in the same order as the FAISS index)
+        Returns the positions they were given.
+        """
+        if self.read_only:
+            raise RuntimeError(f"{self.path} is opened read-only")
+        section_ids = section_ids or [None] * len(texts)
+        postings, docs = [], []
+        df = Counter()
+        with self._lock:
+            start = self.size
+            for offset, (text, section_id) in enumerate(zip(texts, section_ids)):
+                counts = Counter(tokenize(text))
+                position = start + offset
+                postings.extend((term, position, tf) for term, tf in counts.items())
+                df.update(counts.keys())
+                docs.append((position, sum(counts.values()), section_id))
+                self.total_length += docs[-1][1]
+
+            self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+            self._conn.executemany(
+                "INSERT INTO terms VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                df.items()
+            )
+            self._conn.executemany("INSERT INTO docs VALUES (?, ?, ?)", docs)
+            self._conn.commit()
+            self.size += len(docs)
+            self._lengths = None
+        return range(start, start + len(docs))
+
+    # ---------- search ----------
+
+    def _doc_lengths(self) -> np.ndarray:
+        """Token count per position (read on first search; caller holds the lock)"""
+        if self._lengths is None or len(self._lengths) != self.size:
+            rows = self._conn.execute("SELECT length FROM docs ORDER BY position").fetchall()
+            self._lengths = np.fromiter((r[0] for r in rows), dtype='float32', count=len(rows))
+        return self._lengths
+
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Top-k (position, BM25 score) for a query, best first
+        allowed: optional sorted positions to restrict the search to (e.g. one section)
+        """
+        terms = set(tokenize(query))
+        if not terms or self.size == 0:
+            return []
+
+        matched, weights = [], []
+        with self._lock:
+            lengths = self._doc_lengths()
+            avg_length = max(self.total_length / self.size, 1.0)
+            for term in terms:
+                row = self._conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+                if row is None:
+                    continue
+                idf = math.log(1 + (self.size - row[0] + 0.5) / (row[0] + 0.5))
+                rows = self._conn.execute(
+                    "SELECT position, tf FROM postings WHERE term = ?", (term,)
+                ).fetchall()
+                positions = np.fromiter((r[0] for r in rows), dtype='int64', count=len(rows))
+                tf = np.fromiter((r[1] for r in rows), dtype='float32', count=len(rows))
+                if allowed is not None:
+                    keep = np.isin(positions, allowed, assume_unique=True)
+                    positions, tf = positions[keep], tf[keep]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[positions] / avg_length)
+                matched.append(positions)
+                weights.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+
+        if not matched:
+            return []
+        positions, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+        if len(positions) == 0:
+            return []
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        top = np.argsort(-scores, kind='stable')[:k]
+        return [(int(positions[i]), float(scores[i])) for i in top]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            (terms,) = self._conn.execute("SELECT COUNT(*) FROM terms").fetchone()
+        return {'chunks': self.size, 'terms': terms}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def write_lexical_index(path: str, docs: Iterable, batch_size: int = 1000):
+    """Build a new index from chunk Documents given in index position order"""
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    index = LexicalIndex(tmp_path, read_only=False)
+    try:
+        for batch in _batched(docs, batch_size):
+            index.add([d.page_content for d in batch], [d.metadata.get('section_id') for d in batch])
+    finally:
+        index.close()
+    os.replace(tmp_path, path)
+
+
+def vectorstore_documents(vectorstore) -> Iterator:
+    """A LangChain FAISS vectorstore's Documents in index position order"""
+    for position in range(vectorstore.index.ntotal):
+        yield vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,237 @@
+"""
+LLM backends: in-process GPT4All or an OpenAI-compatible completion server
+
+With the in-process backend every uvicorn worker loads its own copy of the
+GPT4All model (one per inference thread), so RAM grows with the number of
+API workers and generation cannot be scaled apart from the API. The server
+backend instead sends prompts to one out-of-process model server that any
+number of API workers share:
+
+- gpt4all: langchain GPT4All, one instance per inference worker thread
+  (the models are not thread-safe)
+- server:  an OpenAI-compatible /v1/completions endpoint (llama.cpp's
+  llama-server, or benchmarks/stub_llm_server.py for tests), reached through
+  one pooled HTTP session with connect/read timeouts. Tokens are streamed
+  back over SSE when the caller streams.
+
+Both hand run_prompt a LangChain LLM, so chains, callbacks and token
+streaming work the same on either.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+from langchain.llms.base import LLM
+from requests.adapters import HTTPAdapter
+
+LLM_BACKENDS = ('gpt4all', 'server')
+
+
+class LLMBackendError(RuntimeError):
+    """The LLM server could not be reached or failed the request"""
+    pass
+
+
+class GPT4AllBackend:
+    """In-process GPT4All models, one per calling thread"""
+
+    name = 'gpt4all'
+
+    def __init__(self, model_name: str, max_tokens: int = 2048, temp: float = 0.7):
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.temp = temp
+        self.instances = 0
+
+    def create_llm(self) -> LLM:
+        """Load a GPT4All model for the calling thread - downloads once and caches"""
+        from langchain_community.llms import GPT4All
+
+        print("Initializing GPT4All model...")
+
+        # Model will be auto-downloaded to ~/.cache/gpt4all/ if not present
+        gpt4all_cache = os.path.expanduser("~/.cache/gpt4all/")
+        cached_model_path = os.path.join(gpt4all_cache, self.model_name)
+
+        if os.path.exists(cached_model_path):
+            print(f"Using cached GPT4All model from: {cached_model_path}")
+        else:
+            print(f"Downloading GPT4All model (one-time download ~2GB)...")
+            print(f"Model will be cached at: {gpt4all_cache}")
+
+        # GPT4All will use the model from cache or download if needed
+        llm = GPT4All(
+            model=self.model_name,  # Just model name - GPT4All handles cache lookup
+            max_tokens=self.max_tokens,
+            temp=self.temp,
+            verbose=False
+        )
+        self.instances += 1
+        print("GPT4All model loaded successfully (cached for future use)!")
+        return llm
+
+    def stats(self) -> Dict:
+        return {'backend': self.name, 'model': self.model_name, 'instances': self.instances}
+
+    def close(self):
+        pass
+
+
+class ServerBackend:
+    """Completions from an OpenAI-compatible server over a pooled HTTP session"""
+
+    name = 'server'
+
+    def __init__(self, base_url: str, model_name: str, max_tokens: int = 512, temp: float = 0.7,
+                 pool_size: int = 8, connect_timeout: float = 5.0, read_timeout: float = 120.0,
+                 api_key: Optional[str] = None):
+        """
+        base_url: server root, e.g. http://127.0.0.1:8080 (requests go to /v1/completions)
+        model_name: model the server is asked for (also keys the result cache)
+        max_tokens / temp: generation settings sent with every request
+        pool_size: keep-alive connections kept open to the server (and the most in flight)
+        connect_timeout / read_timeout: seconds to connect, and to wait for each read
+                                        (the whole response, or the next streamed token)
+        api_key: optional bearer token
+        """
+        self.base_url = base_url.rstrip('/')
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.temp = temp
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        # pool_block: callers wait for a free connection instead of opening extra ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers['Authorization'] = f"Bearer {api_key}"
+
+        self._llm = ServerLLM(backend=self)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    def create_llm(self) -> LLM:
+        """The shared client LLM (thread-safe: it only holds the pooled session)"""
+        return self._llm
+
+    def complete(self, prompt: str, stop: Optional[List[str]] = None, stream: bool = False,
+                 max_tokens: Optional[int] = None) -> Iterator[str]:
+        """Completion text pieces: one piece, or one per token when stream is set"""
+        payload = {
+            'model': self.model_name,
+            'prompt': prompt,
+            'max_tokens': max_tokens or self.max_tokens,
+            'temperature': self.temp,
+            'stream': stream,
+        }
+        if stop:
+            payload['stop'] = stop
+
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+        try:
+            with self.session.post(f"{self.base_url}/v1/completions", json=payload,
+                                   timeout=self.timeout, stream=stream) as response:
+                if response.status_code != 200:
+                    raise LLMBackendError(
+                        f"LLM server returned {response.status_code}: {response.text[:200]}"
+                    )
+                if not stream:
+                    yield response.json()['choices'][0]['text']
+                    return
+                # Event streams are UTF-8; without a charset requests would guess latin-1 or none
+                response.encoding = 'utf-8'
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        return
+                    text = json.loads(data)['choices'][0].get('text', '')
+                    if text:
+                        yield text
+        except requests.RequestException as e:
+            with self._lock:
+                self.errors += 1
+            raise LLMBackendError(f"LLM server {self.base_url} failed: {str(e)}") from e
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            # Not an OpenAI-style completion body (or stream event)
+            with self._lock:
+                self.errors += 1
+            raise LLMBackendError(f"LLM server {self.base_url} sent a malformed response: {e!r}") from e
+        except LLMBackendError:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def health(self) -> bool:
+        """Whether the server answers (GET /v1/models)"""
+        try:
+            return self.session.get(f"{self.base_url}/v1/models", timeout=self.timeout).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'backend': self.name,
+                'model': self.model_name,
+                'url': self.base_url,
+                'pool_size': self.pool_size,
+                'requests': self.requests,
+                'errors': self.errors,
+                'in_flight': self.in_flight,
+            }
+
+    def close(self):
+        self.session.close()
+
+
+class ServerLLM(LLM):
+    """LangChain LLM that sends prompts to a ServerBackend"""
+
+    backend: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "openai-compatible-server"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[Any] = None, **kwargs: Any) -> str:
+        stream = bool(kwargs.get('streaming')) and run_manager is not None
+        pieces = self.backend.complete(prompt, stop=stop, stream=stream, max_tokens=kwargs.get('max_tokens'))
+        text = ""
+        try:
+            for piece in pieces:
+                if stream:
+                    run_manager.on_llm_new_token(piece)
+                text += piece
+        finally:
+            # A cancelled stream closes the connection now, so the server stops decoding
+            pieces.close()
+        return text
+
+
+def create_llm_backend(backend: str, model_name: str, server_url: Optional[str] = None, **options):
+    """
+    LLM backend by name (see LLM_BACKENDS)
+    options: passed to the backend (e.g. max_tokens, pool_size, read_timeout)
+    """
+    if backend == 'gpt4all':
+        return GPT4AllBackend(model_name, **options)
+    if backend == 'server':
+        if not server_url:
+            raise ValueError("The server LLM backend needs a server URL (LLM_SERVER_URL)")
+        return ServerBackend(server_url, model_name, **options)
+    raise ValueError(f"Unknown LLM backend '{backend}' (expected one of {', '.join(LLM_BACKENDS)})")
@@ -0,0 +1,139 @@
+"""
+Versioned manifest and section bodies of a library document
+
+metadata.pkl used to hold the textbook name, hash and every section with its
+full content, so opening a book unpickled (unsafely) all of its text.
+Documents now carry:
+
+- manifest.json: format version, name, hash, chunk count, index type, the
+  size and sha256 of each data file, and per section only its id, title,
+  preview, type and the byte offset, length and sha256 of its body
+- sections.txt: section bodies back to back (UTF-8), read one at a time by
+  offset when a section's text is needed
+
+Older pickles are read once for migration with a restricted unpickler that
+only accepts the classes those files actually contain.
+"""
+import hashlib
+import io
+import json
+import os
+import pickle
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_FILE = "manifest.json"
+SECTIONS_FILE = "sections.txt"
+MANIFEST_VERSION = 1
+
+# Section fields kept in the manifest (bodies live in sections.txt)
+SECTION_FIELDS = ('id', 'title', 'preview', 'type', 'confidence', 'char_count',
+                  'offset', 'length', 'checksum')
+
+
+class ManifestError(Exception):
+    """Raised for a missing, unreadable or newer-than-supported manifest, or a corrupt section body"""
+    pass
+
+
+def write_manifest(doc_dir: str, manifest: Dict):
+    """Write manifest.json atomically, stamping the format version"""
+    path = os.path.join(doc_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'format_version': MANIFEST_VERSION, **manifest}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(doc_dir: str) -> Dict:
+    """Parsed manifest.json of a document directory"""
+    path = os.path.join(doc_dir, MANIFEST_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"Cannot read {path}: {e}")
+    version = manifest.get('format_version')
+    if not isinstance(version, int) or version > MANIFEST_VERSION:
+        raise ManifestError(f"Unsupported manifest version {version!r} in {path}")
+    return manifest
+
+
+def file_digest(path: str) -> Dict:
+    """Size and sha256 of a data file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {'bytes': os.path.getsize(path), 'sha256': digest.hexdigest()}
+
+
+def check_file_sizes(doc_dir: str, manifest: Dict):
+    """Cheap load-time check that data files match the manifest (sizes only)"""
+    for name, info in manifest.get('files', {}).items():
+        path = os.path.join(doc_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) != info['bytes']:
+            raise ManifestError(f"{path} is missing or does not match the manifest")
+
+
+def write_section_bodies(path: str, sections: Iterable[Dict]) -> List[Dict]:
+    """Write sections' 'content' to path; returns the sections with body locations instead"""
+    located = []
+    offset = 0
+    with open(path, 'wb') as f:
+        for section in sections:
+            content = section.get('content', '')
+            data = content.encode('utf-8')
+            f.write(data)
+            entry = {k: v for k, v in section.items() if k != 'content'}
+            entry.setdefault('char_count', len(content))
+            entry.update(offset=offset, length=len(data), checksum=hashlib.sha256(data).hexdigest())
+            offset += len(data)
+            located.append(entry)
+    return located
+
+
+def read_section_body(path: str, section: Dict) -> str:
+    """One section's text, read by offset and verified against its checksum"""
+    with open(path, 'rb') as f:
+        f.seek(section['offset'])
+        data = f.read(section['length'])
+    if hashlib.sha256(data).hexdigest() != section.get('checksum'):
+        raise ManifestError(f"Section {section.get('id')} body does not match its checksum")
+    return data.decode('utf-8')
+
+
+def manifest_sections(sections: Iterable[Dict]) -> List[Dict]:
+    """Sections reduced to the fields stored in the manifest"""
+    return [{k: s[k] for k in SECTION_FIELDS if k in s} for s in sections]
+
+
+# ---------- migration from pickles ----------
+
+# Classes LangChain's save_local pickles into index.pkl (old and new module paths)
+LANGCHAIN_PICKLE_CLASSES = {
+    ('langchain_community.docstore.in_memory', 'InMemoryDocstore'),
+    ('langchain.docstore.in_memory', 'InMemoryDocstore'),
+    ('langchain_core.documents.base', 'Document'),
+    ('langchain.schema.document', 'Document'),
+    ('langchain.docstore.document', 'Document'),
+}
+
+
+class _RestrictedUnpickler(pickle.Unpickler):
+    def __init__(self, f, allowed):
+        super().__init__(f)
+        self.allowed = allowed
+
+    def find_class(self, module: str, name: str):
+        if (module, name) not in self.allowed:
+            raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from a legacy pickle")
+        return super().find_class(module, name)
+
+
+def restricted_load(path: str, allowed: Optional[set] = None):
+    """
+    Unpickle a legacy file allowing only the given (module, name) classes
+    metadata.pkl holds plain dicts/lists/strings, so it needs none.
+    """
+    with open(path, 'rb') as f:
+        return _RestrictedUnpickler(io.BytesIO(f.read()), allowed or set()).load()
@@ -1,36 +1,139 @@
 """
 RAG Service using LangChain, FAISS, and GPT4All
 """
+import contextlib
+import hashlib
 import os
-import pickle
-from typing import List, Dict, Optional
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Dict, Optional, Callable, Iterable, Iterator, Tuple
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.llms import GPT4All
 from langchain.chains import RetrievalQA, LLMChain
 from langchain.prompts import PromptTemplate
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
 
+from services.context_packer import ContextPacker
+from services.embedding_engine import EmbeddingEngine
+from services.document_library import DocumentLibrary, DocumentNotFoundError, TextbookIndex
+from services.embedding_store import EmbeddingStore, chunk_hash
+from services.generation_scheduler import generation_context
+from services.hybrid_retriever import HybridRetriever
+from services.index_factory import build_index, choose_index_type, flat_vectors, index_type_of
+from services.llm_backend import GPT4AllBackend
+from services.lexical_index import LexicalIndex
+from services.manifest import restricted_load
+from services.result_cache import ResultCache, template_version
+from services.semantic_cache import SemanticCache
+from utils.token_chunker import token_counter_for
+
 
 class RAGService:
     def __init__(self, 
                  persist_dir: str = "./storage",
-                 model_path: str = "./models"):
+                 model_path: str = "./models",
+                 embeddings=None,
+                 llm_model_name: str = "orca-mini-3b-gguf2-q4_0.gguf",
+                 result_cache_bytes: int = 256 * 1024 * 1024,
+                 semantic_cache: Optional[SemanticCache] = None,
+                 library_memory_bytes: int = 1024 * 1024 * 1024,
+                 embed_batch_size: int = 32,
+                 embed_threads: Optional[int] = None,
+                 embed_backend: str = 'torch',
+                 index_type: str = 'auto',
+                 index_nprobe: int = 16,
+                 index_ef_search: int = 64,
+                 index_mmap: bool = True,
+                 retrieval_mode: str = 'hybrid',
+                 retrieval_candidates: int = 20,
+                 llm_context_window: int = 2048,
+                 llm_answer_tokens: int = 512,
+                 context_tokens: Optional[int] = 600,
+                 llm_token_margin: float = 1.25,
+                 llm_backend=None,
+                 lazy_embeddings: bool = False):
+        """
+        embeddings: optional preloaded LangChain embeddings (skips loading all-mpnet-base-v2)
+        llm_model_name: GPT4All model file (also part of the result cache key)
+        result_cache_bytes: disk budget for cached generations
+        semantic_cache: answer cache for similar questions (default settings if omitted)
+        library_memory_bytes: memory budget for textbook indexes kept loaded at once
+        embed_batch_size / embed_threads: encode batch size and torch threads for ingestion
+        embed_backend: 'torch' (fp32), 'int8' (quantized) or 'onnx' (ONNX Runtime)
+        index_type: FAISS index for new uploads: 'auto', 'flat', 'hnsw', 'ivf' or 'ivfpq'
+        index_nprobe / index_ef_search: query-time search breadth of IVF / HNSW indexes
+        index_mmap: memory-map saved indexes (shared between worker processes)
+        retrieval_mode: 'dense', 'hybrid' (BM25 + FAISS fused with RRF) or 'prefilter'
+                        (BM25 candidates scored densely); see services/hybrid_retriever.py
+        retrieval_candidates: results taken from each ranking before fusion
+        llm_context_window / llm_answer_tokens: LLM context length, and the part of it kept for the answer
+        context_tokens: cap on retrieved context per prompt (None: whatever the window leaves);
+                        see services/context_packer.py
+        llm_token_margin: LLM tokens assumed per embedding-tokenizer token when fitting prompts
+                          to llm_context_window (the LLM's own tokenizer is not available)
+        llm_backend: where prompts run (services/llm_backend.py); default: in-process GPT4All
+                     with llm_model_name
+        lazy_embeddings: load the embedding model on first use (or warm_up_embeddings)
+                         instead of now
+        """
         self.persist_dir = persist_dir
         self.model_path = model_path
-        self.vectorstore = None
-        self.embeddings = None
-        self.llm = None
-        self.textbook_name = None
-        self.total_chunks = 0
-        self.sections = []  # Store sections information
+        self.llm_model_name = llm_model_name
+        self.embeddings = embeddings
+        self.embed_batch_size = embed_batch_size
+        self.embed_threads = embed_threads
+        self.embed_backend = embed_backend
+        self.lazy_embeddings = lazy_embeddings
+        self.index_type = index_type
+        self.retrieval_mode = retrieval_mode
+        self.retrieval_candidates = retrieval_candidates
+        self.llm_backend = llm_backend or GPT4AllBackend(llm_model_name)
+        self._llm_local = threading.local()  # the LLM of each worker thread
         
         os.makedirs(persist_dir, exist_ok=True)
         os.makedirs(model_path, exist_ok=True)
         
+        # Generated artifacts, reused across users for the same book and section
+        self.result_cache = ResultCache(
+            os.path.join(persist_dir, "result_cache"),
+            max_bytes=result_cache_bytes
+        )
+        self.semantic_cache = semantic_cache or SemanticCache()
+        
         # Initialize embeddings
         self._initialize_embeddings()
+        
+        # Chunks are sized in the embedding model's own tokens
+        self.token_counter = token_counter_for(self.embeddings)
+        
+        # Retrieved chunks are merged and fitted to a token budget in prompts
+        self.context_packer = ContextPacker(
+            self.token_counter,
+            context_window=llm_context_window,
+            answer_tokens=llm_answer_tokens,
+            max_context_tokens=context_tokens,
+            token_margin=llm_token_margin
+        )
+        
+        # Chunk vectors by content, reused when a book is re-uploaded
+        self.embedding_store = EmbeddingStore(
+            os.path.join(persist_dir, "embeddings.sqlite3"),
+            model_name=getattr(self.embeddings, 'cache_key',
+                               getattr(self.embeddings, 'model_name', type(self.embeddings).__name__))
+        )
+        
+        # Every uploaded textbook, each with its own index (loaded on demand)
+        self.library = DocumentLibrary(
+            os.path.join(persist_dir, "library"),
+            self.embeddings,
+            memory_budget_bytes=library_memory_bytes,
+            nprobe=index_nprobe,
+            ef_search=index_ef_search,
+            mmap=index_mmap
+        )
     
     def _initialize_embeddings(self):
         """Initialize sentence-transformers embeddings - uses cache automatically"""
@@ -38,175 +141,607 @@ class RAGService:
             print("Embeddings model already loaded (using cached instance)")
             return
             
-        print("Loading embeddings model (all-mpnet-base-v2)...")
+        if self.lazy_embeddings:
+            print(f"Embeddings model (all-mpnet-base-v2, {self.embed_backend} backend) will load on first use")
+        else:
+            print(f"Loading embeddings model (all-mpnet-base-v2, {self.embed_backend} backend)...")
         # HuggingFace models are automatically cached in ~/.cache/huggingface/
         # No need to re-download if already cached
         cache_folder = os.path.expanduser("~/.cache/huggingface/hub")
         
-        self.embeddings = HuggingFaceEmbeddings(
+        self.embeddings = EmbeddingEngine(
             model_name="sentence-transformers/all-mpnet-base-v2",
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True},
-            cache_folder=cache_folder
+            batch_size=self.embed_batch_size,
+            num_threads=self.embed_threads,
+            device='cpu',
+            cache_folder=cache_folder,
+            backend=self.embed_backend,
+            export_dir=os.path.join(self.model_path, "onnx"),
+            lazy=self.lazy_embeddings
         )
-        print("Embeddings model loaded successfully (cached for future use)!")
+        if not self.lazy_embeddings:
+            print(f"Embeddings model loaded successfully (cached for future use)! "
+                  f"(batch size {self.embed_batch_size}, threads {self.embed_threads or 'default'})")
     
+    @property
+    def llm(self):
+        """LLM used by the calling thread (GPT4All models are not thread-safe)"""
+        return getattr(self._llm_local, 'llm', None)
+
+    @llm.setter
+    def llm(self, value):
+        self._llm_local.llm = value
+
     def _initialize_llm(self):
-        """Initialize GPT4All LLM - downloads once and caches"""
+        """Get the LLM for the current worker (a GPT4All model per thread, or the shared server client)"""
         if self.llm is not None:
-            print("GPT4All model already loaded (using cached instance)")
+            print(f"{self.llm_backend.name} LLM already loaded (using cached instance)")
             return
-            
-        print("Initializing GPT4All model...")
-        
-        # Model will be auto-downloaded to ~/.cache/gpt4all/ if not present
-        # Specify model name - GPT4All handles caching automatically
-        model_name = "orca-mini-3b-gguf2-q4_0.gguf"
-        
-        # Check if model exists in cache
-        gpt4all_cache = os.path.expanduser("~/.cache/gpt4all/")
-        cached_model_path = os.path.join(gpt4all_cache, model_name)
-        
-        if os.path.exists(cached_model_path):
-            print(f"Using cached GPT4All model from: {cached_model_path}")
+        self.llm = self.llm_backend.create_llm()
+    
+    # ---------- warm-up ----------
+    
+    def warm_up_embeddings(self):
+        """Load the embedding model and embed one query"""
+        load = getattr(self.embeddings, 'load', None)
+        if load is not None:
+            load()
+        self.embeddings.embed_query(WARMUP_QUERY)
+    
+    def warm_up_index(self, doc_id: Optional[str] = None) -> bool:
+        """Load a textbook's index (default: the most recent one) and search it once; False if there is none"""
+        if self.library.resolve(doc_id) is None:
+            return False
+        self.retrieve_context(WARMUP_QUERY, k=1, doc_id=doc_id)
+        return True
+    
+    def warm_up_llm(self, max_tokens: int = 8) -> str:
+        """Load the calling worker's LLM and run a short completion through it"""
+        self._initialize_llm()
+        return self.llm.invoke(WARMUP_PROMPT, max_tokens=max_tokens)
+    
+    def create_vectorstore(self, chunks: Iterable[Dict], textbook_name: str, sections: List[Dict] = None,
+                           progress_callback: Optional[Callable[[str, float], None]] = None,
+                           batch_size: int = 256, doc_hash: Optional[str] = None,
+                           expected_chunks: Optional[int] = None,
+                           index_type: Optional[str] = None,
+                           section_bodies_path: Optional[str] = None) -> Dict:
+        """
+        Create and persist a FAISS vectorstore for one textbook in the library
+        chunks: list or iterator of chunks; consumed batch by batch and added
+                to the index incrementally, so a streaming producer never has
+                the whole book in memory
+        sections: section list, read once chunks are exhausted (a streaming
+                  producer may fill it in as it goes); each with its 'content',
+                  or located in section_bodies_path (see DocumentStream)
+        doc_hash: content hash of the source file (derives the doc id and keys the result cache)
+        progress_callback: optional fn(stage, fraction) called during 'embed' and 'persist'
+        batch_size: number of chunks handed to the embeddings per call (the engine
+                    splits them into length-sorted encode batches); the next
+                    batch is embedded while the previous one is added to the index
+        expected_chunks: chunk count for progress when chunks is an iterator
+        index_type: FAISS index type (default: the service's index_type); chunks
+                    are indexed flat while streaming, then rebuilt as this type
+        The BM25 lexical index is built batch by batch alongside the vectors.
+        Returns {'doc_id', 'total_chunks', 'chunks_embedded', 'chunks_reused'};
+        re-uploading the same file replaces its index.
+        """
+        if isinstance(chunks, list):
+            expected_chunks = len(chunks)
+            print(f"Creating vectorstore with {len(chunks)} chunks...")
         else:
-            print(f"Downloading GPT4All model (one-time download ~2GB)...")
-            print(f"Model will be cached at: {gpt4all_cache}")
-        
-        # GPT4All will use the model from cache or download if needed
-        self.llm = GPT4All(
-            model=model_name,  # Just model name - GPT4All handles cache lookup
-            max_tokens=2048,
-            temp=0.7,
-            verbose=False
-        )
-        print("GPT4All model loaded successfully (cached for future use)!")
+            print("Creating vectorstore from chunk stream...")
+
+        def report(stage: str, fraction: float):
+            if progress_callback:
+                progress_callback(stage, fraction)
+
+        vectorstore = None
+        total = embedded = 0
+        embed_seconds = 0.0
+        tmp_dir = os.path.join(self.persist_dir, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, lexical_path = tempfile.mkstemp(suffix=".lexical.sqlite3", dir=tmp_dir)
+        os.close(fd)
+        lexical = LexicalIndex(lexical_path, read_only=False)
+
+        def index_batch(batch: List[Dict], future):
+            nonlocal vectorstore, total, embedded, embed_seconds
+            vectors, new, seconds = future.result()
+            text_embeddings = [(chunk['text'], vector) for chunk, vector in zip(batch, vectors)]
+            metadatas = [chunk['metadata'] for chunk in batch]
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(
+                    text_embeddings=text_embeddings,
+                    embedding=self.embeddings,
+                    metadatas=metadatas
+                )
+            else:
+                vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+            lexical.add([chunk['text'] for chunk in batch], [m.get('section_id') for m in metadatas])
+            total += len(batch)
+            embedded += new
+            embed_seconds += seconds
+            if expected_chunks:
+                report('embed', min(0.99, total / expected_chunks))
+
+        report('embed', 0.0)
+        try:
+            # Embed on a worker thread so the next batch is produced (and the
+            # previous one indexed) while the model runs
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed") as executor:
+                pending = None
+                for batch in _batched(chunks, batch_size):
+                    future = executor.submit(self._timed_embed_batch, [chunk['text'] for chunk in batch])
+                    if pending:
+                        index_batch(*pending)
+                    pending = (batch, future)
+                if pending:
+                    index_batch(*pending)
+            lexical.close()
+            report('embed', 1.0)
+
+            if vectorstore is None:
+                raise ValueError("No chunks to index")
+            reused = total - embedded
+            rate = f", {embedded / embed_seconds:.1f} chunks/s" if embedded and embed_seconds else ""
+            print(f"Embeddings: {embedded} chunks embedded, {reused} reused{rate}")
+
+            # Swap the flat index for an approximate one on large books
+            kind = index_type or self.index_type
+            if kind == 'auto':
+                kind = choose_index_type(total)
+            if kind != 'flat':
+                start = time.perf_counter()
+                flat = vectorstore.index
+                vectorstore.index = build_index(flat_vectors(flat), kind, metric=flat.metric_type)
+                built = index_type_of(vectorstore.index)
+                if built != kind:
+                    print(f"Too few chunks ({total}) to train a {kind} index; using {built}")
+                print(f"Built {built} index over {total} vectors in {time.perf_counter() - start:.1f}s")
+
+            # Persist to the textbook's own directory and make it resident
+            report('persist', 0.0)
+            doc_hash = doc_hash or _fallback_doc_hash(textbook_name, total)
+            doc_id = doc_id_for(doc_hash)
+            self.library.add(doc_id, textbook_name, doc_hash, sections or [], vectorstore,
+                             section_bodies_path=section_bodies_path, lexical_path=lexical_path)
+        finally:
+            lexical.close()
+            if os.path.exists(lexical_path):
+                os.remove(lexical_path)
+        
+        # Cached answers were grounded in the old index of this book
+        self.semantic_cache.clear(doc_id)
+        report('persist', 1.0)
+
+        print(f"Vectorstore created and persisted successfully! (doc id {doc_id}, {total} chunks)")
+        return {'doc_id': doc_id, 'total_chunks': total, 'chunks_embedded': embedded, 'chunks_reused': reused}
     
-    def create_vectorstore(self, chunks: List[Dict], textbook_name: str, sections: List[Dict] = None):
-        """Create and persist FAISS vectorstore"""
-        print(f"Creating vectorstore with {len(chunks)} chunks...")
-        
-        # Convert chunks to LangChain Documents
-        documents = []
-        for chunk in chunks:
-            doc = Document(
-                page_content=chunk['text'],
-                metadata=chunk['metadata']
-            )
-            documents.append(doc)
-        
-        # Create FAISS vectorstore
-        self.vectorstore = FAISS.from_documents(
-            documents=documents,
-            embedding=self.embeddings
-        )
-        
-        # Persist to disk
-        vectorstore_path = os.path.join(self.persist_dir, "faiss_index")
-        self.vectorstore.save_local(vectorstore_path)
-        
-        # Save metadata including sections
-        metadata = {
-            'textbook_name': textbook_name,
-            'total_chunks': len(chunks),
-            'sections': sections or []
-        }
-        with open(os.path.join(self.persist_dir, "metadata.pkl"), 'wb') as f:
-            pickle.dump(metadata, f)
+    def _timed_embed_batch(self, texts: List[str]) -> Tuple[List[List[float]], int, float]:
+        """_embed_batch plus the seconds it took"""
+        start = time.perf_counter()
+        vectors, new = self._embed_batch(texts)
+        return vectors, new, time.perf_counter() - start
+
+    def _embed_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """
+        Vectors for a batch of chunk texts, reusing stored ones (from any upload)
+        Returns (vectors, number of texts actually embedded).
+        """
+        hashes = [chunk_hash(text) for text in texts]
+        known = self.embedding_store.get_many(hashes)
+        new_texts = {}
+        for h, text in zip(hashes, texts):
+            if h not in known and h not in new_texts:
+                new_texts[h] = text
+        
+        if new_texts:
+            new_vectors = self.embeddings.embed_documents(list(new_texts.values()))
+            self.embedding_store.put_many(zip(new_texts, new_vectors))
+            known.update(zip(new_texts, new_vectors))
+        return [known[h] for h in hashes], len(new_texts)
+    
+    def load_vectorstore(self):
+        """
+        Open the textbook library from disk
+        Only the catalog is read; indexes load on first use. A single index
+        left by an older version (storage/faiss_index + metadata.pkl) is
+        moved into the library.
+        """
+        self._migrate_legacy_index()
         
-        self.textbook_name = textbook_name
-        self.total_chunks = len(chunks)
-        self.sections = sections or []
+        documents = self.library.list_documents()
+        if not documents:
+            return False
         
-        print(f"Vectorstore created and persisted successfully!")
+        print(f"Textbook library: {len(documents)} document(s), default '{self.get_status()['textbook_name']}'")
+        return True
     
-    def load_vectorstore(self):
-        """Load existing vectorstore from disk"""
+    def _migrate_legacy_index(self):
+        """Adopt the pre-library single-book index as a library document"""
         vectorstore_path = os.path.join(self.persist_dir, "faiss_index")
         metadata_path = os.path.join(self.persist_dir, "metadata.pkl")
         
-        if not os.path.exists(vectorstore_path):
-            return False
+        if not os.path.exists(vectorstore_path) or not os.path.exists(metadata_path):
+            return
         
         try:
-            self.vectorstore = FAISS.load_local(
-                vectorstore_path,
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
-            
-            with open(metadata_path, 'rb') as f:
-                metadata = pickle.load(f)
-                self.textbook_name = metadata.get('textbook_name')
-                self.total_chunks = metadata.get('total_chunks', 0)
-                self.sections = metadata.get('sections', [])
+            metadata = restricted_load(metadata_path)
+            textbook_name = metadata.get('textbook_name')
+            total_chunks = metadata.get('total_chunks', 0)
+            doc_hash = metadata.get('doc_hash') or _fallback_doc_hash(textbook_name, total_chunks)
+            doc_id = doc_id_for(doc_hash)
             
-            print(f"Vectorstore loaded: {self.textbook_name} ({self.total_chunks} chunks, {len(self.sections)} sections)")
-            return True
+            self.library.migrate_legacy(
+                self.persist_dir, doc_id, textbook_name, doc_hash,
+                total_chunks, metadata.get('sections', [])
+            )
+            print(f"Migrated existing index '{textbook_name}' into the library as {doc_id}")
         except Exception as e:
-            print(f"Error loading vectorstore: {e}")
-            return False
+            print(f"Error migrating existing index: {e}")
+    
+    def remove_document(self, doc_id: str):
+        """Delete a textbook, its index and everything cached for it"""
+        self.library.remove(doc_id)
+        self.result_cache.clear(doc_id)
+        self.semantic_cache.clear(doc_id)
     
-    def is_ready(self) -> bool:
-        """Check if system is ready"""
-        return self.vectorstore is not None
+    def resolve_doc_id(self, doc_id: Optional[str] = None) -> Optional[str]:
+        """Known doc id for a request (default: most recently uploaded textbook), or None"""
+        return self.library.resolve(doc_id)
+    
+    @contextlib.contextmanager
+    def checkout_textbook(self, doc_id: Optional[str] = None) -> Iterator[TextbookIndex]:
+        """Loaded index of a textbook (loads it if it is not resident), kept open for the block"""
+        resolved = self.library.resolve(doc_id)
+        if resolved is None:
+            if doc_id:
+                raise DocumentNotFoundError(f"Unknown textbook: {doc_id}")
+            raise ValueError("Vectorstore not initialized. Please upload a textbook first.")
+        with self.library.checkout(resolved) as textbook:
+            yield textbook
     
-    def get_status(self) -> Dict:
-        """Get system status"""
+    def is_ready(self, doc_id: Optional[str] = None) -> bool:
+        """Check if a textbook (default: the most recent one) is available"""
+        return self.library.resolve(doc_id) is not None
+    
+    def get_status(self, doc_id: Optional[str] = None) -> Dict:
+        """Get status of a textbook (default: the most recent one), read from the catalog"""
+        resolved = self.library.resolve(doc_id)
+        info = self.library.info(resolved) if resolved else None
         return {
-            'ready': self.is_ready(),
-            'textbook_name': self.textbook_name,
-            'total_chunks': self.total_chunks,
-            'sections': self.sections
+            'ready': info is not None,
+            'doc_id': resolved,
+            'textbook_name': info['textbook_name'] if info else None,
+            'total_chunks': info['total_chunks'] if info else 0,
+            'sections': info['sections'] if info else [],
+            'documents': self.library.list_documents()
         }
     
-    def get_section_info(self, section_id: str) -> Optional[Dict]:
+    def get_section_info(self, section_id: str, doc_id: Optional[str] = None) -> Optional[Dict]:
         """Get information about a specific section"""
-        for section in self.sections:
+        resolved = self.library.resolve(doc_id)
+        info = self.library.info(resolved) if resolved else None
+        for section in (info['sections'] if info else []):
             if section['id'] == section_id:
                 return section
         return None
     
-    def retrieve_context(self, query: str, k: int = 5, section_id: str = None) -> List[Document]:
+    def get_section_text(self, section_id: str, doc_id: Optional[str] = None) -> Optional[str]:
+        """Full text of a section, read from disk on demand"""
+        with self.checkout_textbook(doc_id) as textbook:
+            return textbook.section_text(section_id)
+    
+    def _artifact_cache_key(self, doc_hash: str, section_id: str, artifact: str) -> str:
+        """Result cache key for one artifact of a textbook"""
+        # An artifact may come from its own prompt or the combined one; editing either invalidates it
+        prompt_version = template_version(
+            SECTION_PROMPTS[artifact]['template'] + SECTION_PROMPTS['all']['template']
+        )
+        return ResultCache.make_key(
+            doc_hash, section_id, artifact, prompt_version, self.llm_model_name
+        )
+    
+    def get_cached_artifacts(self, section_id: str, artifacts: List[str],
+                             doc_id: Optional[str] = None) -> Dict[str, any]:
+        """Previously generated artifacts for a section, keyed by artifact name"""
+        # Answered from the catalog, without loading the textbook's index
+        resolved = self.library.resolve(doc_id)
+        if resolved is None:
+            return {}
+        doc_hash = self.library.info(resolved)['doc_hash']
+        cached = {}
+        for artifact in artifacts:
+            value = self.result_cache.get(
+                self._artifact_cache_key(doc_hash, section_id, artifact), namespace=resolved
+            )
+            if value is not None:
+                cached[artifact] = value
+        return cached
+    
+    def cache_artifacts(self, section_id: str, results: Dict[str, any], doc_id: Optional[str] = None):
+        """Store generated artifacts for reuse"""
+        resolved = self.library.resolve(doc_id)
+        if resolved is None:
+            return
+        info = self.library.info(resolved)
+        for artifact, value in results.items():
+            if not value:
+                continue  # never pin an empty generation
+            self.result_cache.put(
+                self._artifact_cache_key(info['doc_hash'], section_id, artifact), value,
+                meta={'textbook_name': info['textbook_name'], 'section_id': section_id,
+                      'artifact': artifact, 'model': self.llm_model_name},
+                namespace=resolved
+            )
+    
+    def lookup_answer(self, question: str, doc_id: Optional[str] = None) -> Tuple[List[float], Optional[Dict]]:
         """
-        Retrieve relevant chunks from vectorstore
-        If section_id provided, filter to only that section's chunks
+        Embed a question and check the semantic cache of a textbook
+        Returns (question vector, cache hit or None); reuse the vector for retrieval on a miss
         """
-        if not self.is_ready():
-            raise ValueError("Vectorstore not initialized. Please upload a textbook first.")
-        
-        retriever = self.vectorstore.as_retriever(search_kwargs={"k": k * 3})  # Get more for filtering
-        docs = retriever.get_relevant_documents(query)
-        
-        # Filter by section if specified
-        if section_id:
-            docs = [doc for doc in docs if doc.metadata.get('section_id') == section_id]
-            docs = docs[:k]  # Limit to k after filtering
+        vector = self.embeddings.embed_query(question)
+        return vector, self.semantic_cache.lookup(vector, namespace=self.library.resolve(doc_id) or '')
+    
+    def lookup_answers(self, questions: List[str],
+                       doc_id: Optional[str] = None) -> Tuple[List[List[float]], List[Optional[Dict]]]:
+        """
+        lookup_answer for many questions, embedding them in one forward pass
+        (other LangChain embeddings than EmbeddingEngine batch as they do)
+        Returns (question vectors, cache hit or None for each question).
+        """
+        if isinstance(self.embeddings, EmbeddingEngine):
+            vectors = self.embeddings.embed_documents(questions, batch_size=len(questions))
         else:
-            docs = docs[:k]
-        
-        return docs
+            vectors = self.embeddings.embed_documents(questions)
+        namespace = self.library.resolve(doc_id) or ''
+        return vectors, [self.semantic_cache.lookup(vector, namespace=namespace) for vector in vectors]
     
-    def generate_summary(self, section_id: str) -> str:
-        """Generate summary for a specific section"""
-        self._initialize_llm()
+    def remember_answer(self, question: str, vector: List[float], result: Dict, doc_id: Optional[str] = None):
+        """Store an answer in the semantic cache of a textbook"""
+        resolved = self.library.resolve(doc_id)
+        if result.get('answer') and resolved:
+            self.semantic_cache.add(vector, question, result, namespace=resolved)
+    
+    def retrieve_context(self, query: str, k: int = 5, section_id: str = None,
+                         query_vector: Optional[List[float]] = None,
+                         doc_id: Optional[str] = None) -> List[Document]:
+        """
+        Retrieve relevant chunks from a textbook's vectorstore
+        If section_id provided, filter to only that section's chunks
+        query_vector: precomputed embedding of query (skips re-embedding)
+        doc_id: textbook to search (default: the most recently uploaded one)
+        Lexical and dense results are fused per the service's retrieval_mode.
+        """
+        with self.checkout_textbook(doc_id) as textbook:
+            if query_vector is None:
+                query_vector = self.embeddings.embed_query(query)
+            
+            retriever = HybridRetriever(textbook, self.retrieval_mode, self.retrieval_candidates)
+            return retriever.search(query, query_vector, k, section_id=section_id)
+    
+    def prepare_section_prompt(self, artifact: str, section_id: str, doc_id: Optional[str] = None) -> Dict:
+        """
+        Retrieve section context and build the prompt for one artifact
+        artifact: 'summary', 'conceptmap', 'tricks', 'qna' or 'all' (combined prompt)
+        """
+        spec = SECTION_PROMPTS[artifact]
         
         # Get section info
-        section = self.get_section_info(section_id)
+        section = self.get_section_info(section_id, doc_id)
         section_title = section['title'] if section else section_id
         
-        query = f"{section_title} summary main topics concepts key points"
+        query = spec['query'].format(section=section_title)
         # Retrieve context filtered by section
-        docs = self.retrieve_context(query, k=3, section_id=section_id)
+        docs = self.retrieve_context(query, k=3, section_id=section_id, doc_id=doc_id)
         
         print(f"Retrieved {len(docs)} chunks for section '{section_title}'")
         
-        # Limit context to ~800 tokens max
-        context = "\n\n".join([doc.page_content[:800] for doc in docs[:3]])
+        prompt = PromptTemplate(input_variables=["context", "section"], template=spec['template'])
+        return self._packed_prompt(
+            {'artifact': artifact, 'section_title': section_title},
+            prompt, {'section': section_title}, docs
+        )
+    
+    def prepare_question_prompt(self, question: str, query_vector: Optional[List[float]] = None,
+                                doc_id: Optional[str] = None) -> Dict:
+        """Retrieve context and build the prompt for a free-form question"""
+        docs = self.retrieve_context(question, k=3, query_vector=query_vector, doc_id=doc_id)
+        return self._question_prompt(question, docs)
+    
+    def prepare_question_prompts(self, questions: List[str], query_vectors: List[List[float]],
+                                 doc_id: Optional[str] = None) -> List[Dict]:
+        """
+        prepare_question_prompt for many questions at once
+        Retrieval is one multi-query search, and a chunk shared by several
+        questions' contexts is read from the chunk store once.
+        """
+        with self.checkout_textbook(doc_id) as textbook:
+            retriever = HybridRetriever(textbook, self.retrieval_mode, self.retrieval_candidates)
+            rankings = retriever.search_positions_batch(questions, query_vectors, k=3)
+            
+            unique = {position for ranking in rankings for position in ranking}
+            docs = {position: retriever.document(position) for position in unique}
+        print(f"Retrieved {len(unique)} distinct chunks for {len(questions)} questions")
+        return [
+            self._question_prompt(question, [docs[p] for p in ranking])
+            for question, ranking in zip(questions, rankings)
+        ]
+    
+    def _question_prompt(self, question: str, docs: List[Document]) -> Dict:
+        prompt = PromptTemplate(input_variables=["context", "question"], template=QUESTION_TEMPLATE)
+        return self._packed_prompt({'artifact': 'answer'}, prompt, {'question': question}, docs)
+    
+    def _packed_prompt(self, prepared: Dict, prompt: PromptTemplate, inputs: Dict,
+                       docs: List[Document]) -> Dict:
+        """
+        Fill in a prepared prompt: the retrieved chunks are deduplicated,
+        merged and fitted to the token budget left by the prompt
+        """
+        budget = self.context_packer.budget(prompt, inputs)
+        context, used = self.context_packer.pack(docs, budget)
+        return dict(
+            prepared,
+            docs=docs,
+            prompt=prompt,
+            inputs=dict(inputs, context=context),
+            sources=[f"Chunk {doc.metadata.get('chunk_id', 'unknown')}" for doc in used],
+        )
+    
+    def run_prompt(self, prepared: Dict, callbacks: Optional[List] = None) -> str:
+        """
+        Run a prepared prompt through the LLM
+        callbacks: optional LangChain callback handlers (e.g. for token streaming)
+        """
+        self._initialize_llm()
         
-        prompt = PromptTemplate(
-            input_variables=["context", "section"],
-            template="""Based on the following content from {section}, create a comprehensive summary:
+        # GPT4All only yields tokens incrementally when asked to stream
+        llm_kwargs = {'streaming': True} if callbacks else {}
+        chain = LLMChain(llm=self.llm, prompt=prepared['prompt'], llm_kwargs=llm_kwargs)
+        # The label lets a batching backend tell short answers from long artifacts
+        with generation_context(label=prepared.get('artifact')):
+            return chain.run(callbacks=callbacks, **prepared['inputs']).strip()
+    
+    def generate_summary(self, section_id: str, doc_id: Optional[str] = None) -> str:
+        """Generate summary for a specific section"""
+        return self.run_prompt(self.prepare_section_prompt('summary', section_id, doc_id))
+    
+    def generate_concept_map(self, section_id: str, doc_id: Optional[str] = None) -> str:
+        """Generate concept map for a specific section"""
+        return self.run_prompt(self.prepare_section_prompt('conceptmap', section_id, doc_id))
+    
+    def generate_tricks(self, section_id: str, doc_id: Optional[str] = None) -> str:
+        """Generate mnemonics and tricks for a specific section"""
+        return self.run_prompt(self.prepare_section_prompt('tricks', section_id, doc_id))
+    
+    def generate_qna(self, section_id: str, doc_id: Optional[str] = None) -> List[Dict[str, str]]:
+        """Generate Q&A pairs for a specific section"""
+        qna_text = self.run_prompt(self.prepare_section_prompt('qna', section_id, doc_id))
+        return parse_qna(qna_text)
+    
+    def generate_all(self, section_id: str, callbacks: Optional[List] = None,
+                     prepared: Optional[Dict] = None, doc_id: Optional[str] = None) -> Dict[str, any]:
+        """
+        Generate every artifact for a section in a single pass
+        The section context is retrieved once and all four artifacts come from
+        one structured completion, so the context is prefilled once instead of
+        four times. Any part the model skips is regenerated on the same context.
+        prepared: result of prepare_section_prompt('all', ...) if already retrieved
+        Returns a dict keyed by artifact ('summary', 'conceptmap', 'tricks', 'qna').
+        """
+        prepared = prepared or self.prepare_section_prompt('all', section_id, doc_id)
+        # The prompt ends with the first heading, so put it back before parsing
+        text = COMBINED_HEADINGS['summary'] + "\n" + self.run_prompt(prepared, callbacks=callbacks)
+        parts = parse_combined(text)
+        
+        results = {}
+        for artifact in COMBINED_HEADINGS:
+            value = parts.get(artifact, '')
+            if artifact == 'qna':
+                value = parse_qna(value)
+            if not value:
+                print(f"Combined output missing '{artifact}', generating it separately...")
+                single = dict(prepared, prompt=PromptTemplate(
+                    input_variables=["context", "section"],
+                    template=SECTION_PROMPTS[artifact]['template']
+                ))
+                value = self.run_prompt(single)
+                if artifact == 'qna':
+                    value = parse_qna(value)
+            results[artifact] = value
+        
+        return results
+    
+    def ask_question(self, question: str, query_vector: Optional[List[float]] = None,
+                     doc_id: Optional[str] = None) -> Dict[str, any]:
+        """Answer free-form question about a textbook"""
+        return self.answer_prepared(self.prepare_question_prompt(question, query_vector, doc_id))
+    
+    def answer_prepared(self, prepared: Dict) -> Dict[str, any]:
+        """Run a prepared question prompt"""
+        return {
+            'answer': self.run_prompt(prepared),
+            'sources': prepared['sources']
+        }
+
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    """Consecutive lists of up to size items"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def doc_id_for(doc_hash: str) -> str:
+    """Library id of a textbook: a prefix of its content hash, so re-uploads map to the same id"""
+    return doc_hash[:16]
+
+
+def _fallback_doc_hash(textbook_name: str, total_chunks: int) -> str:
+    """Stand-in document hash for indexes created without one"""
+    return hashlib.sha256(f"{textbook_name}:{total_chunks}".encode('utf-8')).hexdigest()
+
+
+def parse_qna(qna_text: str) -> List[Dict[str, str]]:
+    """Parse 'Q1: ... / A1: ...' lines into question-answer pairs"""
+    qna_list = []
+    lines = qna_text.split('\n')
+    current_q = None
+    
+    for line in lines:
+        line = line.strip()
+        if line.startswith('Q'):
+            current_q = line.split(':', 1)[1].strip() if ':' in line else line
+        elif line.startswith('A') and current_q:
+            current_a = line.split(':', 1)[1].strip() if ':' in line else line
+            qna_list.append({'question': current_q, 'answer': current_a})
+            current_q = None
+    
+    return qna_list[:5]  # Return max 5
+
+
+def parse_combined(text: str) -> Dict[str, str]:
+    """Split a combined completion into its artifacts by their headings"""
+    # Tolerate '## Concept Map:' style variations of the requested headings
+    by_heading = {
+        heading.lstrip('#').strip().lower(): artifact
+        for artifact, heading in COMBINED_HEADINGS.items()
+    }
+    parts = {}
+    current = None
+    lines = []
+    
+    for line in text.split('\n'):
+        key = by_heading.get(line.strip().lstrip('#').strip().rstrip(':').lower())
+        if key:
+            if current:
+                parts[current] = '\n'.join(lines).strip()
+            current, lines = key, []
+        elif current:
+            lines.append(line)
+    
+    if current:
+        parts[current] = '\n'.join(lines).strip()
+    return parts
+
+
+# Section headings of the combined 'all' completion, in output order
+COMBINED_HEADINGS = {
+    'summary': "### SUMMARY",
+    'conceptmap': "### CONCEPT MAP",
+    'tricks': "### TRICKS",
+    'qna': "### Q&A",
+}
+
+# Retrieval query and prompt template for each section artifact
+SECTION_PROMPTS = {
+    'summary': {
+        'query': "{section} summary main topics concepts key points",
+        'template': """Based on the following content from {section}, create a comprehensive summary:
 
 Context:
 {context}
@@ -216,34 +751,11 @@ Please provide a detailed summary covering:
 - Key points and important information
 - Core ideas and themes
 
-Summary:"""
-        )
-        
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        summary = chain.run(context=context, section=section_title)
-        
-        return summary.strip()
-    
-    def generate_concept_map(self, section_id: str) -> str:
-        """Generate concept map for a specific section"""
-        self._initialize_llm()
-        
-        # Get section info
-        section = self.get_section_info(section_id)
-        section_title = section['title'] if section else section_id
-        
-        query = f"{section_title} concepts relationships hierarchy"
-        # Retrieve context filtered by section
-        docs = self.retrieve_context(query, k=3, section_id=section_id)
-        
-        print(f"Retrieved {len(docs)} chunks for section '{section_title}'")
-        
-        # Limit context to ~800 tokens max
-        context = "\n\n".join([doc.page_content[:800] for doc in docs[:3]])
-        
-        prompt = PromptTemplate(
-            input_variables=["context", "section"],
-            template="""Based on the following content from {section}, create a concept map showing relationships:
+Summary:""",
+    },
+    'conceptmap': {
+        'query': "{section} concepts relationships hierarchy",
+        'template': """Based on the following content from {section}, create a concept map showing relationships:
 
 Context:
 {context}
@@ -254,34 +766,11 @@ Create a hierarchical concept map in text format showing:
 - Relationships between concepts
 Use indentation to show hierarchy.
 
-Concept Map:"""
-        )
-        
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        concept_map = chain.run(context=context, section=section_title)
-        
-        return concept_map.strip()
-    
-    def generate_tricks(self, section_id: str) -> str:
-        """Generate mnemonics and tricks for a specific section"""
-        self._initialize_llm()
-        
-        # Get section info
-        section = self.get_section_info(section_id)
-        section_title = section['title'] if section else section_id
-        
-        query = f"{section_title} important concepts formulas definitions"
-        # Retrieve context filtered by section
-        docs = self.retrieve_context(query, k=3, section_id=section_id)
-        
-        print(f"Retrieved {len(docs)} chunks for section '{section_title}'")
-        
-        # Limit context to ~800 tokens max
-        context = "\n\n".join([doc.page_content[:800] for doc in docs[:3]])
-        
-        prompt = PromptTemplate(
-            input_variables=["context", "section"],
-            template="""Based on the following content from {section}, create memory tricks and mnemonics:
+Concept Map:""",
+    },
+    'tricks': {
+        'query': "{section} important concepts formulas definitions",
+        'template': """Based on the following content from {section}, create memory tricks and mnemonics:
 
 Context:
 {context}
@@ -292,34 +781,11 @@ Provide:
 - Easy ways to remember key points
 - Acronyms or rhymes if applicable
 
-Tricks and Mnemonics:"""
-        )
-        
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        tricks = chain.run(context=context, section=section_title)
-        
-        return tricks.strip()
-    
-    def generate_qna(self, section_id: str) -> List[Dict[str, str]]:
-        """Generate Q&A pairs for a specific section"""
-        self._initialize_llm()
-        
-        # Get section info
-        section = self.get_section_info(section_id)
-        section_title = section['title'] if section else section_id
-        
-        query = f"{section_title} key concepts important topics"
-        # Retrieve context filtered by section
-        docs = self.retrieve_context(query, k=3, section_id=section_id)
-        
-        print(f"Retrieved {len(docs)} chunks for section '{section_title}'")
-        
-        # Limit context to ~800 tokens max
-        context = "\n\n".join([doc.page_content[:800] for doc in docs[:3]])
-        
-        prompt = PromptTemplate(
-            input_variables=["context", "section"],
-            template="""Based on the following content from {section}, create 5 important question-answer pairs:
+Tricks and Mnemonics:""",
+    },
+    'qna': {
+        'query': "{section} key concepts important topics",
+        'template': """Based on the following content from {section}, create 5 important question-answer pairs:
 
 Context:
 {context}
@@ -333,39 +799,38 @@ A2: [Answer]
 
 (Continue for Q3, Q4, Q5)
 
-Q&A:"""
-        )
-        
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        qna_text = chain.run(context=context, section=section_title)
-        
-        # Parse Q&A pairs
-        qna_list = []
-        lines = qna_text.split('\n')
-        current_q = None
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith('Q'):
-                current_q = line.split(':', 1)[1].strip() if ':' in line else line
-            elif line.startswith('A') and current_q:
-                current_a = line.split(':', 1)[1].strip() if ':' in line else line
-                qna_list.append({'question': current_q, 'answer': current_a})
-                current_q = None
-        
-        return qna_list[:5]  # Return max 5
-    
-    def ask_question(self, question: str) -> Dict[str, any]:
-        """Answer free-form question"""
-        self._initialize_llm()
-        
-        docs = self.retrieve_context(question, k=3)
-        # Limit context to ~800 tokens max
-        context = "\n\n".join([doc.page_content[:800] for doc in docs[:3]])
-        
-        prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template="""Based on the following context, answer the question:
+Q&A:""",
+    },
+    # All four artifacts in one structured completion over one retrieval
+    'all': {
+        'query': "{section} summary main topics key concepts relationships formulas definitions",
+        'template': """Based on the following content from {section}, create study materials.
+
+Context:
+{context}
+
+Write the four parts below in order, each starting with its heading exactly as shown.
+
+### SUMMARY
+A detailed summary covering the main topics and concepts, key points and core ideas.
+
+### CONCEPT MAP
+A hierarchical concept map in text format showing main concepts, sub-concepts and the relationships between them. Use indentation to show hierarchy.
+
+### TRICKS
+Mnemonics, memory tricks, easy ways to remember key points, and acronyms or rhymes if applicable.
+
+### Q&A
+5 important question-answer pairs in this exact format:
+Q1: [Question]
+A1: [Answer]
+
+### SUMMARY
+""",
+    },
+}
+
+QUESTION_TEMPLATE = """Based on the following context, answer the question:
 
 Context:
 {context}
@@ -373,14 +838,7 @@ Context:
 Question: {question}
 
 Answer:"""
-        )
-        
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        answer = chain.run(context=context, question=question)
-        
-        sources = [f"Chunk {doc.metadata.get('chunk_id', 'unknown')}" for doc in docs[:3]]
-        
-        return {
-            'answer': answer.strip(),
-            'sources': sources
-        }
+
+# Startup warm-up: one query through the embeddings and index, one short completion
+WARMUP_QUERY = "introduction overview"
+WARMUP_PROMPT = "Say hello."
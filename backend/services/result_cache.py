@@ -0,0 +1,179 @@
+"""
+Persistent cache of generated artifacts
+
+Generated summaries, concept maps, tricks and Q&A are stored on disk under
+persist_dir, content-addressed by a key covering the document hash, section,
+artifact type, prompt template version and model name. An in-memory LRU sits
+in front of the disk store, and the disk store is capped in bytes with
+least-recently-used eviction (file mtime is bumped on every hit).
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def template_version(template: str) -> str:
+    """Short hash identifying a prompt template, so edits invalidate old results"""
+    return hashlib.sha256(template.encode('utf-8')).hexdigest()[:12]
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024, memory_items: int = 256):
+        """
+        cache_dir: directory for cached results (one JSON file per entry)
+        max_bytes: disk size cap; least recently used entries are evicted beyond it
+        memory_items: number of entries kept in the in-memory LRU
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._disk_bytes = self._scan_size()
+
+    @staticmethod
+    def make_key(doc_hash: str, section_id: str, artifact: str,
+                 prompt_version: str, model_name: str) -> str:
+        """Content address for one generated artifact"""
+        raw = json.dumps([doc_hash, section_id, artifact, prompt_version, model_name])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, namespace: str = "") -> str:
+        return os.path.join(self.cache_dir, namespace, key[:2], f"{key}.json")
+
+    def get(self, key: str, namespace: str = "") -> Optional[Any]:
+        """Return the cached value or None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return self._memory[key]
+
+        path = self._path(key, namespace)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)['value']
+            os.utime(path)  # mark as recently used for disk eviction
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: Any, meta: Optional[Dict] = None, namespace: str = ""):
+        """Store a value on disk and in memory"""
+        path = self._path(key, namespace)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({'value': value, 'meta': meta or {}}, ensure_ascii=False).encode('utf-8')
+
+        # Write atomically so concurrent readers never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._remember(key, value)
+            self._disk_bytes += len(data) - old_size
+            over_budget = self._disk_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    def clear(self, namespace: Optional[str] = None):
+        """Drop cached results of one namespace (e.g. a removed textbook), or all of them"""
+        with self._lock:
+            self._memory.clear()
+            if namespace:
+                shutil.rmtree(os.path.join(self.cache_dir, namespace), ignore_errors=True)
+                self._disk_bytes = self._scan_size()
+            else:
+                shutil.rmtree(self.cache_dir, ignore_errors=True)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._disk_bytes = 0
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'memory_hits': self.memory_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_entries': len(self._memory),
+                'disk_bytes': self._disk_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _remember(self, key: str, value: Any):
+        """Insert into the memory LRU (caller holds the lock)"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _entries(self):
+        """(mtime, size, path) for every cached file"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Delete least recently used files until under 90% of the budget"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+
+        for _, size, path in entries:
+            if total <= target:
+                break
+            key = os.path.basename(path)[:-len('.json')]
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._memory.pop(key, None)
+                self.evictions += 1
+
+        with self._lock:
+            self._disk_bytes = total
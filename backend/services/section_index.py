@@ -0,0 +1,87 @@
+"""
+Section-partitioned search over a LangChain FAISS vectorstore
+
+A section -> vector-position table is built alongside the global index. A
+section-filtered query searches a small exact sub-index holding only that
+section's vectors, so it always returns k chunks when the section has that
+many, instead of over-fetching from the whole book and filtering afterwards.
+Sub-indexes are built lazily on a section's first query.
+"""
+import threading
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+
+from services.index_factory import reconstruct
+
+
+class SectionIndex:
+    def __init__(self, vectorstore):
+        self.vectorstore = vectorstore
+        self.positions: Dict[str, np.ndarray] = {}  # section_id -> positions in the global index
+        self._partitions: Dict[str, faiss.Index] = {}
+        self.partition_bytes = 0  # float vectors held by the partitions
+        self._lock = threading.Lock()
+
+        docstore = vectorstore.docstore
+        if hasattr(docstore, 'section_positions'):
+            # ChunkStore answers from its section column without reading any text
+            self.positions = docstore.section_positions()
+            return
+
+        grouped: Dict[str, List[int]] = {}
+        for position, doc_id in vectorstore.index_to_docstore_id.items():
+            doc = docstore.search(doc_id)
+            section_id = doc.metadata.get('section_id') if isinstance(doc, Document) else None
+            if section_id is not None:
+                grouped.setdefault(section_id, []).append(position)
+
+        for section_id, positions in grouped.items():
+            self.positions[section_id] = np.array(sorted(positions), dtype='int64')
+
+    def section_size(self, section_id: str) -> int:
+        """Number of chunks indexed for a section"""
+        positions = self.positions.get(section_id)
+        return 0 if positions is None else len(positions)
+
+    def _partition(self, section_id: str) -> Optional[faiss.Index]:
+        """Exact sub-index over one section's vectors (built on first use)"""
+        with self._lock:
+            if section_id in self._partitions:
+                return self._partitions[section_id]
+            positions = self.positions.get(section_id)
+            if positions is None:
+                return None
+
+            # Approximate global indexes still get an exact partition (PQ
+            # vectors come back decoded, so slightly off)
+            index = self.vectorstore.index
+            vectors = reconstruct(index, positions)
+            partition = faiss.IndexFlat(index.d, index.metric_type)
+            partition.add(vectors)
+            self._partitions[section_id] = partition
+            self.partition_bytes += vectors.nbytes
+            return partition
+
+    def search_positions(self, section_id: str, query_vector: List[float], k: int) -> List[int]:
+        """Global index positions of the top-k chunks of one section, best first"""
+        partition = self._partition(section_id)
+        if partition is None:
+            return []
+
+        query = np.asarray(query_vector, dtype='float32').reshape(1, -1)
+        if self.vectorstore._normalize_L2:
+            faiss.normalize_L2(query)
+        _, local_ids = partition.search(query, min(k, partition.ntotal))
+
+        positions = self.positions[section_id]
+        return [int(positions[local_id]) for local_id in local_ids[0] if local_id >= 0]
+
+    def search(self, section_id: str, query_vector: List[float], k: int) -> List[Document]:
+        """Top-k chunks of one section for a query vector"""
+        return [
+            self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[position])
+            for position in self.search_positions(section_id, query_vector, k)
+        ]
@@ -0,0 +1,140 @@
+"""
+Semantic answer cache for free-form questions
+
+Past questions are embedded with the already-loaded embeddings model and kept
+in a small FAISS inner-product index. A new question whose cosine similarity
+to a cached one is at or above the threshold reuses the stored answer
+instead of running retrieval and GPT4All again ("what is osmosis" /
+"explain osmosis"). Entries expire after a TTL, and the least recently used
+entries are evicted beyond max_entries. Each textbook has its own namespace
+(and index), so an answer is only reused for questions about the same book.
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.92, ttl_seconds: float = 24 * 3600,
+                 max_entries: int = 1000):
+        """
+        threshold: minimum cosine similarity for a hit
+        ttl_seconds: age after which an entry is ignored and dropped
+        max_entries: cap on cached questions (least recently used evicted first)
+        """
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.indexes: Dict[str, faiss.Index] = {}  # namespace -> index, created on first insert
+        self.entries: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype='float32').reshape(1, -1)
+        faiss.normalize_L2(v)
+        return v
+
+    def lookup(self, vector: List[float], namespace: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Best cached entry in a namespace similar enough to the question vector, or None.
+        Returned dict has question, value and similarity.
+        """
+        with self._lock:
+            index = self.indexes.get(namespace)
+            if index is None or index.ntotal == 0:
+                self.misses += 1
+                return None
+
+            now = time.time()
+            scores, ids = index.search(self._normalize(vector), min(4, index.ntotal))
+            for score, entry_id in zip(scores[0], ids[0]):
+                if entry_id < 0 or score < self.threshold:
+                    break  # results are sorted by similarity
+                entry = self.entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                if now - entry['created'] > self.ttl_seconds:
+                    self._remove(int(entry_id))
+                    self.expirations += 1
+                    continue
+                entry['last_used'] = now
+                entry['hits'] += 1
+                self.hits += 1
+                return {'question': entry['question'], 'value': entry['value'],
+                        'similarity': round(float(score), 4)}
+
+            self.misses += 1
+            return None
+
+    def add(self, vector: List[float], question: str, value: Any, namespace: str = ""):
+        """Remember the answer to a question"""
+        v = self._normalize(vector)
+        with self._lock:
+            index = self.indexes.get(namespace)
+            if index is None:
+                index = self.indexes[namespace] = faiss.IndexIDMap(faiss.IndexFlatIP(v.shape[1]))
+
+            now = time.time()
+            entry_id = self._next_id
+            self._next_id += 1
+            index.add_with_ids(v, np.array([entry_id], dtype='int64'))
+            self.entries[entry_id] = {
+                'question': question, 'value': value, 'namespace': namespace,
+                'created': now, 'last_used': now, 'hits': 0,
+            }
+            self._purge(now)
+
+    def clear(self, namespace: Optional[str] = None):
+        """Forget cached answers of one namespace (e.g. a re-indexed textbook), or all of them"""
+        with self._lock:
+            if namespace is None:
+                self.indexes.clear()
+                self.entries.clear()
+                return
+            self.indexes.pop(namespace, None)
+            for entry_id in [i for i, e in self.entries.items() if e['namespace'] == namespace]:
+                del self.entries[entry_id]
+
+    def stats(self) -> Dict:
+        """Hit-rate counters and size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'namespaces': len(self.indexes),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'threshold': self.threshold,
+            }
+
+    def _remove(self, entry_id: int):
+        """Drop one entry (caller holds the lock)"""
+        entry = self.entries.pop(entry_id, None)
+        if entry is not None:
+            self.indexes[entry['namespace']].remove_ids(np.array([entry_id], dtype='int64'))
+
+    def _purge(self, now: float):
+        """Drop expired entries, then LRU entries beyond max_entries (caller holds the lock)"""
+        expired = [i for i, e in self.entries.items() if now - e['created'] > self.ttl_seconds]
+        for entry_id in expired:
+            self._remove(entry_id)
+        self.expirations += len(expired)
+
+        overflow = len(self.entries) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(self.entries, key=lambda i: self.entries[i]['last_used'])[:overflow]
+            for entry_id in oldest:
+                self._remove(entry_id)
+            self.evictions += overflow
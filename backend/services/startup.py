@@ -0,0 +1,168 @@
+"""
+Startup modes and readiness of the models and indexes
+
+Left alone, every component loads on first use: the first upload or
+question waits for the embedding model, the first /generate or /ask for
+GPT4All (one model per inference worker) plus a cold first prompt, and the
+first search of a textbook for its FAISS index. STARTUP_MODE chooses when
+they load instead:
+
+- lazy:       on first use (nothing is loaded at startup)
+- eager:      before the server accepts requests; startup takes as long as
+              loading and warming everything
+- background: right after startup, while the server already answers;
+              /readyz reports 503 until it is done
+
+Warming loads the embedding model and embeds one query, loads the default
+textbook's index and searches it once, and loads the LLM on every
+inference worker and runs a short completion on it.
+
+/healthz (liveness) only says the process answers. /readyz (readiness)
+says whether the configured warm-up has finished and each component is
+hot; a component that failed to load, or an unreachable LLM server, makes
+it not ready.
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from services.inference_executor import QueueFullError
+
+STARTUP_MODES = ('lazy', 'eager', 'background')
+COMPONENTS = ('embeddings', 'index', 'llm')
+# How long a worker that finished warming up waits for the others before
+# going back to serving requests
+LLM_WARMUP_BARRIER_SECONDS = 120
+
+
+class StartupManager:
+    def __init__(self, rag_service, executor, mode: str = 'background'):
+        """
+        rag_service: owner of the embeddings, indexes and LLM backend
+        executor: InferenceExecutor whose workers each load their own LLM
+        mode: one of STARTUP_MODES
+        """
+        if mode not in STARTUP_MODES:
+            raise ValueError(f"Unknown startup mode '{mode}' (expected one of {', '.join(STARTUP_MODES)})")
+        self.rag_service = rag_service
+        self.executor = executor
+        self.mode = mode
+        self.started = time.time()
+        self.warm_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+        self._components = {name: {'state': 'cold'} for name in COMPONENTS}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Warm up per the mode (eager: before returning; background: in a task)"""
+        if self.mode == 'eager':
+            await self._warm()
+        elif self.mode == 'background':
+            self._task = asyncio.ensure_future(self._warm())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    # ---------- warm-up ----------
+
+    async def _warm(self):
+        print(f"Warming up models and index ({self.mode} startup)...")
+        start = time.perf_counter()
+        await self._warm_component('embeddings', run_in_threadpool(self.rag_service.warm_up_embeddings))
+        await self._warm_component('index', run_in_threadpool(self.rag_service.warm_up_index))
+        await self._warm_component('llm', self._warm_llm())
+        self.warm_seconds = round(time.perf_counter() - start, 3)
+        print(f"Warm-up finished in {self.warm_seconds:.1f}s: "
+              + ", ".join(f"{name} {c['state']}" for name, c in self.components().items()))
+
+    async def _warm_component(self, name: str, work):
+        """Run one component's warm-up, recording its state and time"""
+        self._set(name, state='loading')
+        start = time.perf_counter()
+        try:
+            result = await work
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {str(e)}")
+            self._set(name, state='failed', error=str(e), seconds=round(time.perf_counter() - start, 3))
+            return
+        # warm_up_index returns False when there is no textbook to load
+        self._set(name, state='empty' if result is False else 'hot',
+                  seconds=round(time.perf_counter() - start, 3))
+
+    async def _warm_llm(self):
+        """Load the LLM on every inference worker (each holds its own GPT4All model)"""
+        # The barrier keeps each warm-up on its own worker thread until all have
+        # loaded. It is bounded: if a request holds a worker so that some warm-up
+        # cannot start, the others give up waiting instead of blocking the pool.
+        barrier = threading.Barrier(self.executor.max_workers)
+
+        def warm_worker():
+            try:
+                return self.rag_service.warm_up_llm()
+            finally:
+                try:
+                    barrier.wait(timeout=LLM_WARMUP_BARRIER_SECONDS)
+                except threading.BrokenBarrierError:
+                    pass  # the remaining warm-ups load the LLM on whichever worker runs them
+
+        tasks = []
+        while len(tasks) < self.executor.max_workers:
+            try:
+                tasks.append(self.executor.submit(warm_worker))
+            except QueueFullError as e:
+                await asyncio.sleep(min(e.retry_after, 5))
+        await asyncio.gather(*tasks)
+
+    def _set(self, name: str, **fields):
+        with self._lock:
+            self._components[name] = fields
+
+    # ---------- readiness ----------
+
+    def components(self) -> Dict[str, Dict]:
+        """State of each component from the warm-up, updated with what has loaded since"""
+        with self._lock:
+            components = {name: dict(c) for name, c in self._components.items()}
+        rag_service = self.rag_service
+
+        if getattr(rag_service.embeddings, 'loaded', True) and components['embeddings']['state'] != 'failed':
+            components['embeddings']['state'] = 'hot'
+
+        default = rag_service.resolve_doc_id()
+        if default is None:
+            components['index']['state'] = 'empty'
+        elif default in rag_service.library.stats()['resident']:
+            components['index']['state'] = 'hot'
+        elif components['index']['state'] in ('hot', 'empty'):
+            components['index']['state'] = 'cold'  # evicted, or a new upload became the default
+
+        llm = rag_service.llm_backend.stats()
+        if components['llm']['state'] == 'cold' and (llm.get('instances') or llm.get('requests')):
+            components['llm']['state'] = 'hot'  # loaded by a request
+        return components
+
+    def readiness(self) -> Dict:
+        """Whether the service is ready for traffic, per component (may call the LLM server)"""
+        components = self.components()
+        # A model server is hot when it answers, whatever happened at warm-up
+        health = getattr(self.rag_service.llm_backend, 'health', None)
+        if health is not None and components['llm']['state'] != 'loading':
+            components['llm']['state'] = 'hot' if health() else 'unreachable'
+
+        warmed = self.mode == 'lazy' or self.warm_seconds is not None
+        failed = [name for name, c in components.items() if c['state'] in ('failed', 'unreachable')]
+        return {
+            'ready': warmed and not failed,
+            'mode': self.mode,
+            'warm_seconds': self.warm_seconds,
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'components': components,
+        }
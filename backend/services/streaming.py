@@ -0,0 +1,67 @@
+"""
+Server-Sent Events helpers for streaming LLM output
+
+Generation runs on an inference worker thread while the SSE response is an
+async generator on the event loop. EventChannel bridges the two: the worker
+emits (event, data) pairs and the endpoint drains them as SSE frames.
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+
+class GenerationCancelled(Exception):
+    """Raised inside the LLM callback to stop decoding for a gone client"""
+    pass
+
+
+class EventChannel:
+    """Thread-safe queue of events from a worker thread to an async consumer"""
+
+    _CLOSED = object()
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.cancelled = False
+
+    def emit(self, event: str, data: Dict[str, Any]):
+        """Send an event (callable from any thread)"""
+        if self.cancelled:
+            raise GenerationCancelled()
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (event, data))
+
+    def close(self):
+        """Signal that the worker has finished emitting"""
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, self._CLOSED)
+
+    async def events(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Yield events until the worker closes the channel"""
+        while True:
+            item = await self.queue.get()
+            if item is self._CLOSED:
+                return
+            yield item
+
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """LangChain callback that forwards each new LLM token to an EventChannel"""
+
+    raise_error = True  # let GenerationCancelled abort the completion
+
+    def __init__(self, channel: EventChannel, artifact: Optional[str] = None):
+        self.channel = channel
+        self.artifact = artifact
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        data = {'text': token}
+        if self.artifact:
+            data['artifact'] = self.artifact
+        self.channel.emit('token', data)
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Encode one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,180 @@
+"""
+Background warm-up of section artifacts
+
+After a book is ingested, the first user to open each section would wait
+for GPT4All to generate its summary, concept map, tricks and Q&A. When
+warm-up is enabled, newly ingested books are queued here and every section
+is generated in the background, so /generate on a warmed book is a result
+cache lookup.
+
+Warm-up runs at low priority: it submits one section at a time to the same
+inference workers as interactive requests, and only when no interactive
+request is admitted or running. An interactive request therefore waits for
+at most the one section already being warmed.
+
+The queue of books is persisted (warmup.json), and sections whose artifacts
+are already in the result cache are skipped, so warm-up resumes where it
+stopped after a restart.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from services.inference_executor import QueueFullError
+
+
+class WarmupScheduler:
+    def __init__(self, state_path: str, rag_service, executor, generate: Callable,
+                 artifacts: List[str], idle_poll_seconds: float = 1.0):
+        """
+        state_path: JSON file holding the queue of books still to warm
+        rag_service: source of section lists and cached artifacts
+        executor: InferenceExecutor shared with interactive requests
+        generate: fn(doc_id, section_id, artifacts) that generates and caches artifacts
+                  (run on an inference worker)
+        artifacts: artifacts to precompute per section
+        idle_poll_seconds: how often to check whether the workers are idle
+        """
+        self.state_path = state_path
+        self.rag_service = rag_service
+        self.executor = executor
+        self.generate = generate
+        self.artifacts = artifacts
+        self.idle_poll_seconds = idle_poll_seconds
+        self._lock = threading.Lock()
+        self._pending: List[str] = []  # doc ids, oldest first
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.current: Optional[Dict] = None
+        self.sections_generated = 0
+        self.sections_skipped = 0
+        self.sections_failed = 0
+        self._read_state()
+
+    # ---------- persisted queue ----------
+
+    def _read_state(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self._pending = list(json.load(f).get('pending', []))
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable warm-up state {self.state_path}: {e}")
+
+    def _write_state(self):
+        """Persist the queue atomically (caller holds the lock)"""
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'pending': self._pending}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def enqueue(self, doc_id: str):
+        """Queue a book for warm-up (callable from any thread)"""
+        with self._lock:
+            if doc_id not in self._pending:
+                self._pending.append(doc_id)
+                self._write_state()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _done(self, doc_id: str):
+        with self._lock:
+            if doc_id in self._pending:
+                self._pending.remove(doc_id)
+                self._write_state()
+
+    # ---------- background loop ----------
+
+    def start(self):
+        """Start the warm-up loop on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+        with self._lock:
+            if self._pending:
+                print(f"Resuming warm-up of {len(self._pending)} book(s)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            with self._lock:
+                doc_id = self._pending[0] if self._pending else None
+            if doc_id is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                await self._warm(doc_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warm-up of {doc_id} stopped: {str(e)}")
+            finally:
+                self.current = None
+            self._done(doc_id)
+
+    async def _warm(self, doc_id: str):
+        """Generate the missing artifacts of every section of one book"""
+        info = self.rag_service.library.info(doc_id)
+        if info is None:
+            return  # deleted since it was queued
+        sections = info.get('sections', [])
+        start = time.perf_counter()
+        print(f"Warming {len(sections)} sections of {info['textbook_name']} ({doc_id})")
+
+        for number, section in enumerate(sections, start=1):
+            self.current = {'doc_id': doc_id, 'section': number, 'sections': len(sections)}
+            cached = await run_in_threadpool(
+                self.rag_service.get_cached_artifacts, section['id'], self.artifacts, doc_id
+            )
+            missing = [a for a in self.artifacts if a not in cached]
+            if not missing:
+                self.sections_skipped += 1
+                continue
+
+            while True:
+                await self._wait_until_idle()
+                if self.rag_service.library.info(doc_id) is None:
+                    return
+                try:
+                    _, timings = await self.executor.run(self.generate, doc_id, section['id'], missing)
+                    self.sections_generated += 1
+                    print(f"Warmed {section['id']} of {doc_id} ({number}/{len(sections)}, {timings['compute']}s)")
+                except QueueFullError:
+                    continue  # an interactive burst filled the queue meanwhile; wait again
+                except Exception as e:
+                    self.sections_failed += 1
+                    print(f"Warm-up failed for {section['id']} of {doc_id}: {str(e)}")
+                break
+
+        print(f"Warm-up of {doc_id} finished in {time.perf_counter() - start:.1f}s")
+
+    async def _wait_until_idle(self):
+        """Yield to interactive requests: wait until no request is admitted or running"""
+        while self.executor.in_flight > 0:
+            await asyncio.sleep(self.idle_poll_seconds)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = list(self._pending)
+        return {
+            'pending': pending,
+            'current': self.current,
+            'sections_generated': self.sections_generated,
+            'sections_skipped': self.sections_skipped,
+            'sections_failed': self.sections_failed,
+        }
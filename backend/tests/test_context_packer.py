@@ -0,0 +1,44 @@
+from langchain.docstore.document import Document
+
+from services.context_packer import ContextPacker
+
+
+class WordCounter:
+    """One token per word"""
+    max_tokens = None
+    exact = True
+
+    def count(self, texts):
+        return [len(text.split()) for text in texts]
+
+
+def _doc(text: str, section: str) -> Document:
+    return Document(page_content=text, metadata={'section_id': section, 'chunk_id': 0})
+
+
+def _sentences(word: str, count: int) -> str:
+    return ' '.join(f"{word} one two three four." for _ in range(count))
+
+
+def test_smaller_lower_ranked_span_fills_room_a_large_span_leaves():
+    first = _doc(_sentences('first', 2), 'a')  # 10 tokens
+    large = _doc(_sentences('large', 20), 'b')  # 100 tokens
+    small = _doc(_sentences('small', 2), 'c')  # 10 tokens
+    packer = ContextPacker(WordCounter())
+
+    context, used = packer.pack([first, large, small], budget=30)
+
+    # Both small spans whole, then the leading sentences of the large one in the 10 tokens left
+    assert context.split('\n\n') == [first.page_content, _sentences('large', 2), small.page_content]
+    assert used == [first, large, small]
+
+
+def test_nothing_is_cut_when_the_budget_is_already_full():
+    first = _doc(_sentences('first', 2), 'a')
+    large = _doc(_sentences('large', 20), 'b')
+    small = _doc(_sentences('small', 2), 'c')
+
+    context, used = ContextPacker(WordCounter()).pack([first, large, small], budget=20)
+
+    assert context.split('\n\n') == [first.page_content, small.page_content]
+    assert used == [first, small]
@@ -0,0 +1,33 @@
+import numpy as np
+
+from services.embedding_engine import EmbeddingEngine
+from services.rag_service import RAGService
+
+
+class RecordingModel:
+    """Stands in for a SentenceTransformer, recording the size of each forward pass"""
+    max_seq_length = None
+
+    def __init__(self):
+        self.passes = []
+
+    def encode(self, texts, batch_size, **kwargs):
+        self.passes.append(len(texts))
+        return np.ones((len(texts), 4), dtype='float32')
+
+
+def test_question_batch_is_embedded_in_one_forward_pass(tmp_path):
+    model = RecordingModel()
+    engine = EmbeddingEngine(model=model, batch_size=32)
+    service = RAGService(persist_dir=str(tmp_path), embeddings=engine)
+
+    vectors, hits = service.lookup_answers([f"question {i}?" for i in range(50)])
+
+    assert model.passes == [50]
+    assert len(vectors) == 50 and hits == [None] * 50
+
+
+def test_documents_still_use_the_engine_batch_size():
+    model = RecordingModel()
+    EmbeddingEngine(model=model, batch_size=32).embed_documents([f"chunk {i}" for i in range(50)])
+    assert model.passes == [32, 18]
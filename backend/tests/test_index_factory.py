@@ -0,0 +1,31 @@
+import faiss
+import numpy as np
+import pytest
+
+from services.index_factory import build_index, index_type_of
+
+
+def _vectors(n: int, d: int = 32) -> np.ndarray:
+    return np.random.default_rng(0).standard_normal((n, d)).astype('float32')
+
+
+@pytest.mark.parametrize('index_type', ['ivf', 'ivfpq'])
+def test_forced_trained_index_on_a_handful_of_chunks_falls_back_to_flat(index_type):
+    vectors = _vectors(8)
+    index = build_index(vectors, index_type)
+    assert index_type_of(index) == 'flat'
+    assert index.ntotal == 8
+    _, ids = index.search(vectors[3:4], 1)
+    assert ids[0][0] == 3
+
+
+@pytest.mark.parametrize('index_type', ['ivf', 'ivfpq'])
+def test_forced_trained_index_is_built_once_there_are_enough_chunks(index_type):
+    index = build_index(_vectors(2000), index_type)
+    assert index_type_of(index) == index_type
+    assert index.ntotal == 2000
+
+
+def test_metric_survives_the_fallback():
+    index = build_index(_vectors(5), 'ivfpq', metric=faiss.METRIC_INNER_PRODUCT)
+    assert index.metric_type == faiss.METRIC_INNER_PRODUCT
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.inference_executor import InferenceExecutor, QueueFullError
+
+
+async def _until(condition, timeout: float = 2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def test_cancelled_running_request_keeps_its_slot_until_the_work_finishes():
+    finish = threading.Event()
+
+    async def scenario():
+        executor = InferenceExecutor(max_workers=1, max_queue=0)
+        task = executor.submit(finish.wait, 5)
+        await _until(lambda: executor.running == 1)
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The model call is still running on the worker, so the slot stays taken
+        assert executor.in_flight == 1
+        with pytest.raises(QueueFullError):
+            executor.submit(time.sleep, 0)
+
+        finish.set()
+        await _until(lambda: executor.in_flight == 0)
+        assert executor.in_flight == 0
+        result, _ = await executor.submit(lambda: 'next')
+        assert result == 'next'
+        executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_queued_request_frees_its_slot_at_once():
+    finish = threading.Event()
+
+    async def scenario():
+        executor = InferenceExecutor(max_workers=1, max_queue=1)
+        running = executor.submit(finish.wait, 5)
+        await _until(lambda: executor.running == 1)
+        queued = executor.submit(time.sleep, 0)
+        assert executor.in_flight == 2
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        await _until(lambda: executor.in_flight == 1)
+        assert executor.in_flight == 1
+
+        finish.set()
+        await running
+        executor.shutdown()
+
+    asyncio.run(scenario())
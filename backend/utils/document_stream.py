@@ -0,0 +1,288 @@
+"""
+Streaming section detection and chunking with bounded memory
+
+extract_sections() needs the whole document in memory several times over
+(the text, its lines, per-line feature dicts, each section's content, then
+every chunk). DocumentStream produces the same sections and chunks in two
+passes over a spool file instead:
+
+1. scan(): pages are split into lines, cleaned and written to a temporary
+   file while heading candidates are scored and validated on the fly (only a
+   few lines of lookahead are kept).
+2. iter_chunks(): the spool is read back once per group of sections and each
+   section's words are chunked as they stream by. Section bodies are
+   appended to a second file (bodies_path) with their byte offset, length
+   and sha256 recorded on the section, so they can be stored and read back
+   one at a time.
+
+Only heading records and per-section/paragraph counters are held in memory,
+so peak memory no longer grows with the size of the book.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from utils.heading_classifier import Candidate, HeadingDetector, line_features
+from utils.text_extractor import iter_chunks
+
+
+class DocumentStream:
+    def __init__(self, pages: Iterable[str], chunk_size: int = 300, overlap: int = 30,
+                 spool_dir: Optional[str] = None, token_counter=None):
+        """
+        pages: text pieces in document order (e.g. iter_document_pages())
+        chunk_size / overlap: as for chunk_text (in tokens)
+        spool_dir: directory for the temporary line spool (default: system temp)
+        token_counter: token counter of the embedding model (see utils/token_chunker.py)
+        """
+        self.pages = pages
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.token_counter = token_counter
+        self.spool_dir = spool_dir
+        self.spool_path = None
+        self.bodies_path = None  # section bodies (created by scan(), filled by iter_chunks())
+
+        self.raw_chars = 0  # length of the extracted text (as extract_text would return)
+        self.line_count = 0  # cleaned lines
+        self.total_chars = 0  # length of all cleaned lines joined by spaces
+        self._cum_chars = 0  # total length of cleaned lines (without separators)
+        self.headings: List[Candidate] = []  # validated headings
+        self.plan: List[List[Dict]] = []  # groups of sections, each read in one pass
+        self.sections: List[Dict] = []  # filled in as sections are chunked
+        self.chunk_count = 0
+        self.max_chunk_tokens = 0
+
+    # ---------- pass 1 ----------
+
+    def scan(self):
+        """Clean and spool every line, detecting headings as lines go by"""
+        fd, self.spool_path = tempfile.mkstemp(prefix="ingest_", suffix=".lines", dir=self.spool_dir)
+        bodies_fd, self.bodies_path = tempfile.mkstemp(prefix="ingest_", suffix=".sections", dir=self.spool_dir)
+        os.close(bodies_fd)
+        detector = HeadingDetector()
+
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as spool:
+            for piece in self.pages:
+                self.raw_chars += len(piece)
+                for line in piece.split('\n'):
+                    line = line.strip()
+                    if line.startswith('[PAGE_'):
+                        continue
+                    features = line_features(line)
+                    if features is None:
+                        continue
+                    spool.write(line.replace('\n', ' ') + '\n')
+                    detector.add(features)
+
+        self.headings = detector.finish()
+        self.line_count = detector.lines
+        self.total_chars = detector.chars + max(0, self.line_count - 1)
+        self._cum_chars = detector.chars
+        print(f"  ✓ Cleaned {self.line_count} lines, found {detector.candidates} heading candidates, "
+              f"validated {len(self.headings)}")
+
+    # ---------- section planning ----------
+
+    def plan_sections(self) -> int:
+        """
+        Decide section boundaries (headings, or the paragraph fallback)
+        Returns the number of sections that will be produced.
+        """
+        heading_sections = []
+        if len(self.headings) >= 2:
+            for i, heading in enumerate(self.headings):
+                start = heading.idx + 1
+                if i + 1 < len(self.headings):
+                    end = self.headings[i + 1].idx
+                    end_chars = self.headings[i + 1].chars_before
+                else:
+                    end, end_chars = self.line_count, self._cum_chars
+                count = max(0, end - start)
+                length = end_chars - (heading.chars_before + heading.length) + max(0, count - 1)
+
+                # Only include sections with substantial content
+                if length > 100:
+                    heading_sections.append({
+                        'id': f"section_{i}",
+                        'title': heading.text[:100],
+                        'type': heading.type,
+                        'confidence': heading.score,
+                        'start': start, 'end': end, 'length': length,
+                    })
+
+        self.plan = [heading_sections] if heading_sections else []
+        if len(heading_sections) < 2:
+            print("  No clear structure - using intelligent content division...")
+            fallback = self._plan_fallback()
+            if fallback:
+                self.plan.append(fallback)
+
+        return sum(len(group) for group in self.plan)
+
+    def _plan_fallback(self) -> List[Dict]:
+        """Paragraph-based sections (Phase 5 of extract_sections)"""
+        # Calculate optimal section count (3-8 sections based on length)
+        optimal_sections = min(8, max(3, self.total_chars // 2000))
+
+        # Paragraph boundaries and sizes, in one pass over the spool
+        para_starts, para_lengths = [], []
+        count = joined = 0
+        for idx, line in enumerate(self._read_lines()):
+            if count:
+                if (count > 3 and len(line) < 40) or (joined > 200 and line[0].isupper()):
+                    para_lengths.append(joined)
+                    count = joined = 0
+            if count == 0:
+                para_starts.append(idx)
+            joined += len(line) + (1 if count else 0)
+            count += 1
+        if count:
+            para_lengths.append(joined)
+
+        sections = []
+        if not para_lengths:
+            return sections
+
+        paras_per_section = max(1, len(para_lengths) // optimal_sections)
+        for i in range(optimal_sections):
+            start = i * paras_per_section
+            end = start + paras_per_section if i < optimal_sections - 1 else len(para_lengths)
+            if start >= len(para_lengths):
+                break
+
+            group = para_lengths[start:end]
+            length = sum(group) + len(group) - 1
+            if length > 150:
+                sections.append({
+                    'id': f"section_{i}",
+                    'title': None,  # taken from the first sentence while streaming
+                    'number': i + 1,
+                    'type': "content_based",
+                    'confidence': 5,
+                    'start': para_starts[start],
+                    'end': para_starts[end] if end < len(para_starts) else self.line_count,
+                    'length': length,
+                })
+        return sections
+
+    # ---------- pass 2 ----------
+
+    def estimated_chunks(self) -> int:
+        """Approximate number of chunks iter_chunks() will yield (for progress)"""
+        step = (self.chunk_size - self.overlap) * 4
+        return sum(section['length'] // step + 1 for group in self.plan for section in group)
+
+    def iter_chunks(self, progress_callback: Optional[Callable[[float], None]] = None) -> Iterator[Dict]:
+        """
+        Yield chunks (as chunk_text does) section by section; self.sections is
+        appended to as each section starts
+        """
+        if not self.plan:
+            self.plan_sections()
+
+        total = sum(section['end'] - section['start'] for group in self.plan for section in group) or 1
+        done = 0
+        with open(self.bodies_path, 'wb') as bodies:
+            for group in self.plan:
+                lines = enumerate(self._read_lines())
+                for section in group:
+                    head, idx = self._open_section(lines, section)
+                    section_lines = self._section_lines(lines, section, head, idx)
+                    words = self._record_body(section_lines, bodies, self.sections[-1])
+                    for chunk in iter_chunks(words, self.chunk_size, self.overlap, section_id=section['id'],
+                                             section_title=section['title'], counter=self.token_counter):
+                        self.chunk_count += 1
+                        self.max_chunk_tokens = max(self.max_chunk_tokens, chunk['metadata']['token_count'])
+                        yield chunk
+                    done += section['end'] - section['start']
+                    if progress_callback:
+                        progress_callback(done / total)
+        print(f"  ✓ {self.chunk_count} chunks, at most {self.max_chunk_tokens} tokens each")
+
+    def _open_section(self, lines: Iterator, section: Dict):
+        """
+        Read a section's first ~250 characters from the shared spool iterator
+        to fill in its preview (and the title of fallback sections) before any
+        chunk is made. Returns (lines read, index of the last one).
+        """
+        head, head_chars, idx = [], 0, section['start'] - 1
+        for idx, line in lines:
+            if idx < section['start']:
+                continue
+            head.append(line)
+            head_chars += len(line) + 1
+            if head_chars > 251 or idx >= section['end'] - 1:
+                break
+
+        content_head = ' '.join(head)[:251]
+        if section['title'] is None:
+            section['title'] = _fallback_title(content_head, section['number'])
+        self.sections.append({
+            'id': section['id'],
+            'title': section['title'],
+            'preview': content_head[:250] + "..." if section['length'] > 250 else content_head,
+            'type': section['type'],
+            'confidence': section['confidence'],
+            'char_count': section['length'],
+        })
+        print(f"  ✓ Section {len(self.sections)}: '{section['title'][:50]}' ({section['length']} chars)")
+        return head, idx
+
+    @staticmethod
+    def _section_lines(lines: Iterator, section: Dict, head: List[str], idx: int) -> Iterator[str]:
+        """Lines of a section: the ones already read, then the rest from the spool"""
+        yield from head
+        if idx < section['end'] - 1:
+            for idx, line in lines:
+                yield line
+                if idx >= section['end'] - 1:
+                    break
+
+    @staticmethod
+    def _record_body(section_lines: Iterator[str], bodies, entry: Dict) -> Iterator[str]:
+        """
+        Words of a section, appending its content (lines joined by spaces, as
+        extract_sections builds it) to the bodies file on the way
+        """
+        digest = hashlib.sha256()
+        start = bodies.tell()
+        for i, line in enumerate(section_lines):
+            data = ((' ' if i else '') + line).encode('utf-8')
+            bodies.write(data)
+            digest.update(data)
+            yield from line.split()
+        entry.update(offset=start, length=bodies.tell() - start, checksum=digest.hexdigest())
+
+    def _read_lines(self) -> Iterator[str]:
+        with open(self.spool_path, 'r', encoding='utf-8', newline='\n') as spool:
+            for line in spool:
+                yield line[:-1]
+
+    def close(self):
+        """Delete the spool file (and the bodies file unless it was moved away)"""
+        for path in (self.spool_path, self.bodies_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+        self.spool_path = self.bodies_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _fallback_title(content_head: str, number: int) -> str:
+    """Title of a paragraph-based section: its first sentence (as extract_sections does)"""
+    # Extract meaningful title from content
+    sentences = content_head.split('.')
+    title = sentences[0][:80].strip() if sentences else f"Part {number}"
+
+    # Clean up title
+    title = re.sub(r'^\d+\s+', '', title)  # Remove leading numbers
+    if not title or len(title) < 10:
+        title = f"Section {number}"
+    return title
@@ -0,0 +1,221 @@
+"""
+Heading classifier for section detection
+
+Classifies cleaned lines as heading candidates and validates them in a
+single pass. This replaces per-line dicts and a loop over a dozen regexes
+(each recompiled from the cache and run on a freshly lower-cased line) with:
+
+- LineFeatures / Heading: __slots__ records instead of per-line dicts
+- precompiled patterns: every academic section in one alternation, and the
+  numbered / dotted heading forms in another, so a line is matched at most
+  twice
+- HeadingDetector: scores each line as it arrives and validates candidates
+  once their lookahead lines have been seen, so extract_sections and
+  DocumentStream need only one pass over the lines
+
+The results are identical to the original clean_line / score_heading /
+validation rules; benchmarks/bench_sections.py checks this against a golden
+corpus and times it.
+"""
+import re
+from collections import deque
+from typing import Dict, List, Optional
+
+# Academic section patterns (highest confidence)
+ACADEMIC_SECTIONS = {
+    r'^abstract$': ('Abstract', 10),
+    r'^introduction$': ('Introduction', 10),
+    r'^(related work|literature review|background)$': ('Related Work', 10),
+    r'^(methodology|methods?)$': ('Methodology', 10),
+    r'^(experiments?|experimental setup)$': ('Experiments', 10),
+    r'^(results?|findings?)$': ('Results', 10),
+    r'^(discussion|analysis)$': ('Discussion', 10),
+    r'^(conclusion|conclusions?)$': ('Conclusion', 10),
+    r'^(references?|bibliography)$': ('References', 10),
+    r'^(acknowledgements?|acknowledgments?)$': ('Acknowledgements', 10),
+    r'^(appendix|appendices)$': ('Appendix', 10),
+}
+
+# Lines after a heading candidate that are checked for body text
+HEADING_LOOKAHEAD = 4
+
+# Candidates closer than this (in cleaned lines) to the previous heading compete with it
+MIN_HEADING_GAP = 3
+
+# First matching pattern wins, as when they were tried in order
+_ACADEMIC_RE = re.compile('|'.join(f"(?P<a{i}>{pattern})" for i, pattern in enumerate(ACADEMIC_SECTIONS)))
+_ACADEMIC_TITLES = list(ACADEMIC_SECTIONS.values())
+
+# Numbered (Chapter 1, Section 2.1) or dotted (1. Introduction, 2.3 Methods) headings
+_STRUCTURED_RE = re.compile(
+    r'(?i:(chapter|section|part|unit|module|lesson|article)(\s+))\d+'
+    r'|(\d+\.(?:\d+\.?)?\s+)[A-Z][a-zA-Z\s]{2,}$'
+)
+
+_NOISE_PREFIXES = ('http', 'www.', 'doi:')
+_NOISE_RE = re.compile(r'\d{4}-\d{4}|[\d\s\-\(\)]+$')  # ISSN, phone/reference numbers
+_SPECIAL_RE = re.compile(r'[^a-zA-Z0-9\s]')
+_DIGIT_RE = re.compile(r'\d')
+
+
+class LineFeatures:
+    """Features of one cleaned line"""
+
+    __slots__ = ('text', 'length', 'words', 'is_upper', 'is_title_case', 'starts_with_capital', 'has_numbers')
+
+    def __init__(self, text: str, length: int, words: int, is_upper: bool, is_title_case: bool,
+                 starts_with_capital: bool, has_numbers: bool):
+        self.text = text
+        self.length = length
+        self.words = words
+        self.is_upper = is_upper
+        self.is_title_case = is_title_case
+        self.starts_with_capital = starts_with_capital
+        self.has_numbers = has_numbers
+
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Heading:
+    """A heading candidate: cleaned title, original line, type and score"""
+
+    __slots__ = ('text', 'original_text', 'type', 'score')
+
+    def __init__(self, text: str, original_text: str, heading_type: str, score: int):
+        self.text = text
+        self.original_text = original_text
+        self.type = heading_type
+        self.score = score
+
+    def as_dict(self) -> Dict:
+        return {'text': self.text, 'original_text': self.original_text, 'type': self.type, 'score': self.score}
+
+
+def line_features(line: str) -> Optional[LineFeatures]:
+    """
+    Features of one stripped line, or None if it is noise
+    (too short, e-mail, URL, DOI, ISSN, reference numbers, mostly symbols)
+    """
+    length = len(line)
+    if length < 3:
+        return None
+    if (('@' in line and '.' in line) or line.startswith(_NOISE_PREFIXES) or _NOISE_RE.match(line)
+            or len(_SPECIAL_RE.findall(line)) > length * 0.4):
+        return None
+    return LineFeatures(line, length, len(line.split()), line.isupper(), line.istitle(),
+                        line[0].isupper(), _DIGIT_RE.search(line) is not None)
+
+
+def classify_heading(f: LineFeatures) -> Optional[Heading]:
+    """Heading candidate for a cleaned line (score at least 5), else None"""
+    line = f.text
+
+    academic = _ACADEMIC_RE.match(line.lower())
+    if academic:
+        title, score = _ACADEMIC_TITLES[int(academic.lastgroup[1:])]
+        return Heading(title, line, 'academic_section', score)
+
+    structured = _STRUCTURED_RE.match(line)
+    if structured:
+        if structured.group(1):
+            # Pattern 1: Numbered sections (Chapter 1, Section 2.1, etc.)
+            number = line[structured.end(2):].strip()
+            return Heading(f"{line.split()[0].title()} {number}", line, 'numbered_section', 9)
+        # Pattern 2: Dotted numbering (1. Introduction, 2.3 Methods)
+        return Heading(line[structured.end(3):], line, 'dotted_number', 8)
+
+    length, words = f.length, f.words
+    # Pattern 3: ALL CAPS multi-word headings
+    if f.is_upper and words >= 2 and 8 <= length <= 60 and not f.has_numbers:
+        return Heading(line.title(), line, 'all_caps', 7)
+    # Pattern 4: Title Case without ending punctuation
+    if (f.is_title_case and words >= 2 and 10 <= length <= 80
+            and not line.endswith(('.', ',', ';', ':', '?', '!'))):
+        return Heading(line, line, 'title_case', 6)
+    # Pattern 5: Short capitalized lines (potential headings)
+    if f.starts_with_capital and 2 <= words <= 8 and 15 <= length <= 70 and not line.endswith(('.', ',')):
+        return Heading(line, line, 'short_capitalized', 5)
+    return None
+
+
+class Candidate:
+    """A heading candidate at cleaned-line index idx, awaiting validation"""
+
+    __slots__ = ('idx', 'heading', 'has_content', 'chars_before', 'length')
+
+    def __init__(self, idx: int, heading: Heading, chars_before: int, length: int):
+        self.idx = idx
+        self.heading = heading
+        self.has_content = False
+        self.chars_before = chars_before  # total length of the cleaned lines before it
+        self.length = length
+
+    @property
+    def text(self) -> str:
+        return self.heading.text
+
+    @property
+    def type(self) -> str:
+        return self.heading.type
+
+    @property
+    def score(self) -> int:
+        return self.heading.score
+
+
+class HeadingDetector:
+    """
+    Scores cleaned lines as they arrive and validates heading candidates
+    A candidate is kept when one of its next HEADING_LOOKAHEAD lines is
+    body text (or it scores 9+); of candidates closer than MIN_HEADING_GAP
+    lines, the higher-scoring one wins.
+    """
+
+    def __init__(self):
+        self.headings: List[Candidate] = []  # validated, in document order
+        self.candidates = 0
+        self.lines = 0
+        self.chars = 0  # total length of the cleaned lines so far
+        self._pending = deque()  # candidates still waiting for their lookahead lines
+
+    def add(self, f: LineFeatures) -> Optional[Candidate]:
+        """Feed the next cleaned line; returns its candidate record, if any"""
+        idx = self.lines
+        pending = self._pending
+        if pending:
+            # This line is lookahead for the candidates just before it
+            if f.length > 50 and not f.is_upper:
+                for candidate in pending:
+                    if idx - candidate.idx <= HEADING_LOOKAHEAD:
+                        candidate.has_content = True
+            while pending and idx - pending[0].idx >= HEADING_LOOKAHEAD:
+                self._resolve(pending.popleft())
+
+        candidate = None
+        heading = classify_heading(f)
+        if heading is not None:
+            candidate = Candidate(idx, heading, self.chars, f.length)
+            pending.append(candidate)
+            self.candidates += 1
+
+        self.chars += f.length
+        self.lines += 1
+        return candidate
+
+    def finish(self) -> List[Candidate]:
+        """Validate the remaining candidates; returns the validated headings"""
+        while self._pending:
+            self._resolve(self._pending.popleft())
+        return self.headings
+
+    def _resolve(self, candidate: Candidate):
+        headings = self.headings
+        if headings and candidate.idx - headings[-1].idx < MIN_HEADING_GAP:
+            # Keep the one with higher score
+            if candidate.heading.score > headings[-1].heading.score:
+                headings[-1] = candidate
+            return
+        if candidate.has_content or candidate.heading.score >= 9:  # academic sections don't need content
+            headings.append(candidate)
+
@@ -1,13 +1,24 @@
 """
 Text extraction utilities for PDF, PPT, and DOCX files
 """
+import os
 import re
-from typing import List, Dict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 import PyPDF2
 import pdfplumber
 from pptx import Presentation
 from docx import Document
 
+from utils.heading_classifier import (  # noqa: F401 (ACADEMIC_SECTIONS, HEADING_LOOKAHEAD re-exported)
+    ACADEMIC_SECTIONS, HEADING_LOOKAHEAD, HeadingDetector, LineFeatures, classify_heading, line_features
+)
+from utils.token_chunker import ApproxTokenCounter, iter_token_chunks
+
+_WORD_RE = re.compile(r'\S+')
+
 
 def clean_text(text: str) -> str:
     """Clean and normalize extracted text"""
@@ -20,30 +31,118 @@ def clean_text(text: str) -> str:
     return text.strip()
 
 
-def extract_from_pdf(file_path: str) -> str:
-    """Extract text from PDF using pdfplumber with page preservation"""
-    text = ""
+# Minimum pages before extraction is sharded across processes, and per shard
+PARALLEL_MIN_PAGES = 32
+MIN_SHARD_PAGES = 8
+
+
+def _iter_page_range(file_path: str, start: int, end: int) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page_number, text) for pages [start, end)
+    A page pdfplumber cannot read is retried with PyPDF2, so one bad page does
+    not lose the rest of the book.
+    """
+    fallback_reader = None
+
+    def fallback(page_index: int) -> str:
+        nonlocal fallback_reader
+        if fallback_reader is None:
+            fallback_reader = PyPDF2.PdfReader(file_path)
+        return fallback_reader.pages[page_index].extract_text() or ""
+
     try:
-        with pdfplumber.open(file_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, 1):
-                page_text = page.extract_text()
-                if page_text:
-                    # Keep page markers for section detection
-                    text += f"[PAGE_{page_num}]\n{page_text}\n\n"
+        pdf = pdfplumber.open(file_path)
     except Exception as e:
+        # The document itself could not be opened by pdfplumber
         print(f"Error extracting PDF with pdfplumber: {e}")
-        # Fallback to PyPDF2
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page_num, page in enumerate(pdf_reader.pages, 1):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"[PAGE_{page_num}]\n{page_text}\n\n"
-        except Exception as e2:
-            print(f"Error extracting PDF with PyPDF2: {e2}")
-            raise
-    
+        for page_index in range(start, end):
+            yield page_index + 1, fallback(page_index)
+        return
+
+    with pdf:
+        for page_index in range(start, end):
+            page = pdf.pages[page_index]
+            try:
+                page_text = page.extract_text()
+            except Exception as e:
+                print(f"Error extracting page {page_index + 1} with pdfplumber: {e}")
+                page_text = fallback(page_index)
+            page.flush_cache()  # parsed layout objects are not needed again
+            yield page_index + 1, page_text or ""
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract pages [start, end) as (page_number, text) pairs (runs in a worker process)"""
+    return list(_iter_page_range(file_path, start, end))
+
+
+def _pdf_page_count(file_path: str) -> int:
+    """Number of pages (PyPDF2 reads the page tree without parsing content)"""
+    try:
+        return len(PyPDF2.PdfReader(file_path).pages)
+    except Exception:
+        with pdfplumber.open(file_path) as pdf:
+            return len(pdf.pages)
+
+
+def iter_pdf_pages(file_path: str, workers: Optional[int] = None,
+                   progress_callback: Optional[Callable[[float], None]] = None) -> Iterator[str]:
+    """
+    Yield one '[PAGE_n]' block per non-empty page, in page order
+    workers: processes to shard pages across (default: CPU count; 1 = serial)
+    progress_callback: optional fn(fraction of pages done)
+    Only a bounded window of shards is in flight, so pages are never all held in memory.
+    """
+    page_count = _pdf_page_count(file_path)
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, max(1, page_count // MIN_SHARD_PAGES))
+
+    if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+        for page_num, page_text in _iter_page_range(file_path, 0, page_count):
+            yield from _page_blocks([(page_num, page_text)])
+            if progress_callback:
+                progress_callback(page_num / page_count)
+        return
+
+    # Several shards per worker so a slow range of pages does not stall the pool
+    shard_size = max(MIN_SHARD_PAGES, -(-page_count // (workers * 4)))
+    shards = [(start, min(start + shard_size, page_count)) for start in range(0, page_count, shard_size)]
+    print(f"Extracting {page_count} pages in {len(shards)} shards across {workers} processes...")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(shards)
+        in_flight = deque(
+            pool.submit(_extract_page_range, file_path, start, end)
+            for start, end in islice(remaining, workers * 2)
+        )
+        done = 0
+        while in_flight:
+            pages = in_flight.popleft().result()
+            following = next(remaining, None)
+            if following is not None:
+                in_flight.append(pool.submit(_extract_page_range, file_path, *following))
+            done += 1
+            yield from _page_blocks(pages)
+            if progress_callback:
+                progress_callback(done / len(shards))
+
+
+def _page_blocks(pages: List[Tuple[int, str]]) -> Iterator[str]:
+    for page_num, page_text in pages:
+        if page_text:
+            # Keep page markers for section detection
+            yield f"[PAGE_{page_num}]\n{page_text}\n\n"
+
+
+def extract_from_pdf(file_path: str, workers: Optional[int] = None,
+                     progress_callback: Optional[Callable[[float], None]] = None) -> str:
+    """
+    Extract text from PDF using pdfplumber with page preservation
+    workers: processes to shard pages across (default: CPU count; 1 = serial)
+    progress_callback: optional fn(fraction of pages done)
+    """
+    # Join once at the end; appending to a string is quadratic on big books
+    text = "".join(iter_pdf_pages(file_path, workers=workers, progress_callback=progress_callback))
     return text  # Don't clean yet - we need structure for section detection
 
 
@@ -80,10 +179,28 @@ def extract_from_docx(file_path: str) -> str:
     return clean_text(text)
 
 
-def extract_text(file_path: str, file_type: str) -> str:
-    """Main extraction function"""
+def iter_document_pages(file_path: str, file_type: str, workers: Optional[int] = None,
+                        progress_callback: Optional[Callable[[float], None]] = None) -> Iterator[str]:
+    """
+    Yield a document's text in pieces whose concatenation equals extract_text()
+    PDFs stream page by page; slides and Word documents come as one piece.
+    """
+    if file_type == "pdf":
+        yield from iter_pdf_pages(file_path, workers=workers, progress_callback=progress_callback)
+    else:
+        yield extract_text(file_path, file_type)
+        if progress_callback:
+            progress_callback(1.0)
+
+
+def extract_text(file_path: str, file_type: str, workers: Optional[int] = None,
+                 progress_callback: Optional[Callable[[float], None]] = None) -> str:
+    """
+    Main extraction function
+    workers / progress_callback: passed to PDF extraction
+    """
     if file_type == "pdf":
-        return extract_from_pdf(file_path)
+        return extract_from_pdf(file_path, workers=workers, progress_callback=progress_callback)
     elif file_type == "pptx":
         return extract_from_pptx(file_path)
     elif file_type == "docx":
@@ -92,6 +209,25 @@ def extract_text(file_path: str, file_type: str) -> str:
         raise ValueError(f"Unsupported file type: {file_type}")
 
 
+def clean_line(line: str) -> Optional[Dict]:
+    """
+    Features of one stripped line as a dict, or None if it is noise
+    (see heading_classifier.line_features)
+    """
+    features = line_features(line)
+    return features.as_dict() if features else None
+
+
+def score_heading(line_obj: Dict) -> Optional[Dict]:
+    """
+    Heading confidence for a cleaned line (a clean_line dict)
+    Returns {'text', 'original_text', 'type', 'score'} when the score is at
+    least 5, else None.
+    """
+    heading = classify_heading(LineFeatures(**{name: line_obj[name] for name in LineFeatures.__slots__}))
+    return heading.as_dict() if heading else None
+
+
 def extract_sections(text: str) -> List[Dict[str, str]]:
     """
     1. Document structure analysis (headings, formatting)
@@ -106,163 +242,31 @@ def extract_sections(text: str) -> List[Dict[str, str]]:
     sections = []
     lines = text.split('\n')
     
-    # ========== PHASE 1: TEXT CLEANING & NORMALIZATION ==========
-    print("\n[Phase 1] Cleaning and normalizing text...")
+    # ========== PHASES 1-3: CLEANING, HEADING SCORING & VALIDATION ==========
+    # One pass: each line is cleaned, scored, and used as lookahead to
+    # validate the candidates just before it
+    print("\n[Phase 1-3] Cleaning lines, scoring and validating headings...")
     cleaned_lines = []
-    page_boundaries = []  # Track page breaks for context
+    detector = HeadingDetector()
     
-    for idx, line in enumerate(lines):
+    for line in lines:
         line = line.strip()
         
-        # Track page boundaries
+        # Page markers only separate pages
         if line.startswith('[PAGE_'):
-            page_match = re.match(r'\[PAGE_(\d+)\]', line)
-            if page_match:
-                page_boundaries.append((idx, int(page_match.group(1))))
             continue
         
-        # Skip empty or very short lines
-        if len(line) < 3:
-            continue
-            
-        # Skip metadata patterns
-        if any([
-            '@' in line and '.' in line,  # Email addresses
-            line.startswith('http'),  # URLs
-            line.startswith('www.'),
-            line.startswith('doi:'),  # DOI references
-            re.match(r'^\d{4}-\d{4}', line),  # ISSN numbers
-            re.match(r'^[\d\s\-\(\)]+$', line),  # Phone/reference numbers
-            len(re.findall(r'[^a-zA-Z0-9\s]', line)) > len(line) * 0.4  # Too many special chars
-        ]):
+        features = line_features(line)
+        if features is None:
             continue
         
-        cleaned_lines.append({
-            'text': line,
-            'original_idx': idx,
-            'length': len(line),
-            'words': len(line.split()),
-            'is_upper': line.isupper(),
-            'is_title_case': line.istitle(),
-            'starts_with_capital': line[0].isupper() if line else False,
-            'has_numbers': bool(re.search(r'\d', line))
-        })
+        cleaned_lines.append(line)
+        detector.add(features)
     
-    print(f"  ✓ Cleaned: {len(lines)} → {len(cleaned_lines)} lines")
-    
-    # ========== PHASE 2: HEADING DETECTION WITH SCORING ==========
-    print("\n[Phase 2] Detecting headings with confidence scoring...")
-    heading_candidates = []
-    
-    # Academic section patterns (highest confidence)
-    ACADEMIC_SECTIONS = {
-        r'^abstract$': ('Abstract', 10),
-        r'^introduction$': ('Introduction', 10),
-        r'^(related work|literature review|background)$': ('Related Work', 10),
-        r'^(methodology|methods?)$': ('Methodology', 10),
-        r'^(experiments?|experimental setup)$': ('Experiments', 10),
-        r'^(results?|findings?)$': ('Results', 10),
-        r'^(discussion|analysis)$': ('Discussion', 10),
-        r'^(conclusion|conclusions?)$': ('Conclusion', 10),
-        r'^(references?|bibliography)$': ('References', 10),
-        r'^(acknowledgements?|acknowledgments?)$': ('Acknowledgements', 10),
-        r'^(appendix|appendices)$': ('Appendix', 10),
-    }
-    
-    for idx, line_obj in enumerate(cleaned_lines):
-        line = line_obj['text']
-        score = 0
-        heading_type = 'unknown'
-        cleaned_title = line
-        
-        # Check academic sections first
-        for pattern, (title, conf) in ACADEMIC_SECTIONS.items():
-            if re.match(pattern, line.lower()):
-                score = conf
-                heading_type = 'academic_section'
-                cleaned_title = title
-                break
-        
-        if score == 0:  # Not an academic section, check other patterns
-            
-            # Pattern 1: Numbered sections (Chapter 1, Section 2.1, etc.)
-            if re.match(r'^(chapter|section|part|unit|module|lesson|article)\s+\d+', line, re.IGNORECASE):
-                score = 9
-                heading_type = 'numbered_section'
-                cleaned_title = re.sub(r'^(chapter|section|part|unit|module|lesson|article)\s+', '', line, flags=re.IGNORECASE).strip()
-                cleaned_title = f"{line.split()[0].title()} {cleaned_title}"
-            
-            # Pattern 2: Dotted numbering (1. Introduction, 2.3 Methods)
-            elif re.match(r'^\d+\.(\d+\.?)?\s+[A-Z][a-zA-Z\s]{2,}$', line):
-                score = 8
-                heading_type = 'dotted_number'
-                # Remove number prefix
-                cleaned_title = re.sub(r'^\d+\.(\d+\.?)?\s+', '', line)
-            
-            # Pattern 3: ALL CAPS multi-word headings
-            elif (line_obj['is_upper'] and 
-                  line_obj['words'] >= 2 and 
-                  8 <= line_obj['length'] <= 60 and
-                  not line_obj['has_numbers']):
-                score = 7
-                heading_type = 'all_caps'
-                cleaned_title = line.title()  # Convert to title case
-            
-            # Pattern 4: Title Case without ending punctuation
-            elif (line_obj['is_title_case'] and
-                  line_obj['words'] >= 2 and
-                  10 <= line_obj['length'] <= 80 and
-                  not line.endswith(('.', ',', ';', ':', '?', '!'))):
-                score = 6
-                heading_type = 'title_case'
-            
-            # Pattern 5: Short capitalized lines (potential headings)
-            elif (line_obj['starts_with_capital'] and
-                  2 <= line_obj['words'] <= 8 and
-                  15 <= line_obj['length'] <= 70 and
-                  not line.endswith(('.', ','))):
-                score = 5
-                heading_type = 'short_capitalized'
-        
-        if score >= 5:  # Only keep candidates with decent confidence
-            heading_candidates.append({
-                'idx': idx,
-                'text': cleaned_title,
-                'original_text': line,
-                'type': heading_type,
-                'score': score,
-                'line_obj': line_obj
-            })
-    
-    print(f"  ✓ Found {len(heading_candidates)} heading candidates")
-    
-    # ========== PHASE 3: HEADING VALIDATION & FILTERING ==========
-    print("\n[Phase 3] Validating and filtering headings...")
-    
-    # Sort by position
-    heading_candidates.sort(key=lambda x: x['idx'])
-    
-    # Remove duplicates and too-close headings
-    validated_headings = []
-    for i, heading in enumerate(heading_candidates):
-        # Skip if too close to previous heading (< 3 lines)
-        if validated_headings and heading['idx'] - validated_headings[-1]['idx'] < 3:
-            # Keep the one with higher score
-            if heading['score'] > validated_headings[-1]['score']:
-                validated_headings[-1] = heading
-            continue
-        
-        # Check if next few lines look like content (not another heading)
-        has_content = False
-        for j in range(heading['idx'] + 1, min(heading['idx'] + 5, len(cleaned_lines))):
-            next_line = cleaned_lines[j]
-            if next_line['length'] > 50 and not next_line['is_upper']:
-                has_content = True
-                break
-        
-        if has_content or heading['score'] >= 9:  # Academic sections don't need content check
-            validated_headings.append(heading)
+    validated_headings = detector.finish()
     
+    print(f"  ✓ Cleaned: {len(lines)} → {len(cleaned_lines)} lines")
+    print(f"  ✓ Found {detector.candidates} heading candidates")
     print(f"  ✓ Validated: {len(validated_headings)} high-quality headings")
     
     # ========== PHASE 4: SECTION CONSTRUCTION ==========
@@ -270,12 +274,11 @@ def extract_sections(text: str) -> List[Dict[str, str]]:
     
     if len(validated_headings) >= 2:
         for i, heading in enumerate(validated_headings):
-            start_idx = heading['idx']
-            end_idx = validated_headings[i + 1]['idx'] if i + 1 < len(validated_headings) else len(cleaned_lines)
+            start_idx = heading.idx
+            end_idx = validated_headings[i + 1].idx if i + 1 < len(validated_headings) else len(cleaned_lines)
             
             # Extract content between headings
-            section_lines = cleaned_lines[start_idx + 1:end_idx]
-            content = ' '.join([l['text'] for l in section_lines])
+            content = ' '.join(cleaned_lines[start_idx + 1:end_idx])
             
             # Only include sections with substantial content
             if len(content) > 100:
@@ -283,21 +286,21 @@ def extract_sections(text: str) -> List[Dict[str, str]]:
                 
                 sections.append({
                     "id": f"section_{i}",
-                    "title": heading['text'][:100],
+                    "title": heading.text[:100],
                     "preview": preview,
                     "content": content,
-                    "type": heading['type'],
-                    "confidence": heading['score']
+                    "type": heading.type,
+                    "confidence": heading.score
                 })
                 
-                print(f"  ✓ Section {i+1}: '{heading['text'][:50]}' ({len(content)} chars, score: {heading['score']})")
+                print(f"  ✓ Section {i+1}: '{heading.text[:50]}' ({len(content)} chars, score: {heading.score})")
     
     # ========== PHASE 5: INTELLIGENT FALLBACK ==========
     if len(sections) < 2:
         print("\n[Phase 5] No clear structure - using intelligent content division...")
         
         # Combine all text
-        full_text = ' '.join([l['text'] for l in cleaned_lines])
+        full_text = ' '.join(cleaned_lines)
         total_chars = len(full_text)
         
         # Calculate optimal section count (3-8 sections based on length)
@@ -307,8 +310,7 @@ def extract_sections(text: str) -> List[Dict[str, str]]:
         paragraphs = []
         current_para = []
         
-        for i, line_obj in enumerate(cleaned_lines):
-            line = line_obj['text']
+        for line in cleaned_lines:
             
             # Start new paragraph on:
             # - Short lines after long content
@@ -370,60 +372,25 @@ def extract_sections(text: str) -> List[Dict[str, str]]:
 
 
 def chunk_text(text: str, chunk_size: int = 300, overlap: int = 30, 
-               section_id: str = None, section_title: str = None) -> List[Dict[str, any]]:
+               section_id: str = None, section_title: str = None, counter=None) -> List[Dict[str, any]]:
     """
     Chunk text into smaller pieces with metadata
-    chunk_size: approximate number of tokens per chunk
+    chunk_size: maximum number of tokens per chunk
     overlap: number of tokens to overlap between chunks
     section_id: ID of the section this text belongs to
     section_title: Title of the section
+    counter: token counter of the embedding model (see utils/token_chunker.py;
+             default: 4 characters per token)
     """
-    # Approximate: 1 token ≈ 4 characters
-    char_chunk_size = chunk_size * 4
-    char_overlap = overlap * 4
-    
-    chunks = []
-    words = text.split()
-    
-    current_chunk = []
-    current_length = 0
-    chunk_id = 0
-    
-    for word in words:
-        current_chunk.append(word)
-        current_length += len(word) + 1  # +1 for space
-        
-        if current_length >= char_chunk_size:
-            chunk_text = ' '.join(current_chunk)
-            chunks.append({
-                'chunk_id': chunk_id,
-                'text': chunk_text,
-                'metadata': {
-                    'chunk_id': chunk_id,
-                    'char_count': len(chunk_text),
-                    'section_id': section_id,
-                    'section_title': section_title
-                }
-            })
-            chunk_id += 1
-            
-            # Keep overlap for next chunk
-            overlap_words = int(len(current_chunk) * (char_overlap / char_chunk_size))
-            current_chunk = current_chunk[-overlap_words:] if overlap_words > 0 else []
-            current_length = sum(len(w) + 1 for w in current_chunk)
-    
-    # Add remaining chunk
-    if current_chunk:
-        chunk_text = ' '.join(current_chunk)
-        chunks.append({
-            'chunk_id': chunk_id,
-            'text': chunk_text,
-            'metadata': {
-                'chunk_id': chunk_id,
-                'char_count': len(chunk_text),
-                'section_id': section_id,
-                'section_title': section_title
-            }
-        })
-    
-    return chunks
+    words = (m.group() for m in _WORD_RE.finditer(text))
+    return list(iter_chunks(words, chunk_size, overlap, section_id, section_title, counter))
+
+
+def iter_chunks(words: Iterable[str], chunk_size: int = 300, overlap: int = 30,
+                section_id: str = None, section_title: str = None, counter=None) -> Iterator[Dict[str, any]]:
+    """
+    Chunk a stream of words, yielding each chunk as soon as it is complete
+    Same chunks as chunk_text(' '.join(words)), without holding the text.
+    """
+    return iter_token_chunks(words, counter or ApproxTokenCounter(), chunk_size, overlap,
+                             section_id, section_title)
@@ -0,0 +1,196 @@
+"""
+Token-accurate chunking with sentence boundaries
+
+The old chunker guessed 4 characters per token, so chunks of "300 tokens"
+were often longer than the embedding model's window (384 tokens for
+all-mpnet-base-v2) and their tail was silently truncated when embedded.
+
+iter_token_chunks() instead:
+
+- groups the incoming words into sentences (a sentence ends at . ! ? or
+  after MAX_SENTENCE_WORDS words)
+- counts the real tokens of SENTENCE_BATCH sentences at a time with the
+  embedding model's tokenizer (one batched tokenizer call)
+- packs whole sentences into a sliding window of at most chunk_tokens
+  tokens; when a chunk is emitted, sentences are dropped from the front
+  until at most overlap_tokens remain. Each sentence enters and leaves the
+  window once, so the work is linear in the length of the text.
+- splits a sentence that is longer than a chunk at word boundaries
+
+Chunks are yielded as soon as they are complete; only one batch of
+sentences and the window are held in memory. With a WordPiece tokenizer
+(as all-mpnet-base-v2 uses) token counts add up across whitespace, so the
+count of each chunk is exact. benchmarks/bench_chunking.py reports the
+truncation rate of both chunkers.
+"""
+import re
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+MAX_SENTENCE_WORDS = 128
+SENTENCE_BATCH = 256
+
+_SENTENCE_END_RE = re.compile(r'[.!?]["\')\]]*$')
+
+
+class TokenCounter:
+    """Counts tokens with a HuggingFace tokenizer, many texts per call"""
+
+    def __init__(self, tokenizer, max_tokens: int):
+        """
+        tokenizer: HuggingFace tokenizer of the embedding model
+        max_tokens: tokens the model embeds per text, excluding special tokens
+        """
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.exact = True
+
+    def count(self, texts: Sequence[str]) -> List[int]:
+        if not texts:
+            return []
+        encoded = self.tokenizer(list(texts), add_special_tokens=False, truncation=False,
+                                 return_attention_mask=False, return_token_type_ids=False)
+        return [len(ids) for ids in encoded['input_ids']]
+
+
+class ApproxTokenCounter:
+    """1 token ≈ 4 characters, for embeddings without a known tokenizer"""
+
+    def __init__(self, max_tokens: Optional[int] = None):
+        self.max_tokens = max_tokens
+        self.exact = False
+
+    def count(self, texts: Sequence[str]) -> List[int]:
+        return [(len(text) + 3) // 4 for text in texts]
+
+
+class DeferredTokenCounter:
+    """Token counter of embeddings whose model loads on first use; loads it when first counting"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self._counter = None
+
+    def _resolve(self):
+        if self._counter is None:
+            self.embeddings.load()
+            self._counter = token_counter_for(self.embeddings)
+        return self._counter
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        return self._resolve().max_tokens
+
+    @property
+    def exact(self) -> bool:
+        return self._resolve().exact
+
+    def count(self, texts: Sequence[str]) -> List[int]:
+        return self._resolve().count(texts)
+
+
+def token_counter_for(embeddings):
+    """
+    Token counter matching a LangChain embeddings object: the tokenizer of an
+    EmbeddingEngine (model) or HuggingFaceEmbeddings (client), else the
+    4-characters-per-token estimate. The model of a lazy EmbeddingEngine is
+    not loaded until the counter is first used.
+    """
+    if not getattr(embeddings, 'loaded', True):
+        return DeferredTokenCounter(embeddings)
+    model = getattr(embeddings, 'model', None) or getattr(embeddings, 'client', None)
+    tokenizer = getattr(model, 'tokenizer', None)
+    max_seq_length = getattr(model, 'max_seq_length', None)
+    if tokenizer is None or not max_seq_length:
+        return ApproxTokenCounter()
+    # [CLS] and [SEP] take two positions of the window
+    return TokenCounter(tokenizer, max_seq_length - tokenizer.num_special_tokens_to_add())
+
+
+def iter_sentences(words: Iterable[str]) -> Iterator[str]:
+    """Sentences of a stream of words (each at most MAX_SENTENCE_WORDS words)"""
+    sentence = []
+    for word in words:
+        sentence.append(word)
+        if len(sentence) >= MAX_SENTENCE_WORDS or _SENTENCE_END_RE.search(word):
+            yield ' '.join(sentence)
+            sentence = []
+    if sentence:
+        yield ' '.join(sentence)
+
+
+def counted_sentences(words: Iterable[str], counter, limit: int) -> Iterator[Tuple[str, int]]:
+    """(sentence, tokens), counted in batches; sentences over limit are split at words"""
+    sentences = iter_sentences(words)
+    while True:
+        batch = list(islice(sentences, SENTENCE_BATCH))
+        if not batch:
+            return
+        for sentence, tokens in zip(batch, counter.count(batch)):
+            if tokens <= limit:
+                yield sentence, tokens
+            else:
+                yield from _split_sentence(sentence, counter, limit)
+
+
+def _split_sentence(sentence: str, counter, limit: int) -> Iterator[Tuple[str, int]]:
+    """Pieces of an over-long sentence, each as many whole words as fit in limit"""
+    words = sentence.split(' ')
+    piece, piece_tokens = [], 0
+    for word, tokens in zip(words, counter.count(words)):
+        if piece and piece_tokens + tokens > limit:
+            yield ' '.join(piece), piece_tokens
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += tokens
+    if piece:
+        yield ' '.join(piece), piece_tokens
+
+
+def iter_token_chunks(words: Iterable[str], counter, chunk_tokens: int = 300, overlap_tokens: int = 30,
+                      section_id: str = None, section_title: str = None) -> Iterator[Dict[str, any]]:
+    """
+    Chunk a stream of words into chunks of at most chunk_tokens tokens
+    (capped at the counter's max_tokens), ending on sentence boundaries and
+    overlapping by up to overlap_tokens tokens of whole sentences
+    """
+    if counter.max_tokens:
+        chunk_tokens = min(chunk_tokens, counter.max_tokens)
+    overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+
+    window = deque()  # (sentence, tokens)
+    window_tokens = 0
+    new_sentences = 0  # sentences added since the last chunk was emitted
+    chunk_id = 0
+
+    for sentence, tokens in counted_sentences(words, counter, chunk_tokens):
+        if window and window_tokens + tokens > chunk_tokens:
+            if new_sentences:
+                yield make_chunk(chunk_id, ' '.join(s for s, _ in window), window_tokens,
+                                 section_id, section_title)
+                chunk_id += 1
+                new_sentences = 0
+            # Keep the overlap, as far as the next sentence still fits
+            while window and (window_tokens > overlap_tokens or window_tokens + tokens > chunk_tokens):
+                window_tokens -= window.popleft()[1]
+
+        window.append((sentence, tokens))
+        window_tokens += tokens
+        new_sentences += 1
+
+    if new_sentences:
+        yield make_chunk(chunk_id, ' '.join(s for s, _ in window), window_tokens, section_id, section_title)
+
+
+def make_chunk(chunk_id: int, text: str, tokens: Optional[int], section_id: str,
+               section_title: str) -> Dict[str, any]:
+    metadata = {
+        'chunk_id': chunk_id,
+        'char_count': len(text),
+        'section_id': section_id,
+        'section_title': section_title
+    }
+    if tokens is not None:
+        metadata['token_count'] = tokens
+    return {'chunk_id': chunk_id, 'text': text, 'metadata': metadata}
@@ -2,25 +2,28 @@ import { useState, useEffect } from 'react';
 import FileUpload from './components/FileUpload';
 import ContentGenerator from './components/ContentGenerator';
 import QuestionAnswer from './components/QuestionAnswer';
-import { getStatus } from './api';
+import { getStatus, listDocuments } from './api';
 import './App.css';
 
 function App() {
   const [textbookData, setTextbookData] = useState(null);
+  const [documents, setDocuments] = useState([]);
   const [activeTab, setActiveTab] = useState('upload');
 
   useEffect(() => {
     checkStatus();
   }, []);
 
-  const checkStatus = async () => {
+  const checkStatus = async (docId) => {
     try {
-      const status = await getStatus();
+      const status = await getStatus(docId);
       if (status.ready) {
         setTextbookData({
+          docId: status.doc_id,
           name: status.textbook_name,
           sections: status.sections || []
         });
+        setDocuments(status.documents || []);
         setActiveTab('generate');
       }
     } catch (err) {
@@ -28,12 +31,18 @@ function App() {
     }
   };
 
-  const handleUploadSuccess = (data) => {
+  const handleUploadSuccess = async (data) => {
     setTextbookData({
+      docId: data.doc_id,
       name: data.textbook_name,
       sections: data.sections || []
     });
     setActiveTab('generate');
+    try {
+      setDocuments(await listDocuments());
+    } catch (err) {
+      console.log('Could not refresh textbook list');
+    }
   };
 
   return (
@@ -75,7 +84,15 @@ function App() {
           {textbookData && (
             <div className="textbook-badge">
               <svg viewBox="0 0 24 24" fill="none" stroke="currentColor"><path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M9 12h6m-6 4h6m2 5H7a2 2 0 01-2-2V5a2 2 0 012-2h5.586a1 1 0 01.707.293l5.414 5.414a1 1 0 01.293.707V19a2 2 0 01-2 2z" /></svg>
-              <span>{textbookData.name}</span>
+              {documents.length > 1 ? (
+                <select value={textbookData.docId} onChange={(e) => checkStatus(e.target.value)}>
+                  {documents.map(doc => (
+                    <option key={doc.doc_id} value={doc.doc_id}>{doc.textbook_name}</option>
+                  ))}
+                </select>
+              ) : (
+                <span>{textbookData.name}</span>
+              )}
             </div>
           )}
         </div>
@@ -86,9 +103,9 @@ function App() {
           {!textbookData || activeTab === 'upload' ? (
             <FileUpload onUploadSuccess={handleUploadSuccess} />
           ) : activeTab === 'generate' ? (
-            <ContentGenerator textbookData={textbookData} />
+            <ContentGenerator key={textbookData.docId} textbookData={textbookData} />
           ) : (
-            <QuestionAnswer />
+            <QuestionAnswer key={textbookData.docId} docId={textbookData.docId} />
           )}
         </div>
       </main>
@@ -5,11 +5,12 @@
 const API_BASE_URL = 'http://localhost:8000';
 
 /**
- * Upload textbook file
+ * Upload textbook file and wait for background processing to finish
  * @param {File} file - The file to upload (PDF/PPT/DOCX)
- * @returns {Promise<Object>} Upload response
+ * @param {Function} [onProgress] - Called with each job snapshot while processing
+ * @returns {Promise<Object>} Upload response (textbook_name, total_chunks, sections)
  */
-export async function uploadTextbook(file) {
+export async function uploadTextbook(file, onProgress) {
   const formData = new FormData();
   formData.append('file', file);
 
@@ -24,7 +25,8 @@ export async function uploadTextbook(file) {
       throw new Error(error.detail || 'Upload failed');
     }
 
-    return await response.json();
+    const job = await response.json();
+    return await waitForJob(job.job_id, onProgress);
   } catch (error) {
     console.error('Upload error:', error);
     throw error;
@@ -32,12 +34,49 @@ export async function uploadTextbook(file) {
 }
 
 /**
- * Get system status
+ * Get ingestion job progress
+ * @param {string} jobId - Job ID returned by /upload
+ * @returns {Promise<Object>} Job status (stage, percent, stage_timings, result)
+ */
+export async function getJob(jobId) {
+  const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Failed to get job status');
+  }
+
+  return await response.json();
+}
+
+/**
+ * Poll an ingestion job until it completes or fails
+ * @param {string} jobId - Job ID returned by /upload
+ * @param {Function} [onProgress] - Called with each job snapshot
+ * @param {number} [intervalMs] - Polling interval
+ * @returns {Promise<Object>} The job result once completed
+ */
+export async function waitForJob(jobId, onProgress, intervalMs = 1000) {
+  for (;;) {
+    const job = await getJob(jobId);
+    if (onProgress) onProgress(job);
+
+    if (job.status === 'completed') return job.result;
+    if (job.status === 'failed') throw new Error(job.error || 'Processing failed');
+
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
+}
+
+/**
+ * Get system status for a textbook
+ * @param {string} [docId] - Textbook id (defaults to the most recent upload)
  * @returns {Promise<Object>} Status response
  */
-export async function getStatus() {
+export async function getStatus(docId) {
   try {
-    const response = await fetch(`${API_BASE_URL}/status`);
+    const query = docId ? `?doc_id=${encodeURIComponent(docId)}` : '';
+    const response = await fetch(`${API_BASE_URL}/status${query}`);
 
     if (!response.ok) {
       throw new Error('Failed to get status');
@@ -50,20 +89,40 @@ export async function getStatus() {
   }
 }
 
+/**
+ * List every textbook in the library
+ * @returns {Promise<Array>} Documents (doc_id, textbook_name, total_chunks, section_count)
+ */
+export async function listDocuments() {
+  try {
+    const response = await fetch(`${API_BASE_URL}/documents`);
+
+    if (!response.ok) {
+      throw new Error('Failed to list textbooks');
+    }
+
+    return await response.json();
+  } catch (error) {
+    console.error('Documents error:', error);
+    throw error;
+  }
+}
+
 /**
  * Generate section outputs
  * @param {string} sectionId - Section ID
  * @param {string} option - 'summary', 'conceptmap', 'tricks', or 'all'
+ * @param {string} [docId] - Textbook id (defaults to the most recent upload)
  * @returns {Promise<Object>} Generated content
  */
-export async function generateChapter(sectionId, option) {
+export async function generateChapter(sectionId, option, docId) {
   try {
     const response = await fetch(`${API_BASE_URL}/generate`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ section_id: sectionId, option }),
+      body: JSON.stringify({ section_id: sectionId, option, doc_id: docId }),
     });
 
     if (!response.ok) {
@@ -81,16 +140,17 @@ export async function generateChapter(sectionId, option) {
 /**
  * Ask a free-form question
  * @param {string} question - The question to ask
+ * @param {string} [docId] - Textbook id (defaults to the most recent upload)
  * @returns {Promise<Object>} Answer response
  */
-export async function askQuestion(question) {
+export async function askQuestion(question, docId) {
   try {
     const response = await fetch(`${API_BASE_URL}/ask`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ question }),
+      body: JSON.stringify({ question, doc_id: docId }),
     });
 
     if (!response.ok) {
@@ -104,3 +164,111 @@ export async function askQuestion(question) {
     throw error;
   }
 }
+
+/**
+ * Read a Server-Sent Events response body and dispatch each event
+ * @param {Response} response - Fetch response with a text/event-stream body
+ * @param {Function} onEvent - Called with (eventName, data) for every event
+ */
+async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      const dataLines = [];
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+      }
+      if (dataLines.length > 0) onEvent(event, JSON.parse(dataLines.join('\n')));
+    }
+  }
+}
+
+/**
+ * POST a JSON body to a streaming endpoint and resolve with the 'done' payload
+ * @param {string} path - Endpoint path
+ * @param {Object} body - Request body
+ * @param {Object} handlers - Optional onQueued, onSources, onToken, onArtifact callbacks
+ * @param {AbortSignal} [signal] - Abort signal to cancel the stream
+ * @returns {Promise<Object>} Final response payload
+ */
+async function postEventStream(path, body, handlers = {}, signal) {
+  const response = await fetch(`${API_BASE_URL}${path}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream',
+    },
+    body: JSON.stringify(body),
+    signal,
+  });
+
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.detail || 'Request failed');
+  }
+
+  let result = null;
+  let streamError = null;
+  await readEventStream(response, (event, data) => {
+    if (event === 'queued' && handlers.onQueued) handlers.onQueued(data);
+    else if (event === 'sources' && handlers.onSources) handlers.onSources(data);
+    else if (event === 'token' && handlers.onToken) handlers.onToken(data.text, data.artifact);
+    else if (event === 'artifact' && handlers.onArtifact) handlers.onArtifact(data.artifact, data.value);
+    else if (event === 'done') result = data;
+    else if (event === 'error') streamError = new Error(data.detail || 'Stream failed');
+  });
+
+  if (streamError) throw streamError;
+  if (!result) throw new Error('Stream ended unexpectedly');
+  return result;
+}
+
+/**
+ * Ask a question and stream the answer token by token
+ * @param {string} question - The question to ask
+ * @param {Object} handlers - onSources({sources}), onToken(text), onQueued({queue_position})
+ * @param {AbortSignal} [signal] - Abort signal to cancel generation
+ * @param {string} [docId] - Textbook id (defaults to the most recent upload)
+ * @returns {Promise<Object>} Final answer response (same shape as askQuestion)
+ */
+export async function askQuestionStream(question, handlers, signal, docId) {
+  try {
+    return await postEventStream('/ask/stream', { question, doc_id: docId }, handlers, signal);
+  } catch (error) {
+    console.error('Question stream error:', error);
+    throw error;
+  }
+}
+
+/**
+ * Generate section outputs and stream tokens as they are produced
+ * @param {string} sectionId - Section ID
+ * @param {string} option - 'summary', 'conceptmap', 'tricks', or 'all'
+ * @param {Object} handlers - onSources({artifact, sources}), onToken(text, artifact),
+ *                            onArtifact(artifact, value), onQueued({queue_position})
+ * @param {AbortSignal} [signal] - Abort signal to cancel generation
+ * @param {string} [docId] - Textbook id (defaults to the most recent upload)
+ * @returns {Promise<Object>} Final generated content (same shape as generateChapter)
+ */
+export async function generateChapterStream(sectionId, option, handlers, signal, docId) {
+  try {
+    return await postEventStream('/generate/stream', { section_id: sectionId, option, doc_id: docId }, handlers, signal);
+  } catch (error) {
+    console.error('Generation stream error:', error);
+    throw error;
+  }
+}
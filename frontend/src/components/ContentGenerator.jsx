@@ -72,7 +72,7 @@ const ContentGenerator = ({ textbookData }) => {
         
         for (const type of selectedTypes) {
           const apiType = typeMapping[type];
-          const response = await generateChapter(sectionId, apiType);
+          const response = await generateChapter(sectionId, apiType, textbookData.docId);
           
           const responseKey = Object.keys(responseMapping).find(
             key => responseMapping[key] === type
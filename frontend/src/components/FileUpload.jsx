@@ -2,11 +2,19 @@ import { useState } from 'react';
 import { uploadTextbook } from '../api';
 import './FileUpload.css';
 
+const STAGE_LABELS = {
+  extract: 'extracting text',
+  sections: 'detecting sections',
+  embed: 'embedding',
+  persist: 'saving index',
+};
+
 const FileUpload = ({ onUploadSuccess }) => {
   const [file, setFile] = useState(null);
   const [isDragging, setIsDragging] = useState(false);
   const [uploading, setUploading] = useState(false);
   const [progress, setProgress] = useState(0);
+  const [stage, setStage] = useState('');
   const [error, setError] = useState('');
 
   const handleDragOver = (e) => {
@@ -57,23 +65,15 @@ const FileUpload = ({ onUploadSuccess }) => {
 
     setUploading(true);
     setProgress(0);
+    setStage('');
     setError('');
 
     try {
-      // Simulate progress
-      const progressInterval = setInterval(() => {
-        setProgress(prev => {
-          if (prev >= 90) {
-            clearInterval(progressInterval);
-            return 90;
-          }
-          return prev + 10;
-        });
-      }, 200);
-
-      const result = await uploadTextbook(file);
+      const result = await uploadTextbook(file, (job) => {
+        setProgress(Math.round(job.percent));
+        setStage(job.stage || '');
+      });
       
-      clearInterval(progressInterval);
       setProgress(100);
       
       setTimeout(() => {
@@ -177,7 +177,9 @@ const FileUpload = ({ onUploadSuccess }) => {
               <div className="progress-shine"></div>
             </div>
           </div>
-          <p className="progress-text">Processing your textbook... {progress}%</p>
+          <p className="progress-text">
+            Processing your textbook{stage ? ` (${STAGE_LABELS[stage] || stage})` : ''}... {progress}%
+          </p>
         </div>
       )}
 
@@ -1,8 +1,8 @@
 import { useState } from 'react';
-import { askQuestion } from '../api';
+import { askQuestionStream } from '../api';
 import './QuestionAnswer.css';
 
-const QuestionAnswer = () => {
+const QuestionAnswer = ({ docId }) => {
   const [question, setQuestion] = useState('');
   const [answer, setAnswer] = useState(null);
   const [loading, setLoading] = useState(false);
@@ -21,7 +21,11 @@ const QuestionAnswer = () => {
     setAnswer(null);
 
     try {
-      const response = await askQuestion(question);
+      // Show sources and tokens as soon as they arrive
+      const response = await askQuestionStream(question, {
+        onSources: ({ sources }) => setAnswer({ answer: '', sources }),
+        onToken: (text) => setAnswer(prev => ({ ...prev, answer: (prev?.answer || '') + text })),
+      }, undefined, docId);
       setAnswer(response);
     } catch (err) {
       setError(err.message || 'Failed to get answer. Please try again.');